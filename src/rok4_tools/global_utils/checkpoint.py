@@ -0,0 +1,185 @@
+"""Provide classes to save and restore an agent's progress in its todo list.
+
+The module contains the following classes:
+
+- `Checkpoint` - Progress in a todo list, periodically saved
+- `OrderedProgress` - Progress of groups of lines done in any order
+"""
+
+import json
+import logging
+import time
+
+from rok4 import storage
+
+from rok4_tools.global_utils import storage_tools
+
+
+class Checkpoint:
+    """Progress in a todo list, periodically saved to resume the work after a failure or a kill
+
+    Progress is the number of done lines, from the beginning of the todo list, and the byte offset
+    just after the last done line : a restarted agent seeks straight to this offset.
+
+    Attributes:
+        __path (str): Checkpoint file or object path
+        __offset (int): Byte offset in the todo list after the last done line
+        __lines (int): Number of done lines
+        __every_lines (int): Number of done lines between two saves
+        __every_seconds (int): Number of seconds between two saves
+        __saved_lines (int): Number of done lines at the last save
+        __saved_time (float): Time of the last save
+    """
+
+    def __init__(self, path: str, every_lines: int, every_seconds: int) -> None:
+        self.__path = path
+        self.__offset = 0
+        self.__lines = 0
+        self.__every_lines = every_lines
+        self.__every_seconds = every_seconds
+        self.__saved_lines = 0
+        self.__saved_time = time.time()
+
+    @property
+    def offset(self) -> int:
+        return self.__offset
+
+    @property
+    def lines(self) -> int:
+        return self.__lines
+
+    def load(self) -> bool:
+        """Load the saved progress, if exists
+
+        Raises:
+            StorageError: Storage read issue
+            MissingEnvironmentError: Missing object storage informations
+
+        Returns:
+            bool: True if a progress was saved
+        """
+
+        if not storage.exists(self.__path):
+            return False
+
+        # Lecture sans le cache de rok4 : la progression a pu être enregistrée depuis une lecture
+        # précédente
+        content = json.loads(storage_tools.get_data_binary(self.__path))
+        self.__offset = content["offset"]
+        self.__lines = content["lines"]
+        self.__saved_lines = self.__lines
+
+        logging.info(
+            f"The checkpoint exists, {self.__lines} lines have already been processed (offset {self.__offset})"
+        )
+
+        return True
+
+    def update(self, offset: int, lines: int) -> None:
+        """Update the progress, saved if enough lines are done or enough time passed since the last save
+
+        Args:
+            offset (int): Byte offset in the todo list after the last done line
+            lines (int): Number of done lines
+
+        Raises:
+            StorageError: Storage write issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+
+        self.__offset = offset
+        self.__lines = lines
+
+        if (
+            self.__lines - self.__saved_lines >= self.__every_lines
+            or time.time() - self.__saved_time >= self.__every_seconds
+        ):
+            self.save()
+
+    def save(self) -> None:
+        """Save the progress, if some lines are done
+
+        Raises:
+            StorageError: Storage write issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+
+        if self.__lines == 0:
+            return
+
+        storage.put_data_str(
+            json.dumps({"offset": self.__offset, "lines": self.__lines}), self.__path
+        )
+        self.__saved_lines = self.__lines
+        self.__saved_time = time.time()
+
+    def remove(self) -> None:
+        """Remove the saved progress, when the whole todo list is done
+
+        Raises:
+            StorageError: Storage removal issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+        storage.remove(self.__path)
+
+
+class OrderedProgress:
+    """Progress of groups of lines done in any order, by a pool of threads or processes
+
+    The checkpoint only moves forward over the done groups following the already counted ones : a
+    restarted agent processes again the done groups after a not done one, never skips a group.
+
+    Attributes:
+        __checkpoint (Checkpoint): Progress in the todo list
+        __ends (Dict[int, Tuple[int, int]]): Offset after each not counted group, and its number of lines
+        __finished (Set[int]): Done groups, not counted yet
+        __added (int): Number of added groups
+        __counted (int): Number of groups counted in the checkpoint
+    """
+
+    def __init__(self, checkpoint: Checkpoint) -> None:
+        self.__checkpoint = checkpoint
+        self.__ends = {}
+        self.__finished = set()
+        self.__added = 0
+        self.__counted = 0
+
+    def add(self, offset: int, lines: int) -> int:
+        """Add a group to do, after the previous ones in the todo list
+
+        Args:
+            offset (int): Byte offset in the todo list after the group
+            lines (int): Number of lines of the group
+
+        Returns:
+            int: group's index, to provide when it is done
+        """
+
+        index = self.__added
+        self.__ends[index] = (offset, lines)
+        self.__added += 1
+        return index
+
+    def done(self, index: int) -> None:
+        """Mark a group as done and move the checkpoint forward if possible
+
+        Args:
+            index (int): group's index, from add
+
+        Raises:
+            StorageError: Checkpoint write issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+
+        self.__finished.add(index)
+
+        offset = self.__checkpoint.offset
+        lines = self.__checkpoint.lines
+        while self.__counted in self.__finished:
+            self.__finished.remove(self.__counted)
+            offset, group_lines = self.__ends.pop(self.__counted)
+            lines += group_lines
+            self.__counted += 1
+
+        if lines != self.__checkpoint.lines:
+            self.__checkpoint.update(offset, lines)
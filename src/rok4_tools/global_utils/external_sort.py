@@ -0,0 +1,118 @@
+"""Provide a function to sort streams too big to fit in memory.
+
+Items are read and sorted by chunks of a limited number of items, each sorted chunk (run) is written
+in a local temporary file, then runs are merged. A merge reads at most MERGE_FAN_IN runs at once :
+beyond, runs are first merged by groups into bigger runs, in as many passes as needed. Only one chunk
+of items is in memory at once, plus one item per run during a merge.
+
+The module contains the following function:
+
+- `sort` - Sort items, using temporary files beyond a number of items
+"""
+
+import heapq
+import os
+import pickle
+import tempfile
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List
+
+# Nombre maximal de runs fusionnés à la fois, donc de fichiers temporaires ouverts simultanément
+MERGE_FAN_IN = 64
+
+
+def _write_run(items: List, key: Callable, directory: str) -> str:
+    items.sort(key=key)
+    with tempfile.NamedTemporaryFile(mode="wb", delete=False, dir=directory) as tmp:
+        for item in items:
+            pickle.dump(item, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+        return tmp.name
+
+
+def _read_run(run: BinaryIO) -> Iterator:
+    while True:
+        try:
+            yield pickle.load(run)
+        except EOFError:
+            return
+
+
+def _merge_runs(runs: List[str], key: Callable) -> Iterator:
+    run_objects = []
+    try:
+        for run in runs:
+            run_objects.append(open(run, "rb"))
+        # À clé égale, heapq.merge respecte l'ordre des runs, donc l'ordre de lecture
+        yield from heapq.merge(*[_read_run(run_object) for run_object in run_objects], key=key)
+    finally:
+        for run_object in run_objects:
+            run_object.close()
+
+
+def sort(
+    items: Iterable,
+    key: Callable[[Any], Any],
+    chunk_size: int,
+    directory: str = None,
+    fan_in: int = MERGE_FAN_IN,
+) -> Iterator:
+    """Sort items, using temporary files beyond a number of items
+
+    Sort is stable : items with the same key keep their reading order. Temporary files are removed when
+    the returned iterator is exhausted or closed.
+
+    Args:
+        items (Iterable): items to sort, they have to be picklable
+        key (Callable[[Any], Any]): function giving the sort key of an item
+        chunk_size (int): maximum number of items (not bytes) sorted in memory at once
+        directory (str, optional): local directory for temporary files. Defaults to None (system's temporary directory).
+        fan_in (int, optional): maximum number of runs merged at once, at least 2. Defaults to MERGE_FAN_IN.
+
+    Yields:
+        Iterator: sorted items
+    """
+
+    runs = []
+    chunk = []
+    try:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                runs.append(_write_run(chunk, key, directory))
+                chunk = []
+
+        if not runs:
+            # Tout tient en mémoire, pas besoin de fichiers temporaires
+            chunk.sort(key=key)
+            yield from chunk
+            return
+
+        if chunk:
+            runs.append(_write_run(chunk, key, directory))
+            chunk = []
+
+        # Fusions intermédiaires de runs consécutifs, pour conserver la stabilité du tri, jusqu'à
+        # pouvoir tout fusionner en une fois
+        while len(runs) > fan_in:
+            pass_runs = list(runs)
+            merged_runs = []
+            for i in range(0, len(pass_runs), fan_in):
+                group = pass_runs[i : i + fan_in]
+                if len(group) == 1:
+                    merged_runs.append(group[0])
+                    continue
+                with tempfile.NamedTemporaryFile(mode="wb", delete=False, dir=directory) as tmp:
+                    # Liste des runs toujours à jour, pour la suppression en cas d'erreur
+                    runs.append(tmp.name)
+                    merged_runs.append(tmp.name)
+                    for item in _merge_runs(group, key):
+                        pickle.dump(item, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+                for run in group:
+                    os.remove(run)
+                    runs.remove(run)
+            runs = merged_runs
+
+        yield from _merge_runs(runs, key)
+
+    finally:
+        for run in runs:
+            os.remove(run)
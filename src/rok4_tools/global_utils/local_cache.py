@@ -0,0 +1,255 @@
+"""Provide functions to read files or objects entirely through a local cache, like pyramids' lists.
+
+The cache is opt-in and configured with environment variables :
+
+- ROK4_TOOLS_CACHE_DIRECTORY - Local directory of the cached copies. No cache if not defined
+- ROK4_TOOLS_CACHE_SIZE - Cached copies' total size limit, in megabytes. Default 10240
+
+A cached copy is keyed by the file or object's path and used only if the file or object did not change
+since (see storage_tools.get_version). Beyond the size limit, the least recently used copies are
+removed. Readers get a hard link to the cached copy, which stays readable if the copy is removed
+meanwhile. Without cache, the file or object is copied to a local temporary file, as before.
+
+The module contains the following functions:
+
+- `is_enabled` - Is the local cache configured ?
+- `get_local` - Get a local copy of a file or an object, to remove after use
+- `list_generator` - Get a pyramid's list content, through the local cache
+- `load_list` - Read a pyramid's list once, to count its slabs
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+from typing import Dict, Iterator, Tuple
+
+from rok4 import storage
+from rok4.enums import SlabType
+from rok4.pyramid import Pyramid
+
+from rok4_tools.global_utils import storage_tools, todo_list
+
+CACHE_DIRECTORY_ENV = "ROK4_TOOLS_CACHE_DIRECTORY"
+CACHE_SIZE_ENV = "ROK4_TOOLS_CACHE_SIZE"
+DEFAULT_CACHE_SIZE = 10240
+
+
+def is_enabled() -> bool:
+    """Is the local cache configured ?
+
+    Returns:
+        bool: True if ROK4_TOOLS_CACHE_DIRECTORY is defined
+    """
+    return os.environ.get(CACHE_DIRECTORY_ENV, "") != ""
+
+
+def _evict(directory: str, limit: int, keep: str, keep_size: int) -> None:
+    # Copies de la moins récemment utilisée à la plus récente
+    copies = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".data") and entry.path != keep:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Supprimée par un autre processus partageant le cache
+                continue
+            copies.append((stat.st_mtime, stat.st_size, entry.path))
+    copies.sort()
+
+    total = sum(size for mtime, size, path in copies) + keep_size
+    for mtime, size, path in copies:
+        if total <= limit:
+            break
+
+        for cached in [path, f"{path[:-5]}.version"]:
+            try:
+                os.remove(cached)
+            except FileNotFoundError:
+                # Supprimée par un autre processus partageant le cache
+                pass
+        total -= size
+        logging.debug(f"Cached copy {path} evicted")
+
+
+def _hold(data_path: str, directory: str) -> str:
+    # Lien physique propre au lecteur : la copie reste lisible même si elle est évincée entretemps
+    held_path = os.path.join(directory, f"{uuid.uuid4().hex}.tmp")
+    os.link(data_path, held_path)
+    return held_path
+
+
+def get_local(path: str) -> str:
+    """Get a local copy of a file or an object : a hard link to the cached copy if enabled, a temporary
+    file otherwise. In both cases, the local copy is owned by the caller, who has to remove it after use
+
+    Args:
+        path (str): file or object path
+
+    Raises:
+        FileNotFoundError: File or object does not exist
+        StorageError: Storage read or copy issue
+        MissingEnvironmentError: Missing object storage informations
+
+    Returns:
+        str: local copy's path
+    """
+
+    if not is_enabled():
+        with tempfile.NamedTemporaryFile(mode="r", delete=False) as tmp:
+            local = tmp.name
+        storage.copy(path, f"file://{local}")
+        return local
+
+    directory = os.environ[CACHE_DIRECTORY_ENV]
+    os.makedirs(directory, exist_ok=True)
+
+    key = hashlib.sha256(path.encode()).hexdigest()
+    data_path = os.path.join(directory, f"{key}.data")
+    version_path = os.path.join(directory, f"{key}.version")
+
+    # Version lue avant la copie : si le contenu change entretemps, la copie sera refaite la prochaine fois
+    version = storage_tools.get_version(path)
+
+    try:
+        with open(version_path) as f:
+            if f.read() == version:
+                # Copie toujours valide, marquée comme récemment utilisée
+                held_path = _hold(data_path, directory)
+                os.utime(data_path)
+                logging.debug(f"Local cached copy of {path} is used")
+                return held_path
+    except FileNotFoundError:
+        # Pas de copie, ou copie évincée par un autre processus : elle est refaite
+        pass
+
+    # Écritures dans des fichiers temporaires renommés, pour ne jamais exposer une copie incomplète
+    with tempfile.NamedTemporaryFile(mode="w", delete=False, dir=directory, suffix=".tmp") as tmp:
+        tmp_path = tmp.name
+    held_path = None
+    try:
+        storage.copy(path, f"file://{tmp_path}")
+        held_path = _hold(tmp_path, directory)
+        os.replace(tmp_path, data_path)
+
+        with tempfile.NamedTemporaryFile(
+            mode="w", delete=False, dir=directory, suffix=".tmp"
+        ) as tmp:
+            tmp.write(version)
+            tmp_path = tmp.name
+        os.replace(tmp_path, version_path)
+
+    except Exception:
+        for tmp in [tmp_path, held_path]:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+
+    limit = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE)) * 1024 * 1024
+    _evict(directory, limit, data_path, os.path.getsize(held_path))
+
+    return held_path
+
+
+def list_generator(
+    pyramid: Pyramid, level_id: str = None
+) -> Iterator[Tuple[Tuple[SlabType, str, int, int], Dict]]:
+    """Get a pyramid's list content, like Pyramid.list_generator, reading the list through the local cache
+
+    The local copy is read directly, without another temporary copy. Without local cache,
+    Pyramid.list_generator is used.
+
+    Args:
+        pyramid (Pyramid): pyramid whose list is read
+        level_id (str, optional): level's identifier, to get only its slabs. Defaults to None (all levels).
+
+    Raises:
+        StorageError: Unhandled pyramid storage to copy list
+        MissingEnvironmentError: Missing object storage informations
+        Exception: Invalid list's root table
+
+    Yields:
+        Iterator[Tuple[Tuple[SlabType, str, int, int], Dict]]: slab's key (type, level, column, row) and informations (root, link, slab, md5)
+    """
+
+    if not is_enabled():
+        yield from pyramid.list_generator(level_id)
+        return
+
+    list_file = get_local(pyramid.list)
+    try:
+        with open(list_file) as listin:
+            try:
+                roots = todo_list.read_roots(listin)[0]
+            except Exception as e:
+                raise Exception(f"Invalid list {pyramid.list}: {e}")
+
+            s3_cluster = pyramid.storage_s3_cluster
+            if s3_cluster is not None:
+                # On a un nom de cluster S3, on l'ajoute au nom du bucket dans les racines
+                for root_id, root_path in roots.items():
+                    root_bucket, root_path = root_path.split("/", 1)
+                    roots[root_id] = f"{root_bucket}@{s3_cluster}/{root_path}"
+
+            # Lecture des dalles
+            for line in listin:
+                parts = line.rstrip().split(" ", 1)
+                slab_md5 = None
+                if len(parts) == 2:
+                    slab_md5 = parts[1]
+
+                root_id, slab_path = parts[0].split("/", 1)
+
+                slab_type, level, column, row = pyramid.get_infos_from_slab_path(slab_path)
+                if level_id is not None and level != level_id:
+                    continue
+
+                infos = {
+                    "root": roots[root_id],
+                    "link": root_id != "0",
+                    "slab": slab_path,
+                    "md5": slab_md5,
+                }
+                yield ((slab_type, level, column, row), infos)
+
+    finally:
+        os.remove(list_file)
+
+
+def load_list(pyramid: Pyramid) -> int:
+    """Read a pyramid's list once, to count its slabs
+
+    Without local cache, Pyramid.load_list is used : the list's content is then kept in memory and
+    read again by list_generator. With the local cache, only the slabs' lines are counted.
+
+    Args:
+        pyramid (Pyramid): pyramid whose list is read
+
+    Raises:
+        StorageError: Unhandled pyramid storage to copy list
+        MissingEnvironmentError: Missing object storage informations
+        Exception: Invalid list's root table
+
+    Returns:
+        int: number of slabs in the list
+    """
+
+    if not is_enabled():
+        return pyramid.load_list()
+
+    list_file = get_local(pyramid.list)
+
+    count = 0
+    try:
+        with open(list_file) as listin:
+            try:
+                todo_list.read_roots(listin)
+            except Exception as e:
+                raise Exception(f"Invalid list {pyramid.list}: {e}")
+            for line in listin:
+                count += 1
+    finally:
+        os.remove(list_file)
+
+    return count
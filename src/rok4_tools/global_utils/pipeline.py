@@ -0,0 +1,111 @@
+"""Provide a function to process items through successive stages running at the same time.
+
+Each stage runs in its own thread and passes its results to the next one through a bounded queue :
+input and output operations of a stage overlap with the computation of another, while the number of
+items in progress, and so the memory or disk space they use, stays bounded. Items keep their order.
+
+The module contains the following function:
+
+- `run` - Process items through stages, each stage in its own thread
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List
+
+# Délai entre deux vérifications de l'arrêt du pipeline, pour une étape bloquée sur une file
+POLL_INTERVAL = 0.5
+
+
+class _End:
+    """End of the items, or error raised by a stage"""
+
+    def __init__(self, error: Exception = None) -> None:
+        self.error = error
+
+
+def run(items: Iterable, stages: List[Callable[[Any], Any]], size: int) -> Iterator:
+    """Process items through stages, each stage in its own thread
+
+    The first stage reads the items, the last stage's results are returned by the iterator. At most
+    size results wait between two stages. An error raised by a stage (or while reading items) stops
+    the pipeline and is raised by the iterator. Closing the iterator stops the stages.
+
+    Args:
+        items (Iterable): items to process
+        stages (List[Callable[[Any], Any]]): functions applied to the items, in this order
+        size (int): maximum number of results waiting between two stages
+
+    Yields:
+        Iterator: last stage's results, in the items' order
+    """
+
+    stopped = threading.Event()
+    queues = [queue.Queue(maxsize=size) for stage in stages]
+
+    def put(output: queue.Queue, item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                output.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(upstream: queue.Queue) -> Any:
+        while not stopped.is_set():
+            try:
+                return upstream.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _End()
+
+    def read(stage: Callable[[Any], Any], output: queue.Queue) -> None:
+        try:
+            for item in items:
+                if not put(output, stage(item)):
+                    return
+        except Exception as e:
+            put(output, _End(e))
+            return
+        put(output, _End())
+
+    def process(stage: Callable[[Any], Any], upstream: queue.Queue, output: queue.Queue) -> None:
+        while True:
+            item = get(upstream)
+            if isinstance(item, _End):
+                # Fin des éléments ou erreur en amont, transmise telle quelle
+                put(output, item)
+                return
+            try:
+                result = stage(item)
+            except Exception as e:
+                put(output, _End(e))
+                return
+            if not put(output, result):
+                return
+
+    threads = [threading.Thread(target=read, args=(stages[0], queues[0]), daemon=True)]
+    for i in range(1, len(stages)):
+        threads.append(
+            threading.Thread(
+                target=process, args=(stages[i], queues[i - 1], queues[i]), daemon=True
+            )
+        )
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = queues[-1].get()
+            if isinstance(item, _End):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
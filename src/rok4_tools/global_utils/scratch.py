@@ -0,0 +1,107 @@
+"""Provide a class to manage local temporary files of an agent.
+
+Temporary files are created in a configurable directory (a tmpfs for example, to keep intermediate
+images in memory). Each created file is tracked until it is removed : remaining files, after an
+error for example, are all removed at the end of the work. Before creating a file, the agent can wait
+for enough free space on the scratch volume, other agents sharing it freeing their own files.
+
+The module contains the following class:
+
+- `Scratch` - Tracked temporary files, in a directory with a free space guard
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Set
+
+# Délai entre deux vérifications de l'espace libre, quand il manque
+POLL_INTERVAL = 1
+
+
+class Scratch:
+    """Tracked temporary files, in a directory with a free space guard
+
+    Attributes:
+        __directory (str): Directory for temporary files, system's temporary directory if None
+        __min_free (int): Free space, in bytes, to keep on the scratch volume. 0 for no guard
+        __files (Set[str]): Created and not yet removed files
+        __lock (threading.Lock): Files' set protection, files are created and removed by several threads
+    """
+
+    def __init__(self, directory: str = None, min_free: int = 0) -> None:
+        self.__directory = directory
+        self.__min_free = min_free
+        self.__files = set()
+        self.__lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        if self.__directory is None:
+            return tempfile.gettempdir()
+        return self.__directory
+
+    @property
+    def files(self) -> Set[str]:
+        with self.__lock:
+            return set(self.__files)
+
+    def wait_space(self) -> None:
+        """Wait until the scratch volume has the required free space"""
+
+        if self.__min_free == 0:
+            return
+
+        waiting = False
+        while shutil.disk_usage(self.directory).free < self.__min_free:
+            if not waiting:
+                logging.warning(f"Not enough free space in {self.directory}, wait")
+                waiting = True
+            time.sleep(POLL_INTERVAL)
+
+        if waiting:
+            logging.info(f"Enough free space in {self.directory}, resume")
+
+    def create(self, suffix: str = "") -> str:
+        """Create an empty temporary file, once there is enough free space
+
+        Args:
+            suffix (str, optional): file name's suffix. Defaults to "".
+
+        Returns:
+            str: path of the created file
+        """
+
+        self.wait_space()
+
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.__directory)
+        os.close(fd)
+
+        with self.__lock:
+            self.__files.add(path)
+
+        return path
+
+    def remove(self, *paths: str) -> None:
+        """Remove temporary files, if they exist
+
+        Args:
+            paths (str): paths of the files to remove
+        """
+
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            with self.__lock:
+                self.__files.discard(path)
+
+    def clean(self) -> None:
+        """Remove all the remaining temporary files"""
+
+        self.remove(*self.files)
@@ -0,0 +1,420 @@
+"""Provide a class and functions to read and write ROK4 slabs, and to decode and encode their tiles.
+
+A ROK4 slab is a tiled TIFF file or object : a fixed size header (2048 bytes), the tiles' offsets
+then the tiles' sizes (4 bytes each), then the tiles' encoded data, in row-major order. Tiles are
+decoded to and encoded from numpy arrays (rows, columns, channels), without external tools, for the
+lossless formats listed in HANDLED_FORMATS.
+
+The module contains the following class and functions:
+
+- `Slab` - Slab's header and tiles' encoded data
+- `is_handled` - Can tiles of a format be decoded and encoded ?
+- `decode_tile` - Decode a tile to a numpy array
+- `encode_tile` - Encode a numpy array to a tile
+- `is_full_mask` - Are all pixels of a mask slab data ?
+"""
+
+import io
+import math
+import struct
+import zlib
+from typing import Dict, List, Set, Union
+
+import numpy
+from PIL import Image
+from rok4.exceptions import FormatError
+from rok4.pyramid import ROK4_IMAGE_HEADER_SIZE
+
+from rok4_tools.global_utils import storage_tools
+
+HANDLED_FORMATS = [
+    "TIFF_RAW_UINT8",
+    "TIFF_ZIP_UINT8",
+    "TIFF_PNG_UINT8",
+    "TIFF_RAW_FLOAT32",
+    "TIFF_ZIP_FLOAT32",
+]
+
+# Format des dalles de masque
+MASK_FORMAT = "TIFF_ZIP_UINT8"
+
+# Taille de la première lecture d'une dalle dont on veut l'index : en-tête, index et premières tuiles
+HEAD_SIZE = 65536
+
+# Tags TIFF utiles à la lecture de la structure de la dalle
+TIFFTAG_IMAGEWIDTH = 256
+TIFFTAG_IMAGELENGTH = 257
+TIFFTAG_TILEWIDTH = 322
+TIFFTAG_TILELENGTH = 323
+TIFFTAG_TILEOFFSETS = 324
+TIFFTAG_TILEBYTECOUNTS = 325
+
+TIFF_SHORT = 3
+TIFF_LONG = 4
+
+
+def _read_tags(header: bytes) -> Dict[int, int]:
+    """Read the TIFF header's single value or offset tags
+
+    Args:
+        header (bytes): slab's header
+
+    Raises:
+        FormatError: Not a TIFF header
+
+    Returns:
+        Dict[int, int]: tags' value (or offset for multiple values' tags)
+    """
+
+    if header[0:4] == b"II*\x00":
+        byte_order = "<"
+    elif header[0:4] == b"MM\x00*":
+        byte_order = ">"
+    else:
+        raise FormatError("TIFF", "slab header", "invalid TIFF signature")
+
+    ifd_offset = struct.unpack(f"{byte_order}I", header[4:8])[0]
+    entries = struct.unpack(f"{byte_order}H", header[ifd_offset : ifd_offset + 2])[0]
+
+    tags = {}
+    for i in range(entries):
+        entry = ifd_offset + 2 + 12 * i
+        tag, tag_type, count = struct.unpack(f"{byte_order}HHI", header[entry : entry + 8])
+        if tag_type == TIFF_SHORT and count == 1:
+            tags[tag] = struct.unpack(f"{byte_order}H", header[entry + 8 : entry + 10])[0]
+        else:
+            tags[tag] = struct.unpack(f"{byte_order}I", header[entry + 8 : entry + 12])[0]
+
+    return tags
+
+
+class Slab:
+    """ROK4 slab's header and tiles' encoded data
+
+    A slab can be read with only its header and tiles' index : tiles' sizes are known, tiles' data is
+    then loaded on demand, with one partial read for all the needed tiles.
+
+    Attributes:
+        __header (bytes): TIFF header (ROK4_IMAGE_HEADER_SIZE bytes)
+        __byte_order (str): Byte order of the header, for struct and numpy (< or >)
+        __width (int): Slab's width, in pixels
+        __height (int): Slab's height, in pixels
+        __tile_width (int): Tile's width, in pixels
+        __tile_height (int): Tile's height, in pixels
+        __path (str): Read slab's path (symbolic links resolved), None for a slab to write
+        __offsets (List[int]): Tiles' offsets in the read slab
+        __sizes (List[int]): Tiles' sizes
+        __tiles (List[bytes]): Tiles' encoded data, empty if no tile, None if not loaded yet
+    """
+
+    def __init__(self, header: bytes, tiles: List[bytes] = None) -> None:
+        """Constructor method, from the header of an existing slab with the same structure
+
+        Args:
+            header (bytes): TIFF header, at least ROK4_IMAGE_HEADER_SIZE bytes
+            tiles (List[bytes], optional): tiles' encoded data. Defaults to None (no tile yet).
+
+        Raises:
+            FormatError: Header is not a ROK4 slab's header
+        """
+
+        self.__header = header[0:ROK4_IMAGE_HEADER_SIZE]
+        self.__byte_order = "<" if self.__header[0:2] == b"II" else ">"
+
+        tags = _read_tags(self.__header)
+        try:
+            self.__width = tags[TIFFTAG_IMAGEWIDTH]
+            self.__height = tags[TIFFTAG_IMAGELENGTH]
+            self.__tile_width = tags[TIFFTAG_TILEWIDTH]
+            self.__tile_height = tags[TIFFTAG_TILELENGTH]
+        except KeyError as e:
+            raise FormatError("ROK4 slab", "slab header", f"missing TIFF tag {e}")
+
+        if (
+            tags.get(TIFFTAG_TILEOFFSETS) != ROK4_IMAGE_HEADER_SIZE
+            or tags.get(TIFFTAG_TILEBYTECOUNTS) != ROK4_IMAGE_HEADER_SIZE + 4 * self.tiles_count
+        ):
+            raise FormatError("ROK4 slab", "slab header", "unexpected tiles' index location")
+
+        self.__path = None
+        self.__offsets = None
+        self.__tiles = tiles if tiles is not None else []
+        self.__sizes = [len(tile) for tile in self.__tiles]
+
+    @classmethod
+    def from_path(cls, path: str, index_only: bool = False) -> "Slab":
+        """Read a slab, entirely or only its header and tiles' index
+
+        Args:
+            path (str): slab's file or object path
+            index_only (bool, optional): read only the header and the tiles' index, tiles are loaded with load_tiles. Defaults to False.
+
+        Raises:
+            FileNotFoundError: Slab does not exist
+            StorageError: Storage read issue
+            MissingEnvironmentError: Missing object storage informations
+            FormatError: Not a ROK4 slab
+
+        Returns:
+            Slab: the read slab
+        """
+
+        if index_only:
+            data = storage_tools.get_data_binary(path, (0, HEAD_SIZE), follow_links=False)
+            target = storage_tools.get_link_target(path, data)
+            if target is not None:
+                # Les lectures partielles suivantes doivent se faire sur la cible
+                return cls.from_path(target, index_only)
+        else:
+            data = storage_tools.get_data_binary(path)
+
+        slab = cls(data)
+        slab.__path = path
+
+        count = slab.tiles_count
+        index_end = ROK4_IMAGE_HEADER_SIZE + 8 * count
+        if len(data) < index_end and len(data) == HEAD_SIZE:
+            data += storage_tools.get_data_binary(path, (len(data), index_end - len(data)))
+
+        slab.__offsets = numpy.frombuffer(
+            data, dtype=f"{slab.__byte_order}u4", count=count, offset=ROK4_IMAGE_HEADER_SIZE
+        ).tolist()
+        slab.__sizes = numpy.frombuffer(
+            data,
+            dtype=f"{slab.__byte_order}u4",
+            count=count,
+            offset=ROK4_IMAGE_HEADER_SIZE + 4 * count,
+        ).tolist()
+
+        # Tuiles vides ou déjà lues avec l'en-tête
+        slab.__tiles = []
+        for offset, size in zip(slab.__offsets, slab.__sizes):
+            if size == 0:
+                slab.__tiles.append(b"")
+            elif offset + size <= len(data):
+                slab.__tiles.append(bytes(data[offset : offset + size]))
+            else:
+                slab.__tiles.append(None)
+
+        return slab
+
+    @property
+    def header(self) -> bytes:
+        return self.__header
+
+    @property
+    def tile_width(self) -> int:
+        return self.__tile_width
+
+    @property
+    def tile_height(self) -> int:
+        return self.__tile_height
+
+    @property
+    def tiles_count(self) -> int:
+        return math.ceil(self.__width / self.__tile_width) * math.ceil(
+            self.__height / self.__tile_height
+        )
+
+    @property
+    def sizes(self) -> List[int]:
+        return self.__sizes
+
+    @property
+    def tiles(self) -> List[Union[bytes, None]]:
+        return self.__tiles
+
+    def load_tiles(self, indices: List[int]) -> None:
+        """Load tiles not read yet, with one partial read covering all of them
+
+        Args:
+            indices (List[int]): tiles' indices, in row-major order
+
+        Raises:
+            StorageError: Storage read issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+
+        indices = [i for i in indices if self.__tiles[i] is None]
+        if not indices:
+            return
+
+        start = min(self.__offsets[i] for i in indices)
+        end = max(self.__offsets[i] + self.__sizes[i] for i in indices)
+        data = storage_tools.get_data_binary(self.__path, (start, end - start))
+
+        for i in indices:
+            offset = self.__offsets[i] - start
+            self.__tiles[i] = data[offset : offset + self.__sizes[i]]
+
+    def to_bytes(self) -> bytes:
+        """Get the whole slab's binary content : header, tiles' index and tiles' data
+
+        Raises:
+            Exception: Number of tiles does not match the header
+
+        Returns:
+            bytes: slab's content
+        """
+
+        count = self.tiles_count
+        if len(self.__tiles) != count:
+            raise Exception(f"Slab has {len(self.__tiles)} tiles, {count} are expected")
+
+        offsets = []
+        offset = ROK4_IMAGE_HEADER_SIZE + 8 * count
+        for tile in self.__tiles:
+            offsets.append(offset)
+            offset += len(tile)
+
+        return b"".join(
+            [
+                self.__header,
+                struct.pack(f"{self.__byte_order}{count}I", *offsets),
+                struct.pack(f"{self.__byte_order}{count}I", *[len(tile) for tile in self.__tiles]),
+            ]
+            + self.__tiles
+        )
+
+    def write(self, path: str) -> None:
+        """Write the slab, in one request
+
+        Args:
+            path (str): slab's file or object path
+
+        Raises:
+            StorageError: Storage write issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+        storage_tools.put_data_binary(self.to_bytes(), path)
+
+
+def is_handled(format: str) -> bool:
+    """Can tiles of a format be decoded and encoded ?
+
+    Args:
+        format (str): pyramid's format (TIFF_<compression>_<sample format>)
+
+    Returns:
+        bool: True if the format is handled
+    """
+    return format in HANDLED_FORMATS
+
+
+def decode_tile(
+    data: bytes, format: str, width: int, height: int, channels: int
+) -> Union[numpy.ndarray, None]:
+    """Decode a tile to a numpy array
+
+    Args:
+        data (bytes): tile's encoded data
+        format (str): pyramid's format (TIFF_<compression>_<sample format>)
+        width (int): tile's width, in pixels
+        height (int): tile's height, in pixels
+        channels (int): number of channels
+
+    Raises:
+        NotImplementedError: Format not handled
+        FormatError: Cannot decode the tile
+
+    Returns:
+        Union[numpy.ndarray, None]: array (rows, columns, channels), None if the tile is empty
+    """
+
+    if len(data) == 0:
+        return None
+
+    if not is_handled(format):
+        raise NotImplementedError(f"Cannot decode tile with format {format}")
+
+    compression = format.split("_")[1]
+    dtype = numpy.dtype("float32") if format.endswith("FLOAT32") else numpy.dtype("uint8")
+
+    try:
+        if compression == "ZIP":
+            array = numpy.frombuffer(zlib.decompress(data), dtype=dtype)
+        elif compression == "PNG":
+            array = numpy.asarray(Image.open(io.BytesIO(data)))
+        else:
+            array = numpy.frombuffer(data, dtype=dtype)
+
+        return array.reshape((height, width, channels))
+
+    except Exception as e:
+        raise FormatError(compression, "binary tile", e)
+
+
+def encode_tile(array: numpy.ndarray, format: str) -> bytes:
+    """Encode a numpy array to a tile
+
+    Args:
+        array (numpy.ndarray): array (rows, columns, channels)
+        format (str): pyramid's format (TIFF_<compression>_<sample format>)
+
+    Raises:
+        NotImplementedError: Format not handled
+
+    Returns:
+        bytes: tile's encoded data
+    """
+
+    if not is_handled(format):
+        raise NotImplementedError(f"Cannot encode tile with format {format}")
+
+    compression = format.split("_")[1]
+    dtype = numpy.dtype("float32") if format.endswith("FLOAT32") else numpy.dtype("uint8")
+    array = numpy.ascontiguousarray(array, dtype=dtype)
+
+    if compression == "ZIP":
+        return zlib.compress(array.tobytes())
+
+    elif compression == "PNG":
+        if array.shape[2] == 1:
+            image = Image.fromarray(array[:, :, 0])
+        else:
+            image = Image.fromarray(array)
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        return output.getvalue()
+
+    else:
+        return array.tobytes()
+
+
+def is_full_mask(path: str, full_tiles: Set[bytes] = None) -> bool:
+    """Are all pixels of a mask slab data ?
+
+    Only the index is read first : a mask with an empty tile is not full.
+
+    Args:
+        path (str): mask slab's file or object path
+        full_tiles (Set[bytes], optional): encoded tiles already known as full, not decoded again. Completed with the new full tiles. Defaults to None.
+
+    Raises:
+        FileNotFoundError: Slab does not exist
+        StorageError: Storage read issue
+        MissingEnvironmentError: Missing object storage informations
+        FormatError: Not a ROK4 slab or cannot decode a tile
+
+    Returns:
+        bool: True if the mask is full
+    """
+
+    mask = Slab.from_path(path, index_only=True)
+    if 0 in mask.sizes:
+        return False
+
+    mask.load_tiles(list(range(mask.tiles_count)))
+    for tile in mask.tiles:
+        # Les tuiles pleines d'une même taille sont en pratique identiques
+        if full_tiles is not None and tile in full_tiles:
+            continue
+
+        array = decode_tile(tile, MASK_FORMAT, mask.tile_width, mask.tile_height, 1)
+        if not array.all():
+            return False
+
+        if full_tiles is not None:
+            full_tiles.add(tile)
+
+    return True
@@ -6,11 +6,15 @@ The module contains the following classes:
 - `SourcePyramids` - Load pyramids
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Union
 
 from rok4.enums import PyramidType
 from rok4.pyramid import Pyramid
 
+# Nombre de descripteurs de pyramides sources chargés en même temps
+LOAD_THREADS = 16
+
 
 class Source:
     """Sources to load to create a new pyramid
@@ -33,9 +37,27 @@ class Source:
         return self.__top
 
 
+def _load_pyramid(descriptor: str) -> Pyramid:
+    try:
+        pyramid = Pyramid.from_descriptor(descriptor)
+
+        if pyramid.storage_s3_cluster is not None:
+            # On ne travaille que sur un unique cluster S3, il ne faut pas préciser lequel dans les chemins
+            raise Exception(
+                f"Do not set S3 cluster host into bucket name ({descriptor}) : only one cluster can be used for sources"
+            )
+
+    except Exception as e:
+        raise Exception(f"Cannot load source pyramid descriptor : {descriptor} : {e}")
+
+    return pyramid
+
+
 class SourcePyramids(Source):
     """Pyramid sources to load to create a new pyramid
 
+    Descriptors are loaded at the same time, then the pyramids' consistency is checked.
+
     Attributes:
         __tms (TileMatrxSet): Tile Matrix Set of the sources
         __format (str): Format of the sources
@@ -55,21 +77,20 @@ class SourcePyramids(Source):
         width_slabs = {}
         height_slabs = {}
 
-        for d in descriptors:
-            # Chargement de la pyramide source
-            try:
-                pyramid = Pyramid.from_descriptor(d)
-                self.__pyramids.append(pyramid)
-
-                if pyramid.storage_s3_cluster is not None:
-                    # On ne travaille que sur un unique cluster S3, il ne faut pas préciser lequel dans les chemins
-                    raise Exception(
-                        f"Do not set S3 cluster host into bucket name ({d}) : only one cluster can be used for sources"
-                    )
+        # Chargement des pyramides sources. La première est chargée seule : le TMS est alors dans le
+        # cache de lecture du stockage et n'est pas relu par les chargements suivants, en parallèle
+        self.__pyramids.append(_load_pyramid(descriptors[0]))
+        if len(descriptors) > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(LOAD_THREADS, len(descriptors) - 1)
+            ) as executor:
+                futures = [executor.submit(_load_pyramid, d) for d in descriptors[1:]]
 
-            except Exception as e:
-                raise Exception(f"Cannot load source pyramid descriptor : {d} : {e}")
+            # Erreurs de chargement remontées dans l'ordre des descripteurs
+            for future in futures:
+                self.__pyramids.append(future.result())
 
+        for pyramid in self.__pyramids:
             # Vérification de l'unicité des caractéristiques des pyramides
             if self.__format is None:
                 self.__tms = pyramid.tms
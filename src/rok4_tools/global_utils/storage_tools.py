@@ -0,0 +1,810 @@
+"""Provide functions to complete the rok4 storage module with bulk operations.
+
+The module contains the following functions and classes:
+
+- `get_sizes` - List files or objects under a prefix, with their sizes
+- `SizesIndex` - Files or objects' sizes, from one listing per root
+- `copy` - Copy a file or an object, server-side when source and destination are on the same cluster
+- `create_exclusive` - Write a file or an object only if it does not exist yet, atomically
+- `get_data_binary` - Read a file or object, without cache and following object symbolic links
+- `get_link_target` - Get the target of an object symbolic link, from its content
+- `get_version` - Get a version identifier of a file or object, changing with its content
+- `put_data_binary` - Write a whole file or object from binary data
+- `StreamWriter` - Write a file or an object part by part, without knowing its final size
+"""
+
+import hashlib
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Union
+
+import boto3
+import botocore.config
+import botocore.exceptions
+from rok4 import storage
+from rok4.enums import StorageType
+from rok4.exceptions import MissingEnvironmentError, StorageError
+
+try:
+    import rados
+except ImportError:
+    rados = None
+
+# Préfixe du contenu des objets liens symboliques, écrits par storage.link
+OBJECT_SYMLINK_SIGNATURE = b"SYMLINK#"
+
+# Connexions simultanées par cluster S3, comme pour les clients du module storage de rok4 : au-delà,
+# des requêtes en parallèle attendent une connexion libre
+S3_MAX_POOL_CONNECTIONS = 10
+
+# Clients des stockages objets, créés à la première utilisation à partir des mêmes variables
+# d'environnement que le module storage de rok4
+_S3_CLIENTS = {}
+_S3_DEFAULT_CLIENT = None
+_CEPH_CLIENT = None
+_CEPH_IOCTXS = {}
+
+
+def _get_s3_client(bucket_name: str) -> Tuple[Dict[str, Union["boto3.client", str]], str]:
+    """Get the S3 client of the bucket's cluster, from the ROK4_S3_KEY, ROK4_S3_SECRETKEY and ROK4_S3_URL environment variables
+
+    Clients are created once, with the same configuration as the rok4 storage module's ones.
+
+    Args:
+        bucket_name (str): S3 bucket name. Could be just the bucket name, or <bucket name>@<cluster host>
+
+    Raises:
+        MissingEnvironmentError: Missing S3 storage informations
+        StorageError: S3 client configuration issue
+
+    Returns:
+        Tuple[Dict[str, Union["boto3.client", str]], str]: the S3 informations (client, host, key, secret) and the simple bucket name
+    """
+
+    global _S3_DEFAULT_CLIENT
+
+    if not _S3_CLIENTS:
+        verify = os.environ.get("ROK4_SSL_NO_VERIFY", "") == ""
+        try:
+            keys = os.environ["ROK4_S3_KEY"].split(",")
+            secret_keys = os.environ["ROK4_S3_SECRETKEY"].split(",")
+            urls = os.environ["ROK4_S3_URL"].split(",")
+        except KeyError as e:
+            raise MissingEnvironmentError(e)
+
+        if len(keys) != len(secret_keys) or len(keys) != len(urls):
+            raise StorageError(
+                "S3",
+                "S3 informations in environment variables are inconsistent : same number of element in each list is required",
+            )
+
+        clients = {}
+        for key, secret_key, url in zip(keys, secret_keys, urls):
+            host = re.sub("https?://", "", url)
+            if host in clients:
+                raise StorageError("S3", "A S3 cluster is defined twice (based on URL)")
+
+            try:
+                client = boto3.client(
+                    "s3",
+                    aws_access_key_id=key,
+                    aws_secret_access_key=secret_key,
+                    verify=verify,
+                    endpoint_url=url,
+                    config=botocore.config.Config(
+                        tcp_keepalive=True, max_pool_connections=S3_MAX_POOL_CONNECTIONS
+                    ),
+                )
+            except Exception as e:
+                raise StorageError("S3", e)
+
+            clients[host] = {
+                "client": client,
+                "key": key,
+                "secret_key": secret_key,
+                "url": url,
+                "host": host,
+                "secure": url.startswith("https://"),
+            }
+
+        # Le premier cluster est celui par défaut
+        _S3_DEFAULT_CLIENT = re.sub("https?://", "", urls[0])
+        _S3_CLIENTS.update(clients)
+
+    if "@" in bucket_name:
+        bucket_name, host = bucket_name.split("@", 1)
+    else:
+        host = _S3_DEFAULT_CLIENT
+
+    if host not in _S3_CLIENTS:
+        raise StorageError("S3", f"Unknown S3 cluster, according to host '{host}'")
+
+    return _S3_CLIENTS[host], bucket_name
+
+
+def _get_ceph_ioctx(pool: str) -> "rados.Ioctx":
+    """Get the CEPH IO context of a pool, from the ROK4_CEPH_CONFFILE, ROK4_CEPH_CLUSTERNAME and ROK4_CEPH_USERNAME environment variables
+
+    The client and the contexts are created once.
+
+    Args:
+        pool (str): CEPH pool's name
+
+    Raises:
+        MissingEnvironmentError: Missing CEPH storage informations
+        StorageError: CEPH IO context configuration issue
+
+    Returns:
+        rados.Ioctx: IO ceph context
+    """
+
+    global _CEPH_CLIENT
+
+    if _CEPH_CLIENT is None:
+        try:
+            client = rados.Rados(
+                conffile=os.environ["ROK4_CEPH_CONFFILE"],
+                clustername=os.environ["ROK4_CEPH_CLUSTERNAME"],
+                name=os.environ["ROK4_CEPH_USERNAME"],
+            )
+            client.connect()
+        except KeyError as e:
+            raise MissingEnvironmentError(e)
+        except Exception as e:
+            raise StorageError("CEPH", e)
+
+        _CEPH_CLIENT = client
+
+    if pool not in _CEPH_IOCTXS:
+        try:
+            _CEPH_IOCTXS[pool] = _CEPH_CLIENT.open_ioctx(pool)
+        except Exception as e:
+            raise StorageError("CEPH", e)
+
+    return _CEPH_IOCTXS[pool]
+
+
+def get_sizes(path: str, threads: int = 16) -> Dict[str, int]:
+    """List files or objects under the provided directory or prefix, with their sizes
+
+    Only one listing is done for S3 storage (sizes are provided with the keys) and FILE storage
+    (os.scandir gives sizes with the directory entries). CEPH listing does not provide sizes: objects
+    are stated by a pool of threads.
+
+    Args:
+        path (str): directory or prefix to list (a '/' is added to object prefix)
+        threads (int, optional): number of concurrent stats for CEPH storage. Defaults to 16.
+
+    Raises:
+        StorageError: Storage read issue
+        MissingEnvironmentError: Missing object storage informations
+        NotImplementedError: Storage type not handled
+
+    Returns:
+        Dict[str, int]: full paths (with storage prefix, as returned by storage.get_path_from_infos) and sizes, in bytes
+    """
+
+    storage_type, unprefixed_path, tray_name, base_name = storage.get_infos_from_path(path)
+
+    sizes = {}
+
+    if storage_type == StorageType.S3:
+        s3_client, bucket_name = _get_s3_client(tray_name)
+
+        try:
+            paginator = s3_client["client"].get_paginator("list_objects_v2")
+            pages = paginator.paginate(
+                Bucket=bucket_name,
+                Prefix=base_name.rstrip("/") + "/",
+                PaginationConfig={
+                    "PageSize": 1000,
+                },
+            )
+            for page in pages:
+                for key in page.get("Contents", []):
+                    sizes[f"{storage_type.value}{tray_name}/{key['Key']}"] = key["Size"]
+
+        except Exception as e:
+            raise StorageError("S3", e)
+
+    elif storage_type == StorageType.CEPH and storage.CEPH_RADOS_AVAILABLE:
+        ioctx = _get_ceph_ioctx(tray_name)
+        prefix = base_name.rstrip("/") + "/"
+
+        try:
+            names = [o.key for o in ioctx.list_objects() if o.key.startswith(prefix)]
+
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                for name, (size, mtime) in zip(names, executor.map(ioctx.stat, names)):
+                    sizes[f"{storage_type.value}{tray_name}/{name}"] = size
+
+        except Exception as e:
+            raise StorageError("CEPH", e)
+
+    elif storage_type == StorageType.FILE:
+        try:
+            directories = [unprefixed_path]
+            while directories:
+                with os.scandir(directories.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        else:
+                            try:
+                                sizes[f"{storage_type.value}{entry.path}"] = entry.stat().st_size
+                            except FileNotFoundError:
+                                # Lien symbolique cassé : la dalle n'est pas indexée
+                                pass
+
+        except Exception as e:
+            raise StorageError("FILE", e)
+
+    else:
+        raise NotImplementedError(f"Cannot list sizes for storage type {storage_type.name}")
+
+    return sizes
+
+
+def copy(from_path: str, to_path: str, from_md5: str = None) -> None:
+    """Copy a file or object to a file or object place. If MD5 sum is provided, it is compared to sum after the copy.
+
+    When source and destination are on the same S3 cluster, a single CopyObject request is sent : data
+    does not go through the host and the destination MD5 sum is read from the request's response. When
+    both are CEPH objects, the object is read and written in one request each (rados does not provide
+    server-side copy). Other cases are delegated to storage.copy.
+
+    Args:
+        from_path (str): source file/object path, to copy
+        to_path (str): destination file/object path
+        from_md5 (str, optional): MD5 sum, re-processed after copy and controlled. Defaults to None.
+
+    Raises:
+        StorageError: Copy issue
+        MissingEnvironmentError: Missing object storage informations
+        NotImplementedError: Storage type not handled
+    """
+
+    from_type, from_unprefixed_path, from_tray, from_base_name = storage.get_infos_from_path(
+        from_path
+    )
+    to_type, to_unprefixed_path, to_tray, to_base_name = storage.get_infos_from_path(to_path)
+
+    if from_type == StorageType.S3 and to_type == StorageType.S3:
+        from_s3_client, from_bucket = _get_s3_client(from_tray)
+        to_s3_client, to_bucket = _get_s3_client(to_tray)
+
+        if from_s3_client["host"] == to_s3_client["host"]:
+            try:
+                response = to_s3_client["client"].copy_object(
+                    Bucket=to_bucket,
+                    Key=to_base_name,
+                    CopySource={"Bucket": from_bucket, "Key": from_base_name},
+                )
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] == "EntityTooLarge":
+                    # Objet trop gros pour une copie en une seule requête (> 5 Go)
+                    storage.copy(from_path, to_path, from_md5)
+                    return
+                raise StorageError("S3", f"Cannot copy S3 object {from_path} to {to_path} : {e}")
+            except Exception as e:
+                raise StorageError("S3", f"Cannot copy S3 object {from_path} to {to_path} : {e}")
+
+            if from_md5 is not None:
+                to_md5 = response["CopyObjectResult"]["ETag"].strip('"')
+                if to_md5 != from_md5:
+                    raise StorageError(
+                        "S3",
+                        f"Invalid MD5 sum control for copy S3 object {from_path} to {to_path} : {from_md5} != {to_md5}",
+                    )
+
+            return
+
+    elif (
+        from_type == StorageType.CEPH
+        and to_type == StorageType.CEPH
+        and storage.CEPH_RADOS_AVAILABLE
+    ):
+        from_ioctx = _get_ceph_ioctx(from_tray)
+        to_ioctx = _get_ceph_ioctx(to_tray)
+
+        try:
+            size, mtime = from_ioctx.stat(from_base_name)
+            data = from_ioctx.read(from_base_name, size, 0)
+            to_ioctx.write_full(to_base_name, data)
+        except Exception as e:
+            raise StorageError("CEPH", f"Cannot copy CEPH object {from_path} to {to_path} : {e}")
+
+        if from_md5 is not None:
+            to_md5 = hashlib.md5(data).hexdigest()
+            if to_md5 != from_md5:
+                raise StorageError(
+                    "CEPH",
+                    f"Invalid MD5 sum control for copy CEPH object {from_path} to {to_path} : {from_md5} != {to_md5}",
+                )
+
+        return
+
+    storage.copy(from_path, to_path, from_md5)
+
+
+def create_exclusive(path: str, data: str) -> bool:
+    """Write a file or an object only if it does not already exist, atomically
+
+    Two concurrent calls on the same path cannot both succeed : FILE storage relies on an exclusive
+    creation (O_EXCL), S3 storage on a conditional write (If-None-Match).
+
+    Args:
+        path (str): file or object path to create
+        data (str): content to write
+
+    Raises:
+        StorageError: Storage write issue
+        MissingEnvironmentError: Missing object storage informations
+        NotImplementedError: Storage type not handled
+
+    Returns:
+        bool: True if the file or object is created, False if it already exists
+    """
+
+    storage_type, unprefixed_path, tray_name, base_name = storage.get_infos_from_path(path)
+
+    if storage_type == StorageType.S3:
+        s3_client, bucket_name = _get_s3_client(tray_name)
+
+        try:
+            s3_client["client"].put_object(
+                Bucket=bucket_name, Key=base_name, Body=data.encode("utf-8"), IfNoneMatch="*"
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ["PreconditionFailed", "ConditionalRequestConflict"]:
+                return False
+            raise StorageError("S3", e)
+        except Exception as e:
+            raise StorageError("S3", e)
+
+    elif storage_type == StorageType.FILE:
+        try:
+            fd = os.open(unprefixed_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        except Exception as e:
+            raise StorageError("FILE", e)
+
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+        except Exception as e:
+            raise StorageError("FILE", e)
+
+    else:
+        raise NotImplementedError(
+            f"Cannot create exclusively data for storage type {storage_type.name}"
+        )
+
+    return True
+
+
+def get_data_binary(path: str, range: Tuple[int, int] = None, follow_links: bool = True) -> bytes:
+    """Read a file or an object, following object symbolic links
+
+    Contrary to storage.get_data_binary, data is not kept in a cache : read data is used once (slabs to
+    process) and could be big.
+
+    Args:
+        path (str): file or object path
+        range (Tuple[int, int], optional): offset and size, to make a partial read. Defaults to None (whole content).
+        follow_links (bool, optional): read the target of an object symbolic link (only for a read from the beginning). Defaults to True.
+
+    Raises:
+        FileNotFoundError: File or object does not exist
+        StorageError: Storage read issue
+        MissingEnvironmentError: Missing object storage informations
+        NotImplementedError: Storage type not handled
+
+    Returns:
+        bytes: file or object content, shorter than the range's size if the end is reached
+    """
+
+    storage_type, unprefixed_path, tray_name, base_name = storage.get_infos_from_path(path)
+
+    if storage_type == StorageType.S3:
+        s3_client, bucket_name = _get_s3_client(tray_name)
+
+        try:
+            if range is None:
+                response = s3_client["client"].get_object(Bucket=bucket_name, Key=base_name)
+            else:
+                response = s3_client["client"].get_object(
+                    Bucket=bucket_name,
+                    Key=base_name,
+                    Range=f"bytes={range[0]}-{range[0] + range[1] - 1}",
+                )
+            data = response["Body"].read()
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                raise FileNotFoundError(path)
+            raise StorageError("S3", e)
+        except Exception as e:
+            raise StorageError("S3", e)
+
+    elif storage_type == StorageType.CEPH and storage.CEPH_RADOS_AVAILABLE:
+        ioctx = _get_ceph_ioctx(tray_name)
+
+        try:
+            if range is None:
+                size, mtime = ioctx.stat(base_name)
+                data = ioctx.read(base_name, size, 0)
+            else:
+                data = ioctx.read(base_name, range[1], range[0])
+        except Exception as e:
+            raise StorageError("CEPH", e)
+
+    elif storage_type == StorageType.FILE:
+        try:
+            with open(unprefixed_path, "rb") as f:
+                if range is None:
+                    data = f.read()
+                else:
+                    f.seek(range[0])
+                    data = f.read(range[1])
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            raise StorageError("FILE", e)
+
+    else:
+        raise NotImplementedError(f"Cannot get data for storage type {storage_type.name}")
+
+    if follow_links and (range is None or range[0] == 0):
+        target = get_link_target(path, data)
+        if target is not None:
+            return get_data_binary(target, range)
+
+    return data
+
+
+def get_link_target(path: str, data: bytes) -> Union[str, None]:
+    """Get the target of an object symbolic link, from the object's content
+
+    Object symbolic links (written by storage.link) contain the target's path, without storage prefix.
+    File symbolic links are followed by the system.
+
+    Args:
+        path (str): file or object path
+        data (bytes): object's content, or its beginning
+
+    Returns:
+        Union[str, None]: target's path, None if the object is not a symbolic link
+    """
+
+    storage_type = storage.get_infos_from_path(path)[0]
+    if storage_type == StorageType.FILE or not data.startswith(OBJECT_SYMLINK_SIGNATURE):
+        return None
+
+    return f"{storage_type.value}{data[len(OBJECT_SYMLINK_SIGNATURE) :].decode()}"
+
+
+def get_version(path: str) -> str:
+    """Get a version identifier of a file or an object, changing with its content, without reading it
+
+    The version is the ETag and the size for S3 objects, the size and the modification time for CEPH
+    objects and files.
+
+    Args:
+        path (str): file or object path
+
+    Raises:
+        FileNotFoundError: File or object does not exist
+        StorageError: Storage read issue
+        MissingEnvironmentError: Missing object storage informations
+        NotImplementedError: Storage type not handled
+
+    Returns:
+        str: version identifier
+    """
+
+    storage_type, unprefixed_path, tray_name, base_name = storage.get_infos_from_path(path)
+
+    if storage_type == StorageType.S3:
+        s3_client, bucket_name = _get_s3_client(tray_name)
+
+        try:
+            response = s3_client["client"].head_object(Bucket=bucket_name, Key=base_name)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == "404":
+                raise FileNotFoundError(path)
+            raise StorageError("S3", e)
+        except Exception as e:
+            raise StorageError("S3", e)
+
+        return f"{response['ETag']} {response['ContentLength']}"
+
+    elif storage_type == StorageType.CEPH and storage.CEPH_RADOS_AVAILABLE:
+        ioctx = _get_ceph_ioctx(tray_name)
+
+        try:
+            size, mtime = ioctx.stat(base_name)
+        except Exception as e:
+            raise StorageError("CEPH", e)
+
+        return f"{size} {time.mktime(mtime)}"
+
+    elif storage_type == StorageType.FILE:
+        try:
+            stat = os.stat(unprefixed_path)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            raise StorageError("FILE", e)
+
+        return f"{stat.st_size} {stat.st_mtime_ns}"
+
+    else:
+        raise NotImplementedError(f"Cannot get version for storage type {storage_type.name}")
+
+
+def put_data_binary(data: bytes, path: str) -> None:
+    """Write a whole file or object from binary data, in one request for object storages
+
+    An existing symbolic link is replaced, its target is not modified.
+
+    Args:
+        data (bytes): content to write
+        path (str): file or object path
+
+    Raises:
+        StorageError: Storage write issue
+        MissingEnvironmentError: Missing object storage informations
+        NotImplementedError: Storage type not handled
+    """
+
+    storage_type, unprefixed_path, tray_name, base_name = storage.get_infos_from_path(path)
+
+    if storage_type == StorageType.S3:
+        s3_client, bucket_name = _get_s3_client(tray_name)
+
+        try:
+            s3_client["client"].put_object(Bucket=bucket_name, Key=base_name, Body=data)
+        except Exception as e:
+            raise StorageError("S3", e)
+
+    elif storage_type == StorageType.CEPH and storage.CEPH_RADOS_AVAILABLE:
+        ioctx = _get_ceph_ioctx(tray_name)
+
+        try:
+            ioctx.write_full(base_name, data)
+        except Exception as e:
+            raise StorageError("CEPH", e)
+
+    elif storage_type == StorageType.FILE:
+        try:
+            if tray_name != "":
+                os.makedirs(tray_name, exist_ok=True)
+            if os.path.islink(unprefixed_path):
+                # On remplace le lien, sans écrire dans sa cible
+                os.remove(unprefixed_path)
+            with open(unprefixed_path, "wb") as f:
+                f.write(data)
+        except Exception as e:
+            raise StorageError("FILE", e)
+
+    else:
+        raise NotImplementedError(f"Cannot put data for storage type {storage_type.name}")
+
+
+class SizesIndex:
+    """Files or objects' sizes, loaded with one listing (get_sizes) the first time a root is used
+
+    Attributes:
+        __sizes (Dict[str, int]): Full paths and sizes of listed files or objects
+        __roots (Set[str]): Listed roots
+    """
+
+    def __init__(self) -> None:
+        self.__sizes = {}
+        self.__roots = set()
+
+    def get_size(self, root: str, path: str, fallback: bool = True) -> Union[int, None]:
+        """Get the size of a file or an object, listing its root if not already done
+
+        Args:
+            root (str): directory or prefix to list, containing the path
+            path (str): file or object full path
+            fallback (bool, optional): request the storage if the path is not in the root's listing. Defaults to True.
+
+        Raises:
+            StorageError: Storage read issue
+            MissingEnvironmentError: Missing object storage informations
+
+        Returns:
+            Union[int, None]: file or object size, in bytes, None if not listed and no fallback
+        """
+
+        if root not in self.__roots:
+            logging.info(f"List {root} to get sizes")
+            self.__sizes.update(get_sizes(root))
+            self.__roots.add(root)
+
+        size = self.__sizes.get(path)
+        if size is None and fallback:
+            # Absent du listage (ajouté entre temps ?), on interroge le stockage
+            size = storage.get_size(path)
+
+        return size
+
+
+class StreamWriter:
+    """Write a file or an object part by part, without knowing its final size nor keeping it in memory
+
+    Data is buffered and sent when the buffer exceeds the part size : as a multipart upload's part for
+    S3 storage, appended for CEPH storage and written directly for FILE storage. Nothing is visible at
+    the destination before the writer is closed for S3 storage.
+
+    Attributes:
+        __path (str): Destination file or object path
+        __part_size (int): Minimal size of a sent part, in bytes (at least 5 MiB for S3 storage)
+        __buffer (List[bytes]): Data not sent yet
+        __buffered (int): Size of the data not sent yet
+        __written (int): Size of the sent data
+        __s3_client (Dict): S3 informations, for S3 storage
+        __bucket_name (str): Bucket name, for S3 storage
+        __upload_id (str): Multipart upload identifier, for S3 storage
+        __parts (List[Dict]): Uploaded parts, for S3 storage
+        __ioctx (rados.Ioctx): IO context, for CEPH storage
+        __file (BinaryIO): Destination file, for FILE storage
+    """
+
+    def __init__(self, path: str, part_size: int = 8 * 1024 * 1024) -> None:
+        """Start the writing
+
+        Args:
+            path (str): destination file or object path
+            part_size (int, optional): minimal size of a sent part, in bytes. Defaults to 8 MiB.
+
+        Raises:
+            StorageError: Storage write issue
+            MissingEnvironmentError: Missing object storage informations
+            NotImplementedError: Storage type not handled
+        """
+
+        self.__path = path
+        self.__part_size = part_size
+        self.__buffer = []
+        self.__buffered = 0
+        self.__written = 0
+
+        (
+            self.__storage_type,
+            unprefixed_path,
+            tray_name,
+            self.__base_name,
+        ) = storage.get_infos_from_path(path)
+
+        if self.__storage_type == StorageType.S3:
+            self.__s3_client, self.__bucket_name = _get_s3_client(tray_name)
+            self.__parts = []
+            try:
+                self.__upload_id = self.__s3_client["client"].create_multipart_upload(
+                    Bucket=self.__bucket_name, Key=self.__base_name
+                )["UploadId"]
+            except Exception as e:
+                raise StorageError("S3", e)
+
+        elif self.__storage_type == StorageType.CEPH and storage.CEPH_RADOS_AVAILABLE:
+            self.__ioctx = _get_ceph_ioctx(tray_name)
+
+        elif self.__storage_type == StorageType.FILE:
+            try:
+                if tray_name != "":
+                    os.makedirs(tray_name, exist_ok=True)
+                self.__file = open(unprefixed_path, "wb")
+            except Exception as e:
+                raise StorageError("FILE", e)
+
+        else:
+            raise NotImplementedError(
+                f"Cannot stream data for storage type {self.__storage_type.name}"
+            )
+
+    def __flush(self) -> None:
+        data = b"".join(self.__buffer)
+        self.__buffer = []
+        self.__buffered = 0
+
+        if self.__storage_type == StorageType.S3:
+            try:
+                part_number = len(self.__parts) + 1
+                response = self.__s3_client["client"].upload_part(
+                    Bucket=self.__bucket_name,
+                    Key=self.__base_name,
+                    UploadId=self.__upload_id,
+                    PartNumber=part_number,
+                    Body=data,
+                )
+                self.__parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+            except Exception as e:
+                raise StorageError("S3", e)
+
+        elif self.__storage_type == StorageType.CEPH:
+            try:
+                if self.__written == 0:
+                    self.__ioctx.write_full(self.__base_name, data)
+                else:
+                    self.__ioctx.append(self.__base_name, data)
+            except Exception as e:
+                raise StorageError("CEPH", e)
+
+        else:
+            try:
+                self.__file.write(data)
+            except Exception as e:
+                raise StorageError("FILE", e)
+
+        self.__written += len(data)
+
+    def write(self, data: Union[str, bytes]) -> None:
+        """Add data at the end of the file or object
+
+        Args:
+            data (Union[str, bytes]): data to write, UTF-8 encoding is used for strings
+
+        Raises:
+            StorageError: Storage write issue
+        """
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        self.__buffer.append(data)
+        self.__buffered += len(data)
+
+        if self.__buffered >= self.__part_size:
+            self.__flush()
+
+    def close(self) -> None:
+        """Send the remaining data and complete the writing
+
+        Raises:
+            StorageError: Storage write issue
+        """
+
+        if self.__buffered != 0 or (
+            self.__storage_type != StorageType.FILE and self.__written == 0
+        ):
+            # Un objet vide est tout de même écrit
+            self.__flush()
+
+        if self.__storage_type == StorageType.S3:
+            try:
+                self.__s3_client["client"].complete_multipart_upload(
+                    Bucket=self.__bucket_name,
+                    Key=self.__base_name,
+                    UploadId=self.__upload_id,
+                    MultipartUpload={"Parts": self.__parts},
+                )
+            except Exception as e:
+                raise StorageError("S3", e)
+
+        elif self.__storage_type == StorageType.FILE:
+            try:
+                self.__file.close()
+            except Exception as e:
+                raise StorageError("FILE", e)
+
+    def abort(self) -> None:
+        """Cancel the writing, after an error. Already written data is removed"""
+
+        try:
+            if self.__storage_type == StorageType.S3:
+                self.__s3_client["client"].abort_multipart_upload(
+                    Bucket=self.__bucket_name, Key=self.__base_name, UploadId=self.__upload_id
+                )
+            else:
+                if self.__storage_type == StorageType.FILE:
+                    self.__file.close()
+                storage.remove(self.__path)
+        except Exception as e:
+            logging.warning(f"Cannot clean the aborted writing of {self.__path}: {e}")
@@ -0,0 +1,377 @@
+"""Provide functions and classes to write and read todo lists, compressed or not, root-indexed or not.
+
+Todo lists can be compressed with gzip or zstd (if the zstandard package is installed). The format is
+recorded by the file itself (magic number) : it is detected when a todo list is read, so plain todo
+lists are still handled. Todo lists are written and read as streams, never completely in memory.
+
+Root-indexed todo lists (format version 2) start with a root table, like pyramids' list files, and
+paths in lines are relative to these roots :
+
+    #ROK4TODO 2
+    0=s3://bucket/source
+    1=s3://bucket/destination
+    #
+    cp 0/DATA_6_1_1 1/DATA_6_1_1
+
+Paths out of the declared roots stay absolute. Todo lists without this header (version 1) contain only
+absolute paths.
+
+The module contains the following functions and classes:
+
+- `create` - Create a local temporary todo list, to write
+- `upload` - Close a local todo list and copy it to the shared location
+- `download` - Copy a todo list to a local temporary file
+- `open_local` - Open a local todo list to read, whatever its format
+- `read_roots` - Read a root table, at the beginning of a todo list or a pyramid's list
+- `read_header` - Read the root table of a todo list, if present
+- `seek_forward` - Move a todo list stream forward, to an offset in the uncompressed content
+- `resolve` - Get the absolute path from a todo list's path
+- `TodoListWriter` - Write a todo list, root-indexed or not
+"""
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+from typing import IO, BinaryIO, Dict, Tuple
+
+from rok4 import storage
+
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+HEADER = "#ROK4TODO 2"
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Compromis entre taux de compression et rapidité, les listes sont écrites et lues une seule fois
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Taille des lectures pour avancer dans un flux non positionnable (zstd)
+SKIP_SIZE = 1024 * 1024
+
+
+def create(compression: str = "NONE") -> Tuple[IO, str]:
+    """Create a local temporary todo list, to write
+
+    Args:
+        compression (str, optional): NONE, GZIP or ZSTD. Defaults to "NONE".
+
+    Raises:
+        NotImplementedError: Compression not handled (or zstandard package is not installed)
+
+    Returns:
+        Tuple[IO, str]: the text stream to write the todo list and the temporary file's path
+    """
+
+    with tempfile.NamedTemporaryFile(mode="w", delete=False) as tmp:
+        todo_list_tmp = tmp.name
+
+    if compression == "NONE":
+        return open(todo_list_tmp, "w"), todo_list_tmp
+
+    elif compression == "GZIP":
+        return gzip.open(todo_list_tmp, "wt", compresslevel=GZIP_LEVEL), todo_list_tmp
+
+    elif compression == "ZSTD" and ZSTD_AVAILABLE:
+        writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+            open(todo_list_tmp, "wb"), closefd=True
+        )
+        return io.TextIOWrapper(writer, encoding="utf-8"), todo_list_tmp
+
+    else:
+        raise NotImplementedError(f"Cannot write todo list with compression {compression}")
+
+
+def upload(todo_list_obj: IO, todo_list_tmp: str, path: str) -> None:
+    """Close a local todo list and copy it to the shared location (could be an object storage)
+
+    Args:
+        todo_list_obj (IO): stream returned by create
+        todo_list_tmp (str): temporary file's path returned by create
+        path (str): todo list's final location
+
+    Raises:
+        StorageError: Copy issue
+        MissingEnvironmentError: Missing object storage informations
+    """
+
+    todo_list_obj.close()
+    storage.copy(f"file://{todo_list_tmp}", path)
+    storage.remove(f"file://{todo_list_tmp}")
+
+
+def download(path: str) -> str:
+    """Copy a todo list to a local temporary file
+
+    Args:
+        path (str): todo list's location
+
+    Raises:
+        StorageError: Copy issue
+        MissingEnvironmentError: Missing object storage informations
+
+    Returns:
+        str: local temporary file's path
+    """
+
+    with tempfile.NamedTemporaryFile(mode="r", delete=False) as tmp:
+        todo_list_tmp = tmp.name
+
+    storage.copy(path, f"file://{todo_list_tmp}")
+    return todo_list_tmp
+
+
+def open_local(todo_list_tmp: str, binary: bool = False) -> IO:
+    """Open a local todo list to read, plain or compressed
+
+    Offsets are positions in the uncompressed content. zstd compressed streams cannot seek : use
+    seek_forward to move to an offset, and read_header to read the header, whatever the format.
+
+    Args:
+        todo_list_tmp (str): local todo list's path
+        binary (bool, optional): read bytes instead of strings. Defaults to False.
+
+    Raises:
+        NotImplementedError: zstd compressed todo list and zstandard package is not installed
+
+    Returns:
+        IO: the stream to read the todo list
+    """
+
+    with open(todo_list_tmp, "rb") as f:
+        magic = f.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(todo_list_tmp, "rb" if binary else "rt")
+
+    elif magic.startswith(ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raise NotImplementedError(
+                f"Cannot read zstd compressed todo list {todo_list_tmp}: zstandard package is not installed"
+            )
+
+        reader = io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(open(todo_list_tmp, "rb"), closefd=True)
+        )
+        if binary:
+            return reader
+        return io.TextIOWrapper(reader, encoding="utf-8")
+
+    else:
+        return open(todo_list_tmp, "rb" if binary else "r")
+
+
+def read_roots(stream: IO) -> Tuple[Dict[str, str], int]:
+    """Read a root table : "<index>=<root>" lines, up to a "#" line
+
+    Pyramids' lists start with such a table, root-indexed todo lists too, after their header.
+
+    Args:
+        stream (IO): list or todo list stream, text or binary, at the beginning of the table
+
+    Raises:
+        Exception: Invalid root table
+
+    Returns:
+        Tuple[Dict[str, str], int]: roots (index -> root path) and number of bytes read
+    """
+
+    size = 0
+    roots = {}
+    while True:
+        line = stream.readline()
+        if isinstance(line, str):
+            line = line.encode()
+        size += len(line)
+
+        if line == b"":
+            raise Exception("no end of root table")
+
+        line = line.decode().rstrip("\n")
+        if line == "#":
+            break
+
+        index, sep, root = line.partition("=")
+        if sep == "":
+            raise Exception(f"invalid root table line: {line}")
+        roots[index] = root
+
+    return roots, size
+
+
+def read_header(todo_list_obj: IO) -> Tuple[Dict[str, str], int]:
+    """Read the root table of a todo list, if present
+
+    The header is detected without reading the first line, so the stream is never rewound (zstd compressed
+    streams cannot seek) : it is left at the first command line.
+
+    Args:
+        todo_list_obj (IO): todo list stream, opened by open_local, at the beginning
+
+    Raises:
+        Exception: Invalid todo list header
+
+    Returns:
+        Tuple[Dict[str, str], int]: roots (index -> absolute root path) and offset of the first command line
+    """
+
+    # Flux binaire ou flux texte, dont on regarde le tampon binaire, encore au début du contenu
+    buffer = getattr(todo_list_obj, "buffer", todo_list_obj)
+    if buffer.peek(len(HEADER) + 1)[: len(HEADER) + 1] != f"{HEADER}\n".encode():
+        return {}, 0
+
+    # Position comptée en octets, depuis la ligne d'en-tête déjà vérifiée : un flux texte compressé ne
+    # donne pas sa position
+    todo_list_obj.readline()
+    offset = len(HEADER) + 1
+
+    try:
+        roots, size = read_roots(todo_list_obj)
+    except Exception as e:
+        raise Exception(f"Invalid todo list header: {e}")
+
+    return roots, offset + size
+
+
+def seek_forward(todo_list_obj: BinaryIO, offset: int) -> None:
+    """Move a todo list stream forward, to an offset in the uncompressed content
+
+    zstd compressed streams cannot seek : the content up to the offset is read and discarded.
+
+    Args:
+        todo_list_obj (BinaryIO): todo list stream, opened by open_local in binary mode
+        offset (int): offset to reach, not before the current position
+
+    Raises:
+        Exception: Offset before the current position, or beyond the end of the todo list
+    """
+
+    if todo_list_obj.seekable():
+        todo_list_obj.seek(offset)
+        return
+
+    position = todo_list_obj.tell()
+    if offset < position:
+        raise Exception(f"Cannot move back in a todo list stream, from {position} to {offset}")
+
+    while position < offset:
+        data = todo_list_obj.read(min(SKIP_SIZE, offset - position))
+        if data == b"":
+            raise Exception(f"Cannot move to {offset} in a todo list of {position} bytes")
+        position += len(data)
+
+
+def resolve(path: str, roots: Dict[str, str]) -> str:
+    """Get the absolute path from a todo list's path
+
+    Args:
+        path (str): path from a todo list line, relative (<root index>/<key>) or absolute
+        roots (Dict[str, str]): roots from read_header
+
+    Returns:
+        str: absolute path
+    """
+
+    index, sep, key = path.partition("/")
+    root = roots.get(index)
+    if sep == "" or root is None:
+        return path
+
+    return f"{root}/{key}"
+
+
+class TodoListWriter:
+    """Write a todo list, root-indexed or not, compressed or not
+
+    Lines of a root-indexed todo list are written in a local temporary file, the root table is written
+    before them when the todo list is uploaded.
+
+    Attributes:
+        __compression (str): NONE, GZIP or ZSTD
+        __indexed (bool): Root-indexed todo list (format version 2) ?
+        __roots (Dict[str, int]): Root absolute paths and their index
+        __todo_list_obj (IO): Local stream to write lines
+        __todo_list_tmp (str): Local temporary file's path
+    """
+
+    def __init__(self, compression: str = "NONE", indexed: bool = False) -> None:
+        self.__compression = compression
+        self.__indexed = indexed
+        self.__roots = {}
+
+        if indexed:
+            # Les lignes sont écrites en clair, elles seront compressées avec l'en-tête
+            self.__todo_list_obj, self.__todo_list_tmp = create("NONE")
+        else:
+            self.__todo_list_obj, self.__todo_list_tmp = create(compression)
+
+    def get_path(self, root: str, path: str) -> str:
+        """Get the path to write in the todo list : relative to the root if the todo list is root-indexed
+
+        Args:
+            root (str): absolute root path, with storage prefix
+            path (str): absolute path, with storage prefix
+
+        Returns:
+            str: path to write
+        """
+
+        if not self.__indexed or not path.startswith(root + "/"):
+            return path
+
+        index = self.__roots.get(root)
+        if index is None:
+            index = len(self.__roots)
+            self.__roots[root] = index
+
+        return f"{index}/{path[len(root) + 1:]}"
+
+    def write(self, lines: str) -> None:
+        """Write lines in the todo list
+
+        Args:
+            lines (str): lines, with the line breaks
+        """
+        self.__todo_list_obj.write(lines)
+
+    def upload(self, path: str) -> None:
+        """Close the todo list and copy it to the shared location
+
+        Args:
+            path (str): todo list's final location
+
+        Raises:
+            StorageError: Copy issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+
+        if not self.__indexed:
+            upload(self.__todo_list_obj, self.__todo_list_tmp, path)
+            return
+
+        self.__todo_list_obj.close()
+
+        todo_list_obj, todo_list_tmp = create(self.__compression)
+        todo_list_obj.write(f"{HEADER}\n")
+        for root, index in self.__roots.items():
+            todo_list_obj.write(f"{index}={root}\n")
+        todo_list_obj.write("#\n")
+        with open(self.__todo_list_tmp) as f:
+            shutil.copyfileobj(f, todo_list_obj)
+        os.remove(self.__todo_list_tmp)
+
+        upload(todo_list_obj, todo_list_tmp, path)
+
+    def discard(self) -> None:
+        """Close and remove the todo list, without uploading it"""
+
+        self.__todo_list_obj.close()
+        os.remove(self.__todo_list_tmp)
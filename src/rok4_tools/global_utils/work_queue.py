@@ -0,0 +1,235 @@
+"""Provide classes and functions to share chunks of work between any number of agents.
+
+Chunks are todo lists written in a shared directory (FILE or S3 storage), numbered from 1. An agent
+claims a chunk with a lease, processes it and marks it as done. Files in the directory :
+
+- `queue.json` - Number of chunks
+- `chunk.<n>.list` - Todo list of the chunk n
+- `chunk.<n>.lease.<g>` - Lease on the chunk n, generation g (owner and expiration time)
+- `chunk.<n>.checkpoint` - Progress of the agent in the chunk n
+- `chunk.<n>.done` - The chunk n is completely processed
+
+The module contains the following classes and functions:
+
+- `LeaseLostError` - Exception raised when a lease is taken over by another agent
+- `Lease` - Exclusive and time-limited claim on a chunk
+- `get_chunk_path` - Path of a chunk's file
+- `get_state` - Done chunks and leases' generations, from one listing
+- `claim` - Claim the first free chunk or with an expired lease
+- `clean` - Remove all the queue's files
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Set, Tuple, Union
+
+from rok4 import storage
+from rok4.exceptions import StorageError
+
+from rok4_tools.global_utils import storage_tools
+
+# Durée d'attente entre deux consultations de l'état de la file
+POLL_INTERVAL = 10
+
+
+class LeaseLostError(Exception):
+    """Exception raised when a lease is taken over by another agent, after expiration"""
+
+    def __init__(self, path: str):
+        self.path = path
+        super().__init__(f"Lease {path} has been taken over by another agent")
+
+
+class Lease:
+    """Exclusive and time-limited claim on a chunk
+
+    A lease is claimed creating the file or object chunk.<n>.lease.<g> exclusively : only one agent can
+    succeed. Its content gives the owner and the expiration time. An expired lease is taken over
+    creating the next generation. The owner has to renew its lease before it expires, and gives up as
+    soon as a next generation exists.
+
+    Attributes:
+        __directory (str): Queue's directory
+        __chunk (int): Chunk number
+        __owner (str): Agent's identifier
+        __duration (int): Lease duration, in seconds
+        __generation (int): Owned generation, None if not owned
+        __renewed (float): Time of the last renewal
+    """
+
+    def __init__(self, directory: str, chunk: int, owner: str, duration: int) -> None:
+        self.__directory = directory
+        self.__chunk = chunk
+        self.__owner = owner
+        self.__duration = duration
+        self.__generation = None
+        self.__renewed = None
+
+    @property
+    def chunk(self) -> int:
+        return self.__chunk
+
+    @property
+    def generation(self) -> Union[int, None]:
+        return self.__generation
+
+    def __get_path(self, generation: int) -> str:
+        return get_chunk_path(self.__directory, self.__chunk, f"lease.{generation}")
+
+    def __get_content(self) -> str:
+        return json.dumps({"owner": self.__owner, "expires": time.time() + self.__duration})
+
+    def acquire(self, last_generation: int = None) -> bool:
+        """Try to claim the chunk
+
+        Args:
+            last_generation (int, optional): Last existing lease's generation. Defaults to None (no lease yet).
+
+        Raises:
+            StorageError: Storage read or write issue
+            MissingEnvironmentError: Missing object storage informations
+
+        Returns:
+            bool: True if the lease is owned
+        """
+
+        generation = 0
+        if last_generation is not None:
+            # Lecture sans le cache de rok4 : le bail a pu être renouvelé depuis une lecture
+            # précédente
+            content = json.loads(storage_tools.get_data_binary(self.__get_path(last_generation)))
+            if content["expires"] > time.time():
+                return False
+
+            logging.info(
+                f"Lease on chunk {self.__chunk} owned by {content['owner']} has expired, take it over"
+            )
+            generation = last_generation + 1
+
+        if not storage_tools.create_exclusive(self.__get_path(generation), self.__get_content()):
+            return False
+
+        self.__generation = generation
+        self.__renewed = time.time()
+        return True
+
+    def renew(self, force: bool = False) -> None:
+        """Extend the lease, if a third of its duration passed since the last renewal
+
+        Args:
+            force (bool, optional): Extend the lease anyway. Defaults to False.
+
+        Raises:
+            LeaseLostError: The lease has been taken over by another agent
+            StorageError: Storage read or write issue
+            MissingEnvironmentError: Missing object storage informations
+        """
+
+        if not force and time.time() - self.__renewed < self.__duration / 3:
+            return
+
+        if storage.exists(self.__get_path(self.__generation + 1)):
+            raise LeaseLostError(self.__get_path(self.__generation))
+
+        storage.put_data_str(self.__get_content(), self.__get_path(self.__generation))
+        self.__renewed = time.time()
+
+
+def get_chunk_path(directory: str, chunk: int, suffix: str) -> str:
+    """Path of a chunk's file
+
+    Args:
+        directory (str): Queue's directory
+        chunk (int): Chunk number
+        suffix (str): File's type : list, checkpoint, done or lease.<g>
+
+    Returns:
+        str: chunk.<n>.<suffix> in the directory
+    """
+    return os.path.join(directory, f"chunk.{chunk}.{suffix}")
+
+
+def get_state(directory: str) -> Tuple[Set[int], Dict[int, int]]:
+    """Done chunks and leases' generations, from one listing of the queue's directory
+
+    Args:
+        directory (str): Queue's directory
+
+    Raises:
+        StorageError: Storage read issue
+        MissingEnvironmentError: Missing object storage informations
+
+    Returns:
+        Tuple[Set[int], Dict[int, int]]: done chunks and last lease generation of each leased chunk
+    """
+
+    done = set()
+    generations = {}
+
+    for path in storage_tools.get_sizes(directory):
+        match = re.match(r"^chunk\.([0-9]+)\.(done|lease\.([0-9]+))$", os.path.basename(path))
+        if match is None:
+            continue
+
+        chunk = int(match.group(1))
+        if match.group(2) == "done":
+            done.add(chunk)
+        else:
+            generations[chunk] = max(generations.get(chunk, 0), int(match.group(3)))
+
+    return done, generations
+
+
+def claim(directory: str, chunks: int, owner: str, duration: int) -> Tuple[Union[Lease, None], int]:
+    """Claim the first chunk without lease or with an expired lease
+
+    Args:
+        directory (str): Queue's directory
+        chunks (int): Number of chunks
+        owner (str): Agent's identifier
+        duration (int): Lease duration, in seconds
+
+    Raises:
+        StorageError: Storage read or write issue
+        MissingEnvironmentError: Missing object storage informations
+
+    Returns:
+        Tuple[Union[Lease, None], int]: the owned lease (None if no chunk can be claimed) and the number of not done chunks
+    """
+
+    done, generations = get_state(directory)
+
+    for chunk in range(1, chunks + 1):
+        if chunk in done:
+            continue
+
+        lease = Lease(directory, chunk, owner, duration)
+        if lease.acquire(generations.get(chunk)):
+            return lease, chunks - len(done)
+
+    return None, chunks - len(done)
+
+
+def clean(directory: str) -> None:
+    """Remove all the queue's files, from a previous or the current work
+
+    Args:
+        directory (str): Queue's directory
+
+    Raises:
+        StorageError: Storage removal issue
+        MissingEnvironmentError: Missing object storage informations
+    """
+
+    try:
+        paths = storage_tools.get_sizes(directory)
+    except StorageError:
+        # Le dossier n'existe pas encore
+        return
+
+    for path in paths:
+        if re.match(r"^(queue\.json|chunk\.[0-9]+\..+)$", os.path.basename(path)):
+            storage.remove(path)
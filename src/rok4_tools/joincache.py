@@ -12,6 +12,7 @@ from jsonschema import ValidationError, validate
 from rok4.storage import get_data_str
 
 from rok4_tools import __version__
+from rok4_tools.global_utils import todo_list
 from rok4_tools.joincache_utils.agent import work as agent_work
 from rok4_tools.joincache_utils.finisher import work as finisher_work
 from rok4_tools.joincache_utils.master import work as master_work
@@ -112,9 +113,69 @@ def configuration() -> None:
             f"Split number have to be consistent with the parallelization level: {args.split} > {config['process']['parallelization']}"
         )
 
+    if "balancing" not in config["process"]:
+        config["process"]["balancing"] = "COUNT"
+
+    if "index" not in config["process"]:
+        config["process"]["index"] = {}
+    config["process"]["index"].setdefault("mode", "MEMORY")
+    config["process"]["index"].setdefault("buffer", 1000000)
+
+    if "checkpoint" not in config["process"]:
+        config["process"]["checkpoint"] = {}
+    config["process"]["checkpoint"].setdefault("lines", 10000)
+    config["process"]["checkpoint"].setdefault("seconds", 60)
+
+    if "planners" not in config["process"]:
+        config["process"]["planners"] = 1
+
+    if "compression" not in config["process"]:
+        config["process"]["compression"] = "NONE"
+
+    if config["process"]["compression"] == "ZSTD" and not todo_list.ZSTD_AVAILABLE:
+        logging.warning("zstandard package is not installed, todo lists are compressed with gzip")
+        config["process"]["compression"] = "GZIP"
+
+    if "todo_format" not in config["process"]:
+        config["process"]["todo_format"] = 1
+
+    if "engine" not in config["process"]:
+        config["process"]["engine"] = "TOOLS"
+
+    if "threads" not in config["process"]:
+        config["process"]["threads"] = 1
+
+    if "workers" not in config["process"]:
+        config["process"]["workers"] = 1
+
+    if "prefetch" not in config["process"]:
+        config["process"]["prefetch"] = 0
+
+    if "scratch" not in config["process"]:
+        config["process"]["scratch"] = {}
+    config["process"]["scratch"].setdefault("compression", "ZIP")
+    config["process"]["scratch"].setdefault("min_free", 0)
+
+    if "directory" in config["process"]["scratch"] and not os.path.isdir(
+        config["process"]["scratch"]["directory"]
+    ):
+        raise Exception(
+            f"Scratch directory does not exist: {config['process']['scratch']['directory']}"
+        )
+
     if "only_links" not in config["process"]:
         config["process"]["only_links"] = False
 
+    if "incremental" not in config["process"]:
+        config["process"]["incremental"] = False
+    elif config["process"]["incremental"] and "manifest" not in config["process"]:
+        raise Exception("Incremental mode needs the previous run's manifest (process.manifest)")
+
+    if "direct" not in config["process"]:
+        config["process"]["direct"] = False
+    elif config["process"]["direct"] and not config["process"]["only_links"]:
+        raise Exception("Direct mode is only possible when only links are made")
+
     if "mask" not in config["process"]:
         config["process"]["mask"] = False
         config["pyramid"]["mask"] = False
@@ -123,9 +184,14 @@ def configuration() -> None:
             config["pyramid"]["mask"] = False
         elif config["process"]["mask"] == False and config["pyramid"]["mask"] == True:
             raise Exception(
-                f"The new pyramid cannot have mask if masks are not used during the process"
+                "The new pyramid cannot have mask if masks are not used during the process"
             )
 
+    if "mask_links" not in config["process"]:
+        config["process"]["mask_links"] = False
+    elif config["process"]["mask_links"] and not config["process"]["mask"]:
+        raise Exception("Stacks cannot be linked from their top mask if masks are not used")
+
     # Logger
     if "logger" in config:
         # On supprime l'ancien logger (celui configuré par défaut) et on le reconfigure avec les nouveaux paramètres
@@ -182,6 +248,11 @@ def main():
         print("Valid configuration !")
         sys.exit(0)
 
+    if config["process"]["direct"] and args.role in ["agent", "finisher"]:
+        # Tout a été fait par le master
+        logging.info(f"Direct mode: nothing to do for the {args.role}")
+        sys.exit(0)
+
     # Work
     try:
         if args.role == "master":
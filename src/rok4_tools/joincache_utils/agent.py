@@ -1,21 +1,460 @@
+import logging
+import multiprocessing
 import os
-import tempfile
-from typing import Dict, List, Tuple, Union
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
 
 from rok4 import storage
-from rok4.enums import SlabType
-from rok4.pyramid import Level, Pyramid
+from rok4.enums import SlabType, StorageType
+from rok4.pyramid import Pyramid
+
+from rok4_tools.global_utils import pipeline, slab, todo_list
+from rok4_tools.global_utils.checkpoint import Checkpoint, OrderedProgress
+from rok4_tools.global_utils.scratch import Scratch
+from rok4_tools.joincache_utils import engine
+
+# Nombre de liens faits par une même tâche, pour limiter le coût des soumissions au pool de threads
+LINK_BATCH = 100
+
+
+def read_groups(todo_list_obj: BinaryIO, offset: int) -> Iterator[Tuple[List[List[str]], int]]:
+    """Read the todo list by groups of commands, from the provided offset
+
+    A group is either a link line, or a merge block : c2w lines, the oNt line and w2c lines. A group has
+    to be completely processed to be considered as done.
+
+    Args:
+        todo_list_obj (BinaryIO): todo list, opened in binary mode
+        offset (int): offset of the first line to read
+
+    Yields:
+        Iterator[Tuple[List[List[str]], int]]: the group's lines (splitted) and the offset after the group
+    """
+
+    todo_list.seek_forward(todo_list_obj, offset)
+
+    group = []
+    for line in todo_list_obj:
+        parts = line.decode().rstrip().split(" ")
+
+        # Une ligne qui n'est pas la suite d'un bloc de fusion commence un nouveau groupe
+        if group and (
+            parts[0] == "link"
+            or (parts[0] == "c2w" and group[-1][0] != "c2w")
+            or (parts[0] == "oNt" and group[-1][0] != "c2w")
+        ):
+            yield group, offset
+            group = []
+
+        group.append(parts)
+        offset += len(line)
+
+    if group:
+        yield group, offset
+
+
+def convert_sources(
+    config: Dict, pyramid: Pyramid, group: List[List[str]], scratch: Scratch
+) -> Tuple[List[str], List[str]]:
+    """Convert the source slabs of a merge block to work format (cache2work), in local temporary files
+
+    Args:
+        config (Dict): JOINCACHE configuration
+        pyramid (Pyramid): source pyramid, to identify slabs' types
+        group (List[List[str]]): block's lines, splitted, with absolute paths
+        scratch (Scratch): temporary files' manager
+
+    Raises:
+        Exception: cache2work raises an error
+
+    Returns:
+        Tuple[List[str], List[str]]: converted data slabs and their masks ("" if no mask), from the top to the bottom
+    """
+
+    compression = config["process"]["scratch"]["compression"].lower()
+
+    data = []
+    mask = []
+    for parts in group:
+        if parts[0] != "c2w":
+            continue
+
+        work_file = scratch.create(".tif")
+        result_value = os.system(f"cache2work -c {compression} {parts[1]} {work_file}")
+        if result_value != 0:
+            raise Exception("cache2work raises an error")
+
+        # Un masque suit toujours sa dalle de données
+        if data and pyramid.get_infos_from_slab_path(parts[1])[0] == SlabType.MASK:
+            mask[-1] = work_file
+        else:
+            data.append(work_file)
+            mask.append("")
+
+    return data, mask
+
+
+def overlay_sources(
+    config: Dict, pyramid: Pyramid, data: List[str], mask: List[str], scratch: Scratch
+) -> Tuple[str, Union[str, None]]:
+    """Overlay converted slabs (overlayNtiff), into local temporary files
+
+    Converted slabs are removed.
+
+    Args:
+        config (Dict): JOINCACHE configuration
+        pyramid (Pyramid): source pyramid, to get raster specifications
+        data (List[str]): converted data slabs, from convert_sources
+        mask (List[str]): converted masks, from convert_sources
+        scratch (Scratch): temporary files' manager
+
+    Raises:
+        Exception: overlayNtiff raises an error
+
+    Returns:
+        Tuple[str, Union[str, None]]: overlaid data and mask (None if the output pyramid has no mask) images
+    """
+
+    raster_specifications = pyramid.raster_specifications
+    compression = config["process"]["scratch"]["compression"].lower()
+
+    result = scratch.create(".tif")
+    result_mask = None
+    file_tiff = f"{result}"
+    if config["pyramid"]["mask"]:
+        result_mask = scratch.create(".tif")
+        file_tiff += f" {result_mask}\n"
+    else:
+        file_tiff += "\n"
+    for i in range(len(data) - 1, -1, -1):
+        file_tiff += f"{data[i]}"
+        if mask[i] != "":
+            if i == 0:
+                file_tiff += f" {mask[i]}"
+            else:
+                file_tiff += f" {mask[i]}\n"
+        else:
+            if i != 0:
+                file_tiff += "\n"
+    fichier = scratch.create(".txt")
+    with open(fichier, "w") as f:
+        f.write(file_tiff)
+    result_value = os.system(
+        f"overlayNtiff -f {fichier} -m TOP -b {raster_specifications['nodata']} -c {compression} -s {raster_specifications['channels']} -p {raster_specifications['photometric']}"
+    )
+    if result_value != 0:
+        raise Exception("overlayNtiff raises an error")
+    scratch.remove(fichier, *data, *[m for m in mask if m != ""])
+
+    return result, result_mask
+
+
+def write_outputs(
+    pyramid: Pyramid,
+    group: List[List[str]],
+    result: str,
+    result_mask: Union[str, None],
+    scratch: Scratch,
+) -> None:
+    """Write overlaid images into the output pyramid (work2cache)
+
+    Overlaid images are removed.
+
+    Args:
+        pyramid (Pyramid): source pyramid, to get format and raster specifications
+        group (List[List[str]]): block's lines, splitted, with absolute paths
+        result (str): overlaid data image, from overlay_sources
+        result_mask (Union[str, None]): overlaid mask image, from overlay_sources
+        scratch (Scratch): temporary files' manager
+
+    Raises:
+        Exception: work2cache raises an error
+    """
+
+    raster_specifications = pyramid.raster_specifications
+    format = pyramid.format
+    compression = format.split("_")[1].lower()
+    if "UINT" in format:
+        format_channel = "uint"
+    elif "FLOAT" in format:
+        format_channel = "float"
+    if "8" in format:
+        bits_channel = "8"
+    elif "32" in format:
+        bits_channel = "32"
+
+    for parts in group:
+        if parts[0] != "w2c":
+            continue
+
+        to_tray = storage.get_infos_from_path(parts[1])[2]
+        if to_tray != "":
+            os.makedirs(to_tray, exist_ok=True)
+
+        slab_type = pyramid.get_infos_from_slab_path(parts[1])[0]
+        if slab_type == SlabType.DATA:
+            level = pyramid.get_infos_from_slab_path(parts[1])[1]
+            tile_width = pyramid.tms.get_level(level).tile_width
+            tile_heigth = pyramid.tms.get_level(level).tile_heigth
+            result_value = os.system(
+                f"work2cache -c {compression} -t {tile_width} {tile_heigth} -a {format_channel} -b {bits_channel} -s {raster_specifications['channels']} {result} {parts[1]}"
+            )
+            if result_value != 0:
+                raise Exception("work2cache raises an error")
+        elif slab_type == SlabType.MASK:
+            level = pyramid.get_infos_from_slab_path(parts[1])[1]
+            tile_width = pyramid.tms.get_level(level).tile_width
+            tile_heigth = pyramid.tms.get_level(level).tile_heigth
+            result_value = os.system(
+                f"work2cache -c zip -t {tile_width} {tile_heigth} -a {format_channel} -b {bits_channel} -s {raster_specifications['channels']} {result_mask} {parts[1]}"
+            )
+            if result_value != 0:
+                raise Exception("work2cache raises an error")
+
+    # Le masque superposé est supprimé même si la todo list ne l'écrit pas
+    scratch.remove(result, *[m for m in [result_mask] if m is not None])
+
+
+def unlink_outputs(group: List[List[str]]) -> None:
+    """Remove the output slabs of a merge block which are symbolic links, left by a previous run
+
+    A file written through a symbolic link would be written into the source pyramid. An object link
+    is an object which is simply replaced by the written slab.
+
+    Args:
+        group (List[List[str]]): block's lines, splitted, with absolute paths
+
+    Raises:
+        OSError: Cannot remove a symbolic link
+    """
+
+    for parts in group:
+        if parts[0] != "w2c":
+            continue
+
+        storage_type, unprefixed_path, tray_name, base_name = storage.get_infos_from_path(parts[1])
+        if storage_type == StorageType.FILE and os.path.islink(unprefixed_path):
+            os.remove(unprefixed_path)
+
+
+def read_stage(
+    config: Dict, pyramid: Pyramid, group: List[List[str]], use_engine: bool, scratch: Scratch
+) -> Union[Tuple[str, Tuple], None]:
+    """First stage of a group's processing : read (and convert) the source slabs
+
+    Args:
+        config (Dict): JOINCACHE configuration
+        pyramid (Pyramid): source pyramid
+        group (List[List[str]]): group's lines, splitted, with absolute paths
+        use_engine (bool): merge with the PYTHON engine, if the block allows it
+        scratch (Scratch): temporary files' manager
+
+    Raises:
+        Exception: cache2work raises an error
+        StorageError: Slab read issue
+
+    Returns:
+        Union[Tuple[str, Tuple], None]: engine used (PYTHON or TOOLS) and read sources, None for a link
+    """
+
+    if group[0][0] != "c2w":
+        return None
+
+    if use_engine:
+        sources = engine.read_group(pyramid, group)
+        if sources is not None:
+            return "PYTHON", sources
+
+    return "TOOLS", convert_sources(config, pyramid, group, scratch)
+
+
+def merge_stage(
+    config: Dict, pyramid: Pyramid, sources: Union[Tuple[str, Tuple], None], scratch: Scratch
+) -> Union[Tuple[str, Tuple], None]:
+    """Second stage of a group's processing : merge the read sources
+
+    Args:
+        config (Dict): JOINCACHE configuration
+        pyramid (Pyramid): source pyramid
+        sources (Union[Tuple[str, Tuple], None]): read sources, from read_stage
+        scratch (Scratch): temporary files' manager
+
+    Raises:
+        Exception: overlayNtiff raises an error
+        FormatError: Cannot decode a tile
+
+    Returns:
+        Union[Tuple[str, Tuple], None]: engine used (PYTHON or TOOLS) and outputs to write, None for a link
+    """
+
+    if sources is None:
+        return None
+
+    if sources[0] == "PYTHON":
+        return "PYTHON", engine.merge_sources(pyramid, *sources[1])
+
+    return "TOOLS", overlay_sources(config, pyramid, *sources[1], scratch)
+
+
+def write_stage(
+    pyramid: Pyramid, group: List[List[str]], outputs: Tuple[str, Tuple], scratch: Scratch
+) -> None:
+    """Last stage of a merge block's processing : write the output slabs
+
+    Args:
+        pyramid (Pyramid): source pyramid
+        group (List[List[str]]): block's lines, splitted, with absolute paths
+        outputs (Tuple[str, Tuple]): outputs to write, from merge_stage
+        scratch (Scratch): temporary files' manager
+
+    Raises:
+        Exception: work2cache raises an error
+        StorageError: Slab write issue
+        OSError: Cannot remove a previous symbolic link
+    """
+
+    # Lien éventuel de la génération précédente, supprimé juste avant l'écriture de la dalle recalculée
+    unlink_outputs(group)
+
+    if outputs[0] == "PYTHON":
+        for path, output in outputs[1]:
+            output.write(path)
+
+    else:
+        write_outputs(pyramid, group, *outputs[1], scratch)
+
+
+def make_links(groups: List[List[List[str]]]) -> None:
+    """Make the links of a batch of link groups
+
+    Args:
+        groups (List[List[List[str]]]): link groups, splitted, with absolute paths
+
+    Raises:
+        StorageError: Link issue
+        MissingEnvironmentError: Missing object storage informations
+    """
+
+    for group in groups:
+        for parts in group:
+            storage.link(parts[2], parts[1])
+
+
+def get_scratch(config: Dict) -> Scratch:
+    """Create the temporary files' manager, from the configuration (process.scratch)
+
+    Args:
+        config (Dict): JOINCACHE configuration
+
+    Returns:
+        Scratch: temporary files' manager
+    """
+
+    return Scratch(
+        config["process"]["scratch"].get("directory"),
+        config["process"]["scratch"]["min_free"] * 1024 * 1024,
+    )
+
+
+# Contexte de chaque processus de fusion : configuration et pyramide source, chargée une seule fois
+# au démarrage du processus, et fichiers temporaires du processus. Les clients de stockage sont créés
+# par le processus lui-même, à leur première utilisation
+_worker = {}
+
+
+def _init_worker(config: Dict, use_engine: bool) -> None:
+    _worker["config"] = config
+    _worker["use_engine"] = use_engine
+    _worker["pyramid"] = Pyramid.from_descriptor(
+        config["datasources"][0]["source"]["descriptors"][0]
+    )
+    _worker["scratch"] = get_scratch(config)
+
+
+def _process_group(group: List[List[str]]) -> None:
+    pyramid = _worker["pyramid"]
+    scratch = _worker["scratch"]
+    try:
+        sources = read_stage(_worker["config"], pyramid, group, _worker["use_engine"], scratch)
+        write_stage(
+            pyramid, group, merge_stage(_worker["config"], pyramid, sources, scratch), scratch
+        )
+    finally:
+        # Un processus ne traite qu'un groupe à la fois : ses fichiers restants sont ceux du groupe
+        scratch.clean()
+
+
+def collect(pending: Dict[Future, List[int]], progress: OrderedProgress, return_when: str) -> None:
+    """Wait for pending tasks and mark their groups as done
+
+    When a task failed, not started tasks are cancelled and running ones are waited for, so that the
+    progress includes all done groups before the error is raised.
+
+    Args:
+        pending (Dict[Future, List[int]]): pending tasks and their groups' indices, done ones are removed
+        progress (OrderedProgress): groups' progress
+        return_when (str): FIRST_COMPLETED or ALL_COMPLETED
+
+    Raises:
+        Exception: first error raised by a task
+    """
+
+    done, not_done = wait(pending, return_when=return_when)
+    if any(future.exception() is not None for future in done):
+        # Les tâches pas encore commencées sont abandonnées, celles en cours sont attendues
+        for future in not_done:
+            future.cancel()
+        done, not_done = wait(pending, return_when=ALL_COMPLETED)
+
+    error = None
+    for future in done:
+        indices = pending.pop(future)
+        if future.cancelled():
+            continue
+        if future.exception() is None:
+            for index in indices:
+                progress.done(index)
+        elif error is None:
+            error = future.exception()
+
+    # Propage l'éventuelle erreur d'une tâche, une fois la progression à jour
+    if error is not None:
+        raise error
 
 
 def work(config: Dict, split: int) -> None:
     """Agent steps : make links or merge images
 
-    Expects the configuration, the todo list and the optionnal last done slab name : if exists, work
-    does not start from the beginning, but after the last copied slab. This file contains only the
-    destination path of the last processed slab.
+    Expects the configuration, the todo list and the optionnal checkpoint : if exists, work does not
+    start from the beginning, but at the saved offset in the todo list, after the already processed
+    lines. The checkpoint is saved every process.checkpoint.lines lines or process.checkpoint.seconds
+    seconds, and when an error occurs, always between two groups of commands.
 
     A line in the todo list is either a slab's copy from pyramid format to work format, or a merge of
-    stacking slabs or a slab's copy from work format to pyramid format.
+    stacking slabs or a slab's copy from work format to pyramid format. With the PYTHON engine
+    (process.engine), a whole block of these lines is processed in process, without external tools
+    nor temporary files.
+
+    Each group of commands goes through three stages : source slabs are read (and converted), then
+    merged, then written. With process.prefetch greater than 0, these stages run at the same time
+    on successive groups, with at most process.prefetch groups waiting between two stages. With
+    process.workers greater than 1, merge blocks are processed by a pool of processes instead.
+    Links are made by batches, by a pool of process.threads threads.
+
+    External tools' intermediate images are written in process.scratch.directory, compressed or not
+    (process.scratch.compression). They are all removed at the end, even after an error, and their
+    creation waits for process.scratch.min_free megabytes of free space on the scratch volume.
+
+    Groups can end in any order : the checkpoint only moves forward when all the previous groups are
+    done.
 
     Args:
         config (Dict): JOINCACHE configuration
@@ -30,10 +469,8 @@ def work(config: Dict, split: int) -> None:
 
     # On récupère la todo list sous forme de fichier temporaire
     try:
-        todo_list_obj = tempfile.NamedTemporaryFile(mode="r", delete=False)
-        storage.copy(
-            os.path.join(config["process"]["directory"], f"todo.{split}.list"),
-            f"file://{todo_list_obj.name}",
+        todo_list_tmp = todo_list.download(
+            os.path.join(config["process"]["directory"], f"todo.{split}.list")
         )
 
     except Exception as e:
@@ -46,169 +483,146 @@ def work(config: Dict, split: int) -> None:
             f"Cannot load source pyramid descriptor : {config['datasources'][0]['source']['descriptors'][0]} : {e}"
         )
 
-    last_done_slab = None
-    last_done_fo = os.path.join(config["process"]["directory"], f"slab.{split}.last")
-    have_to_work = True
+    checkpoint = Checkpoint(
+        os.path.join(config["process"]["directory"], f"todo.{split}.checkpoint"),
+        config["process"]["checkpoint"]["lines"],
+        config["process"]["checkpoint"]["seconds"],
+    )
+
+    scratch = get_scratch(config)
+
+    start = time.time()
+    links = 0
+    merges = 0
 
     try:
-        if storage.exists(last_done_fo):
-            last_done_slab = storage.get_data_str(last_done_fo)
-            logging.info(
-                f"The last done slab file exists, last slab to have been copied is {last_done_slab}"
-            )
-            have_to_work = False
-
-        raster_specifications = pyramid.raster_specifications
-        format = pyramid.format
-        compression = format.split("_")[1].lower()
-        if "UINT" in format:
-            format_channel = "uint"
-        elif "FLOAT" in format:
-            format_channel = "float"
-        if "8" in format:
-            bits_channel = "8"
-        elif "32" in format:
-            bits_channel = "32"
-
-        multiple_slabs = False
-        with open(todo_list_obj.name) as file:
-            for line in file:
-                line = line.rstrip()
-                parts = line.split(" ")
-
-                if parts[0] == "link":
-                    if not have_to_work:
-                        if parts[1] == last_done_slab:
-                            # On est retombé sur la dernière dalles traitées, on passe à la suivante mais on arrête de passer
-                            logging.info(f"Last copied slab reached, copies can start again")
-                            have_to_work = True
-
-                        continue
-
-                    storage.link(parts[2], parts[1])
-
-                if parts[0] == "c2w":
-                    if not have_to_work:
-                        continue
-
-                    if not multiple_slabs:
-                        i = 0
-                        data_file = tempfile.NamedTemporaryFile(
-                            mode="r", delete=False, suffix=".tif"
-                        )
-                        result_value = os.system(f"cache2work -c zip {parts[1]} {data_file.name}")
-                        if result_value != 0:
-                            raise Exception(f"cache2work raises an error")
-                        data = [data_file]
-                        mask = [""]
-                        multiple_slabs = True
-                    else:
-                        slab_type = pyramid.get_infos_from_slab_path(parts[1])[0]
-                        if slab_type == SlabType.MASK:
-                            mask_file = tempfile.NamedTemporaryFile(
-                                mode="r", delete=False, suffix=".tif"
-                            )
-                            result_value = os.system(
-                                f"cache2work -c zip {parts[1]} {mask_file.name}"
-                            )
-                            if result_value != 0:
-                                raise Exception(f"cache2work raises an error")
-                            mask[i] = mask_file
-                        else:
-                            i += 1
-                            data_file = tempfile.NamedTemporaryFile(
-                                mode="r", delete=False, suffix=".tif"
-                            )
-                            result_value = os.system(
-                                f"cache2work -c zip {parts[1]} {data_file.name}"
-                            )
-                            if result_value != 0:
-                                raise Exception(f"cache2work raises an error")
-                            data += [data_file]
-                            mask += [""]
-
-                if parts[0] == "oNt":
-                    if not have_to_work:
-                        continue
-
-                    result = tempfile.NamedTemporaryFile(mode="r", delete=False, suffix=".tif")
-                    file_tiff = f"{result.name}"
-                    if config["pyramid"]["mask"]:
-                        result_mask = tempfile.NamedTemporaryFile(
-                            mode="r", delete=False, suffix=".tif"
-                        )
-                        file_tiff += f" {result_mask.name}\n"
-                    else:
-                        file_tiff += "\n"
-                    for i in range(len(data) - 1, -1, -1):
-                        file_tiff += f"{data[i].name}"
-                        if mask[i] != "":
-                            if i == 0:
-                                file_tiff += f" {mask[i].name}"
-                            else:
-                                file_tiff += f" {mask[i].name}\n"
-                        else:
-                            if i != 0:
-                                file_tiff += "\n"
-                    fichier = tempfile.NamedTemporaryFile(mode="r", delete=False, suffix=".txt")
-                    with open(fichier.name, "w") as f:
-                        f.write(file_tiff)
-                    result_value = os.system(
-                        f"overlayNtiff -f {fichier.name} -m TOP -b {raster_specifications['nodata']} -c zip -s {raster_specifications['channels']} -p {raster_specifications['photometric']}"
+        checkpoint.load()
+
+        # Fusion des dalles sans outils externes, si le format le permet
+        use_engine = False
+        if config["process"]["engine"] == "PYTHON":
+            if slab.is_handled(pyramid.format):
+                use_engine = True
+            else:
+                logging.warning(
+                    f"Format {pyramid.format} is not handled by the PYTHON engine, external tools are used"
+                )
+
+        with todo_list.open_local(todo_list_tmp, binary=True) as file:
+            roots, offset = todo_list.read_header(file)
+
+            def resolve(item: Tuple[List[List[str]], int]) -> Tuple[List[List[str]], int]:
+                # Chemins éventuellement relatifs aux racines de la todo list
+                for parts in item[0]:
+                    if parts[0] in ("link", "c2w", "w2c"):
+                        parts[1] = todo_list.resolve(parts[1], roots)
+                    if parts[0] == "link":
+                        parts[2] = todo_list.resolve(parts[2], roots)
+                return item
+
+            groups = map(resolve, read_groups(file, max(checkpoint.offset, offset)))
+
+            if config["process"]["workers"] > 1:
+                # Les blocs de fusion sont entièrement traités par les processus, démarrés à neuf
+                # ("spawn") : ils n'héritent pas des clients S3 et Ceph du processus principal, qui ne
+                # supportent pas d'être dupliqués, et créent les leurs
+                merge_executor = ProcessPoolExecutor(
+                    max_workers=config["process"]["workers"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(config, use_engine),
+                )
+                merged = ((group, offset, None) for group, offset in groups)
+            else:
+                merge_executor = None
+
+                def fetch(item: Tuple) -> Tuple:
+                    # Groupe et position, complétés par les sources lues
+                    return (
+                        item[0],
+                        item[1],
+                        read_stage(config, pyramid, item[0], use_engine, scratch),
                     )
-                    if result_value != 0:
-                        raise Exception(f"overlayNtiff raises an error")
-                    storage.remove(f"file://{fichier.name}")
-                    for i in range(len(data)):
-                        storage.remove(f"file://{data[i].name}")
-                        pass
-                    for i in range(len(mask)):
-                        if mask[i] != "":
-                            pass
-                            storage.remove(f"file://{mask[i].name}")
-                    multiple_slabs = False
-
-                if parts[0] == "w2c":
-                    if not have_to_work:
-                        if parts[1] == last_done_slab:
-                            # On est retombé sur la dernière dalles traitées, on passe à la suivante mais on arrête de passer
-                            logging.info(f"Last copied slab reached, copies can start again")
-                            have_to_work = True
-
-                        continue
-
-                    to_tray = storage.get_infos_from_path(parts[1])[2]
-                    if to_tray != "":
-                        os.makedirs(to_tray, exist_ok=True)
-
-                    slab_type = pyramid.get_infos_from_slab_path(parts[1])[0]
-                    if slab_type == SlabType.DATA:
-                        level = pyramid.get_infos_from_slab_path(parts[1])[1]
-                        tile_width = pyramid.tms.get_level(level).tile_width
-                        tile_heigth = pyramid.tms.get_level(level).tile_heigth
-                        result_value = os.system(
-                            f"work2cache -c {compression} -t {tile_width} {tile_heigth} -a {format_channel} -b {bits_channel} -s {raster_specifications['channels']} {result.name} {parts[1]}"
-                        )
-                        if result_value != 0:
-                            raise Exception(f"work2cache raises an error")
-                        storage.remove(f"file://{result.name}")
-                    elif slab_type == SlabType.MASK:
-                        level = pyramid.get_infos_from_slab_path(parts[1])[1]
-                        tile_width = pyramid.tms.get_level(level).tile_width
-                        tile_heigth = pyramid.tms.get_level(level).tile_heigth
-                        result_value = os.system(
-                            f"work2cache -c zip -t {tile_width} {tile_heigth} -a {format_channel} -b {bits_channel} -s {raster_specifications['channels']} {result_mask.name} {parts[1]}"
-                        )
-                        if result_value != 0:
-                            raise Exception(f"work2cache raises an error")
-                        storage.remove(f"file://{result_mask.name}")
+
+                def merge(item: Tuple) -> Tuple:
+                    return item[0], item[1], merge_stage(config, pyramid, item[2], scratch)
+
+                if config["process"]["prefetch"] == 0:
+                    merged = (merge(fetch(item)) for item in groups)
+                else:
+                    # Les groupes suivants sont lus et superposés pendant l'écriture du groupe courant
+                    merged = pipeline.run(groups, [fetch, merge], config["process"]["prefetch"])
+
+            # Liens faits par lots, en parallèle : tâches en cours -> indices de leurs groupes
+            link_executor = ThreadPoolExecutor(max_workers=config["process"]["threads"])
+            progress = OrderedProgress(checkpoint)
+            pending = {}
+            batch = []
+            batch_indices = []
+            max_pending = 2 * (config["process"]["threads"] + config["process"]["workers"])
+
+            try:
+                for group, offset, outputs in merged:
+                    index = progress.add(offset, len(group))
+
+                    if group[0][0] == "link":
+                        batch.append(group)
+                        batch_indices.append(index)
+                        if len(batch) == LINK_BATCH:
+                            pending[link_executor.submit(make_links, batch)] = batch_indices
+                            batch = []
+                            batch_indices = []
+                        links += 1
+
+                    elif merge_executor is not None:
+                        pending[merge_executor.submit(_process_group, group)] = [index]
+                        merges += 1
+
+                    else:
+                        write_stage(pyramid, group, outputs, scratch)
+                        progress.done(index)
+                        merges += 1
+
+                    # On borne le nombre de tâches en attente pour ne pas charger toute la liste en mémoire
+                    if len(pending) >= max_pending:
+                        collect(pending, progress, FIRST_COMPLETED)
+
+                if batch:
+                    pending[link_executor.submit(make_links, batch)] = batch_indices
+                collect(pending, progress, ALL_COMPLETED)
+
+            except Exception:
+                # Les groupes déjà soumis sont terminés avant de propager l'erreur, pour que la
+                # progression sauvegardée les inclue
+                if batch:
+                    pending[link_executor.submit(make_links, batch)] = batch_indices
+                try:
+                    collect(pending, progress, ALL_COMPLETED)
+                except Exception:
+                    pass
+                raise
+
+            finally:
+                merged.close()
+                for future in pending:
+                    future.cancel()
+                link_executor.shutdown()
+                if merge_executor is not None:
+                    merge_executor.shutdown()
+
+        duration = time.time() - start
+        logging.info(
+            f"{links} links made and {merges} slabs merged in {duration:.1f} s ({links / max(duration, 0.001):.1f} links/s)"
+        )
 
         # On nettoie les fichiers locaux et comme tout s'est bien passé, on peut supprimer aussi le fichier local du travail fait
-        todo_list_obj.close()
-        storage.remove(f"file://{todo_list_obj.name}")
-        storage.remove(last_done_fo)
+        storage.remove(f"file://{todo_list_tmp}")
+        checkpoint.remove()
 
     except Exception as e:
-        if last_done_slab is not None:
-            storage.put_data_str(last_done_slab, last_done_fo)
+        checkpoint.save()
         raise Exception(f"Cannot process the todo list: {e}")
+
+    finally:
+        # Fichiers intermédiaires des groupes interrompus
+        scratch.clean()
@@ -0,0 +1,303 @@
+"""Provide functions to merge stacking slabs in process, replacing cache2work, overlayNtiff and work2cache.
+
+Overlay method is TOP : a pixel is taken from the first source (in the todo list's order) where it is
+data, according to the source's mask if provided. Pixels without data in any source get the nodata
+value.
+
+Only the header and the tiles' index of source slabs are read first. Each output tile is then planned
+from the tiles' sizes :
+
+- no source with data : the nodata tile, encoded once per block
+- one source with data, or a top source without mask : its encoded tile is copied, without decoding
+- otherwise : tiles are decoded and overlaid with numpy
+
+Only the needed tiles are read, with one partial read per source slab, and the output slab is written
+in one request. A copied tile keeps the source's pixels outside its mask, which are nodata in slabs
+written by ROK4 tools.
+
+The module contains the following functions:
+
+- `get_nodata` - Nodata value of each channel, from raster specifications
+- `overlay` - Overlay tiles, with the TOP method
+- `read_group` - Read the source slabs' needed tiles of a todo list's block of stacking slabs
+- `merge_sources` - Build the output slabs from the read source slabs
+- `merge_group` - Merge a todo list's block of stacking slabs
+"""
+
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy
+from rok4.enums import SlabType
+from rok4.pyramid import Pyramid
+
+from rok4_tools.global_utils import slab as rok4_slab
+
+
+def get_nodata(raster_specifications: Dict) -> List[float]:
+    """Nodata value of each channel
+
+    Args:
+        raster_specifications (Dict): pyramid's raster specifications, nodata is a comma separated values' string
+
+    Returns:
+        List[float]: nodata value of each channel
+    """
+    nodata = [float(v) for v in str(raster_specifications["nodata"]).split(",")]
+    if len(nodata) == 1:
+        nodata = nodata * raster_specifications["channels"]
+    return nodata
+
+
+def overlay(
+    tiles: Iterable[Tuple[numpy.ndarray, Union[numpy.ndarray, None]]],
+    nodata: List[float],
+    shape: Tuple[int, int, int],
+    dtype: numpy.dtype,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Overlay tiles, with the TOP method : first tile's data is above
+
+    Args:
+        tiles (Iterable[Tuple[numpy.ndarray, Union[numpy.ndarray, None]]]): data and mask (None if all pixels are data) arrays, from the top to the bottom. Read until the output is full
+        nodata (List[float]): nodata value of each channel
+        shape (Tuple[int, int, int]): tile's shape (rows, columns, channels)
+        dtype (numpy.dtype): data type
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: output data and mask (boolean, rows and columns) arrays
+    """
+
+    data = numpy.empty(shape, dtype=dtype)
+    data[:, :] = nodata
+    filled = numpy.zeros(shape[0:2], dtype=bool)
+
+    for tile, mask in tiles:
+        if mask is None:
+            taken = ~filled
+        else:
+            taken = (mask[:, :, 0] != 0) & ~filled
+
+        data[taken] = tile[taken]
+        filled |= taken
+
+        # Les sources suivantes sont entièrement cachées
+        if filled.all():
+            break
+
+    return data, filled
+
+
+def read_group(
+    pyramid: Pyramid, group: List[List[str]]
+) -> Union[
+    Tuple[List[Tuple[rok4_slab.Slab, Union[rok4_slab.Slab, None]]], List[List[int]], str, str], None
+]:
+    """Read the source slabs' needed tiles of a todo list's block of stacking slabs : c2w lines, the oNt line and w2c lines
+
+    Args:
+        pyramid (Pyramid): source pyramid, to identify slabs' types
+        group (List[List[str]]): block's lines, splitted, with absolute paths
+
+    Raises:
+        StorageError: Slab read issue
+        MissingEnvironmentError: Missing object storage informations
+        FormatError: Cannot read a slab
+        Exception: Source slabs do not have the same structure
+
+    Returns:
+        Union[Tuple[List[Tuple[rok4_slab.Slab, Union[rok4_slab.Slab, None]]], List[List[int]], str, str], None]: source data and mask (None if no mask) slabs, sources with data for each tile (indices in source slabs), output data and mask (None if no mask) slabs' paths. None if the block cannot be merged in process (output mask without any source mask)
+    """
+
+    # Dalles sources : une dalle de données suivie éventuellement de son masque
+    sources = []
+    to_data = None
+    to_mask = None
+    for parts in group:
+        if parts[0] == "c2w":
+            if sources and pyramid.get_infos_from_slab_path(parts[1])[0] == SlabType.MASK:
+                sources[-1][1] = parts[1]
+            else:
+                sources.append([parts[1], None])
+
+        elif parts[0] == "w2c":
+            if pyramid.get_infos_from_slab_path(parts[1])[0] == SlabType.MASK:
+                to_mask = parts[1]
+            else:
+                to_data = parts[1]
+
+    if to_mask is not None and all(mask is None for data, mask in sources):
+        # Pas d'en-tête de masque à reprendre
+        return None
+
+    slabs = []
+    for data_path, mask_path in sources:
+        data_slab = rok4_slab.Slab.from_path(data_path, index_only=True)
+        mask_slab = None
+        if mask_path is not None:
+            mask_slab = rok4_slab.Slab.from_path(mask_path, index_only=True)
+        slabs.append((data_slab, mask_slab))
+
+    reference = slabs[0][0]
+    for data_slab, mask_slab in slabs:
+        if data_slab.tiles_count != reference.tiles_count or (
+            data_slab.tile_width,
+            data_slab.tile_height,
+        ) != (reference.tile_width, reference.tile_height):
+            raise Exception(f"Source slabs to merge into {to_data} have different structures")
+
+    # Planification à partir des tailles de tuiles : sources ayant des données, de haut en bas
+    plans = []
+    needed = [([], []) for k in range(len(slabs))]
+    for i in range(reference.tiles_count):
+        stack = []
+        for k, (data_slab, mask_slab) in enumerate(slabs):
+            if data_slab.sizes[i] == 0 or (mask_slab is not None and mask_slab.sizes[i] == 0):
+                continue
+            stack.append(k)
+            if mask_slab is None:
+                # Les sources suivantes sont entièrement cachées
+                break
+
+        plans.append(stack)
+        if len(stack) == 1:
+            needed[stack[0]][0].append(i)
+            if to_mask is not None:
+                needed[stack[0]][1].append(i)
+        elif len(stack) > 1:
+            for k in stack:
+                needed[k][0].append(i)
+                needed[k][1].append(i)
+
+    for (data_slab, mask_slab), (data_indices, mask_indices) in zip(slabs, needed):
+        data_slab.load_tiles(data_indices)
+        if mask_slab is not None:
+            mask_slab.load_tiles(mask_indices)
+
+    return slabs, plans, to_data, to_mask
+
+
+def merge_sources(
+    pyramid: Pyramid,
+    slabs: List[Tuple[rok4_slab.Slab, Union[rok4_slab.Slab, None]]],
+    plans: List[List[int]],
+    to_data: str,
+    to_mask: Union[str, None],
+) -> List[Tuple[str, rok4_slab.Slab]]:
+    """Build the output slabs from the read source slabs : tiles are copied or overlaid, then encoded
+
+    Args:
+        pyramid (Pyramid): source pyramid, to get format and raster specifications
+        slabs (List[Tuple[rok4_slab.Slab, Union[rok4_slab.Slab, None]]]): source data and mask slabs, from read_group
+        plans (List[List[int]]): sources with data for each tile, from read_group
+        to_data (str): output data slab's path
+        to_mask (Union[str, None]): output mask slab's path, None if no mask
+
+    Raises:
+        FormatError: Cannot decode a tile
+
+    Returns:
+        List[Tuple[str, rok4_slab.Slab]]: output slabs to write, with their paths
+    """
+
+    reference = slabs[0][0]
+    format = pyramid.format
+    channels = pyramid.raster_specifications["channels"]
+    nodata = get_nodata(pyramid.raster_specifications)
+    shape = (reference.tile_height, reference.tile_width, channels)
+    dtype = numpy.dtype("float32") if format.endswith("FLOAT32") else numpy.dtype("uint8")
+
+    def decode(
+        i: int, stack: List[int]
+    ) -> Iterator[Tuple[numpy.ndarray, Union[numpy.ndarray, None]]]:
+        # Décodage à la demande : les sources cachées par les précédentes ne sont pas décodées
+        for k in stack:
+            data_slab, mask_slab = slabs[k]
+            tile = rok4_slab.decode_tile(
+                data_slab.tiles[i], format, reference.tile_width, reference.tile_height, channels
+            )
+
+            mask = None
+            if mask_slab is not None:
+                mask = rok4_slab.decode_tile(
+                    mask_slab.tiles[i],
+                    rok4_slab.MASK_FORMAT,
+                    reference.tile_width,
+                    reference.tile_height,
+                    1,
+                )
+
+            yield tile, mask
+
+    def encode_mask(filled: numpy.ndarray) -> bytes:
+        return rok4_slab.encode_tile(
+            (filled * 255).astype("uint8")[:, :, numpy.newaxis], rok4_slab.MASK_FORMAT
+        )
+
+    # Tuiles constantes, encodées une seule fois
+    empty_data = None
+    empty_mask = None
+    full_mask = None
+
+    data_tiles = []
+    mask_tiles = []
+    for i, stack in enumerate(plans):
+        if not stack:
+            if empty_data is None:
+                data, filled = overlay([], nodata, shape, dtype)
+                empty_data = rok4_slab.encode_tile(data, format)
+                empty_mask = encode_mask(filled)
+            data_tiles.append(empty_data)
+            mask_tiles.append(empty_mask)
+
+        elif len(stack) == 1:
+            # Tuile encodée reprise telle quelle
+            data_slab, mask_slab = slabs[stack[0]]
+            data_tiles.append(data_slab.tiles[i])
+            if to_mask is None:
+                continue
+            if mask_slab is not None:
+                mask_tiles.append(mask_slab.tiles[i])
+            else:
+                if full_mask is None:
+                    full_mask = encode_mask(numpy.ones(shape[0:2], dtype=bool))
+                mask_tiles.append(full_mask)
+
+        else:
+            data, filled = overlay(decode(i, stack), nodata, shape, dtype)
+            data_tiles.append(rok4_slab.encode_tile(data, format))
+            if to_mask is not None:
+                mask_tiles.append(encode_mask(filled))
+
+    outputs = [(to_data, rok4_slab.Slab(reference.header, data_tiles))]
+
+    if to_mask is not None:
+        mask_reference = next(mask_slab for data_slab, mask_slab in slabs if mask_slab is not None)
+        outputs.append((to_mask, rok4_slab.Slab(mask_reference.header, mask_tiles)))
+
+    return outputs
+
+
+def merge_group(pyramid: Pyramid, group: List[List[str]]) -> bool:
+    """Merge a todo list's block of stacking slabs : c2w lines, the oNt line and w2c lines
+
+    Args:
+        pyramid (Pyramid): source pyramid, to identify slabs' types and get raster specifications
+        group (List[List[str]]): block's lines, splitted, with absolute paths
+
+    Raises:
+        StorageError: Slab read or write issue
+        MissingEnvironmentError: Missing object storage informations
+        FormatError: Cannot read a slab or decode a tile
+        Exception: Source slabs do not have the same structure
+
+    Returns:
+        bool: False if the block cannot be merged in process (output mask without any source mask), nothing is done then
+    """
+
+    sources = read_group(pyramid, group)
+    if sources is None:
+        return False
+
+    for path, output in merge_sources(pyramid, *sources):
+        output.write(path)
+
+    return True
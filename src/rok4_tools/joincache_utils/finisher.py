@@ -6,6 +6,7 @@ from typing import Dict, List, Tuple, Union
 from rok4 import storage
 from rok4.pyramid import Pyramid
 
+from rok4_tools.global_utils import todo_list
 from rok4_tools.global_utils.source import SourcePyramids
 
 
@@ -13,7 +14,8 @@ def work(config: Dict) -> None:
     """Finisher steps : finalize the pyramid's processing
 
     Expects the configuration and all todo lists. Write the output pyramid's descriptor to the final location,
-    write the output pyramid's list to the final location (from the todo lists) and remove the todo lists
+    write the output pyramid's list to the final location (from the todo lists) and remove the todo lists.
+    The run's manifest, if configured, is then copied to its final location
 
     Args:
         config (Dict): JOINCACHE configuration
@@ -22,6 +24,7 @@ def work(config: Dict) -> None:
         Exception: Cannot load the input or output pyramid
         Exception: Cannot write output pyramid's descriptor
         Exception: Cannot concatenate splits' done lists and write the final output pyramid's list to the final location
+        Exception: Cannot write the manifest to the final location
     """
 
     datasources = []
@@ -74,16 +77,14 @@ def work(config: Dict) -> None:
             to_root = os.path.join(to_pyramid.storage_root, to_pyramid.name)
             list_file_obj.write(f"0={to_root}\n")
 
-            todo_list_obj = tempfile.NamedTemporaryFile(mode="r", delete=False)
-            storage.copy(
-                os.path.join(config["process"]["directory"], f"todo.finisher.list"),
-                f"file://{todo_list_obj.name}",
+            todo_list_tmp = todo_list.download(
+                os.path.join(config["process"]["directory"], "todo.finisher.list")
             )
 
             used_pyramids_roots = {}
 
-            # On ouvre à nouveau en lecture le fichier pour avoir le contenu après la copie
-            todo_list_obj = open(todo_list_obj.name)
+            # On ouvre à nouveau en lecture le fichier (compressé ou non) pour avoir le contenu après la copie
+            todo_list_obj = todo_list.open_local(todo_list_tmp)
             for line in todo_list_obj:
                 line = line.rstrip()
                 list_file_obj.write(f"{line}\n")
@@ -91,38 +92,53 @@ def work(config: Dict) -> None:
                 used_pyramids_roots[index] = root
 
             todo_list_obj.close()
-            storage.remove(f"file://{todo_list_obj.name}")
-            storage.remove(os.path.join(config["process"]["directory"], f"todo.finisher.list"))
+            storage.remove(f"file://{todo_list_tmp}")
+            storage.remove(os.path.join(config["process"]["directory"], "todo.finisher.list"))
 
             list_file_obj.write("#\n")
 
+            if config["process"]["incremental"]:
+                # Dalles inchangées depuis la génération précédente, lignes reprises par le master
+                todo_list_tmp = todo_list.download(
+                    os.path.join(config["process"]["directory"], "todo.kept.list")
+                )
+                todo_list_obj = todo_list.open_local(todo_list_tmp)
+                for line in todo_list_obj:
+                    list_file_obj.write(line)
+                todo_list_obj.close()
+                storage.remove(f"file://{todo_list_tmp}")
+                storage.remove(os.path.join(config["process"]["directory"], "todo.kept.list"))
+
             for i in range(0, config["process"]["parallelization"]):
-                todo_list_obj = tempfile.NamedTemporaryFile(mode="r", delete=False)
-                storage.copy(
-                    os.path.join(config["process"]["directory"], f"todo.{i+1}.list"),
-                    f"file://{todo_list_obj.name}",
+                todo_list_tmp = todo_list.download(
+                    os.path.join(config["process"]["directory"], f"todo.{i+1}.list")
                 )
 
-                # On ouvre à nouveau en lecture le fichier pour avoir le contenu après la copie
-                todo_list_obj = open(todo_list_obj.name)
+                # On ouvre à nouveau en lecture le fichier (compressé ou non) pour avoir le contenu après la copie
+                todo_list_obj = todo_list.open_local(todo_list_tmp)
+                roots = todo_list.read_header(todo_list_obj)[0]
                 for line in todo_list_obj:
                     line = line.rstrip()
                     parts = line.split(" ")
 
                     if parts[0] == "w2c":
-                        storage_type, path, tray, base_name = storage.get_infos_from_path(parts[1])
+                        storage_type, path, tray, base_name = storage.get_infos_from_path(
+                            todo_list.resolve(parts[1], roots)
+                        )
                         # La dalle a été recalculée, elle appartient donc à la pyramide de sortie
                         path = path.replace(to_root, "0")
                         list_file_obj.write(f"{path}\n")
 
                     elif parts[0] == "link":
-                        storage_type, path, tray, base_name = storage.get_infos_from_path(parts[2])
+                        storage_type, path, tray, base_name = storage.get_infos_from_path(
+                            todo_list.resolve(parts[2], roots)
+                        )
                         # On a fait un lien, on met donc dans la liste la racine de la pyramide source
                         path = path.replace(used_pyramids_roots[parts[3]], parts[3])
                         list_file_obj.write(f"{path}\n")
 
                 todo_list_obj.close()
-                storage.remove(f"file://{todo_list_obj.name}")
+                storage.remove(f"file://{todo_list_tmp}")
                 storage.remove(os.path.join(config["process"]["directory"], f"todo.{i+1}.list"))
 
         storage.copy(f"file://{list_file_tmp}", to_pyramid.list)
@@ -132,3 +148,12 @@ def work(config: Dict) -> None:
         raise Exception(
             f"Cannot concatenate splits' done lists and write the final output pyramid's list to the final location: {e}"
         )
+
+    if "manifest" in config["process"]:
+        # Le manifeste n'est publié qu'une fois la génération terminée, pour la prochaine génération incrémentale
+        try:
+            manifest_tmp = os.path.join(config["process"]["directory"], "todo.manifest")
+            storage.copy(manifest_tmp, config["process"]["manifest"])
+            storage.remove(manifest_tmp)
+        except Exception as e:
+            raise Exception(f"Cannot write the manifest to the final location: {e}")
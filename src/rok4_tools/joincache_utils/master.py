@@ -1,13 +1,28 @@
+import hashlib
+import heapq
 import itertools
+import logging
+import multiprocessing
 import os
+import pickle
+import shutil
 import tempfile
-from typing import Dict, List, Tuple, Union
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Dict, Iterator, List, Set, Tuple, Union
 
 from rok4 import storage
 from rok4.enums import PyramidType, SlabType
 from rok4.pyramid import Pyramid
 
+from rok4_tools.global_utils import external_sort, local_cache, slab, todo_list
 from rok4_tools.global_utils.source import SourcePyramids
+from rok4_tools.global_utils.storage_tools import SizesIndex
 
 """Todo list instructions
 
@@ -18,11 +33,440 @@ from rok4_tools.global_utils.source import SourcePyramids
 
 """
 
+# Coût estimé d'une requête au stockage (lecture, écriture ou lien), en octets équivalents : une
+# superposition coûte une requête par dalle lue ou écrite plus le volume lu, un lien une requête
+REQUEST_COST = 65536
 
-def work(config: Dict) -> None:
-    """Master steps : prepare and split copies and merge to do
+# Nombre de liens faits par une même tâche en mode direct, pour limiter le coût des soumissions
+LINK_BATCH = 100
+
+
+def index_slabs(pyramid: Pyramid, level: str) -> Dict[Tuple[SlabType, str, int, int], Dict]:
+    """Index a pyramid's slabs of a level, reading its list once
+
+    Args:
+        pyramid (Pyramid): source pyramid
+        level (str): level's identifier
+
+    Raises:
+        StorageError: Cannot read the pyramid's list
+
+    Returns:
+        Dict[Tuple[SlabType, str, int, int], Dict]: slabs' informations (root, slab...), by (type, level, column, row), in the list's order
+    """
+    return {
+        slab_key: slab_infos for slab_key, slab_infos in local_cache.list_generator(pyramid, level)
+    }
+
+
+def get_stacks(
+    from_pyramids: List[Pyramid], level: str
+) -> Iterator[Tuple[Tuple[SlabType, str, int, int], List[Tuple[int, Dict, Union[Dict, None]]]]]:
+    """Get the stacks of source slabs, with in memory indexes of the source pyramids' slabs
+
+    Stacks are in the source pyramids' lists order.
+
+    Args:
+        from_pyramids (List[Pyramid]): source pyramids, by decreasing priority
+        level (str): level's identifier
+
+    Raises:
+        StorageError: Cannot read a pyramid's list
+
+    Yields:
+        Iterator[Tuple[Tuple[SlabType, str, int, int], List[Tuple[int, Dict, Union[Dict, None]]]]]: data slab's key and its stack : source pyramid's index, data slab's and mask slab's informations (None if no mask), by decreasing priority
+    """
 
-    Load and check input pyramids from the descriptors and write the todo lists, splitting the copies or merge to do
+    # Une seule lecture de la liste de chaque pyramide source
+    indexes = [index_slabs(from_pyramid, level) for from_pyramid in from_pyramids]
+    slab_finish = set()
+
+    for i in range(len(from_pyramids)):
+        for slab_key in indexes[i]:
+            # Vérification si la dalle à déjà été traitée
+            if slab_key[0] == SlabType.MASK or slab_key in slab_finish:
+                continue
+            slab_finish.add(slab_key)
+            mask_key = (SlabType.MASK, slab_key[1], slab_key[2], slab_key[3])
+
+            yield slab_key, [
+                (j, indexes[j][slab_key], indexes[j].get(mask_key))
+                for j in range(i, len(from_pyramids))
+                if slab_key in indexes[j]
+            ]
+
+
+def get_sorted_stacks(
+    from_pyramids: List[Pyramid], level: str, buffer: int
+) -> Iterator[Tuple[Tuple[SlabType, str, int, int], List[Tuple[int, Dict, Union[Dict, None]]]]]:
+    """Get the stacks of source slabs, with an external sort of the source pyramids' slabs
+
+    Slabs of all source pyramids are sorted by position, using local temporary files beyond the buffer
+    size, then stacks are read in one sequential pass. Stacks are in the positions' order.
+
+    Args:
+        from_pyramids (List[Pyramid]): source pyramids, by decreasing priority
+        level (str): level's identifier
+        buffer (int): maximum number of slabs sorted in memory at once
+
+    Raises:
+        StorageError: Cannot read a pyramid's list
+
+    Yields:
+        Iterator[Tuple[Tuple[SlabType, str, int, int], List[Tuple[int, Dict, Union[Dict, None]]]]]: data slab's key and its stack : source pyramid's index, data slab's and mask slab's informations (None if no mask), by decreasing priority
+    """
+
+    slabs = (
+        (i, slab_key, slab_infos)
+        for i in range(len(from_pyramids))
+        for slab_key, slab_infos in local_cache.list_generator(from_pyramids[i], level)
+    )
+    sorted_slabs = external_sort.sort(
+        slabs, key=lambda slab: (slab[1][2], slab[1][3], slab[0]), chunk_size=buffer
+    )
+
+    for position, group in itertools.groupby(
+        sorted_slabs, key=lambda slab: (slab[1][2], slab[1][3])
+    ):
+        data = {}
+        masks = {}
+        for i, slab_key, slab_infos in group:
+            if slab_key[0] == SlabType.MASK:
+                masks[i] = slab_infos
+            else:
+                data[i] = (slab_key, slab_infos)
+
+        if not data:
+            continue
+
+        # Les pyramides sont triées par priorité décroissante au sein d'une position
+        stack = list(data)
+        yield data[stack[0]][0], [(i, data[i][1], masks.get(i)) for i in stack]
+
+
+def get_signature(stack: List[Tuple[int, Dict, Union[Dict, None]]], use_mask: bool) -> str:
+    """Get a stack's signature, changing when a source slab changes
+
+    Source slabs are identified by their root and path, their content by the md5 written in the source
+    pyramids' lists (if present).
+
+    Args:
+        stack (List[Tuple[int, Dict, Union[Dict, None]]]): source pyramid's index, data slab's and mask slab's informations, by decreasing priority
+        use_mask (bool): source masks are used
+
+    Returns:
+        str: stack's signature
+    """
+
+    parts = []
+    for j, infos, mask_infos in stack:
+        parts.append(f"{infos['root']}/{infos['slab']} {infos.get('md5')}")
+        if use_mask and mask_infos is not None:
+            parts.append(f"{mask_infos['root']}/{mask_infos['slab']} {mask_infos.get('md5')}")
+
+    return hashlib.md5("\n".join(parts).encode()).hexdigest()
+
+
+def read_manifest(path: str) -> Dict[Tuple[str, int, int], str]:
+    """Read the manifest of a previous run : stack's signature of each output data slab
+
+    Args:
+        path (str): manifest's path, compressed or not
+
+    Raises:
+        StorageError: Manifest read issue
+        MissingEnvironmentError: Missing object storage informations
+
+    Returns:
+        Dict[Tuple[str, int, int], str]: stacks' signatures, by (level, column, row)
+    """
+
+    manifest = {}
+    manifest_tmp = todo_list.download(path)
+    manifest_obj = todo_list.open_local(manifest_tmp)
+    for line in manifest_obj:
+        level, column, row, signature = line.split()
+        manifest[(level, int(column), int(row))] = signature
+
+    manifest_obj.close()
+    storage.remove(f"file://{manifest_tmp}")
+
+    return manifest
+
+
+def make_links(links: List[Tuple[str, str]]) -> None:
+    """Make a batch of links
+
+    Args:
+        links (List[Tuple[str, str]]): targets and links' paths
+
+    Raises:
+        StorageError: Link issue
+        MissingEnvironmentError: Missing object storage informations
+    """
+
+    for target, link in links:
+        storage.link(target, link)
+
+
+def write_list(to_pyramid: Pyramid, roots: Dict[str, int], list_lines_tmp: str) -> None:
+    """Write the output pyramid's list : roots' table then slabs' lines
+
+    Args:
+        to_pyramid (Pyramid): output pyramid
+        roots (Dict[str, int]): used source pyramids' roots and their index
+        list_lines_tmp (str): local temporary file with slabs' lines, removed once the list is written
+
+    Raises:
+        StorageError: List write issue
+        MissingEnvironmentError: Missing object storage informations
+    """
+
+    with tempfile.NamedTemporaryFile(mode="w", delete=False) as list_file_obj:
+        list_file_tmp = list_file_obj.name
+
+        # En-tête du fichier liste, avec toutes les racines des pyramides utilisées
+        list_file_obj.write(f"0={os.path.join(to_pyramid.storage_root, to_pyramid.name)}\n")
+        for root, index in roots.items():
+            list_file_obj.write(f"{index}={root}\n")
+        list_file_obj.write("#\n")
+
+        with open(list_lines_tmp) as f:
+            shutil.copyfileobj(f, list_file_obj)
+
+    storage.copy(f"file://{list_file_tmp}", to_pyramid.list)
+    storage.remove(f"file://{list_file_tmp}")
+    storage.remove(f"file://{list_lines_tmp}")
+
+
+def plan_level(
+    config: Dict,
+    from_pyramids: List[Pyramid],
+    to_pyramid: Pyramid,
+    level: str,
+    full_tiles: Set[bytes],
+) -> Iterator[Dict]:
+    """Plan a level : read the lists of the source pyramids (and of the output pyramid in incremental mode) and get the source slabs to process for each output slab
+
+    Args:
+        config (Dict): JOINCACHE configuration
+        from_pyramids (List[Pyramid]): source pyramids, by decreasing priority
+        to_pyramid (Pyramid): output pyramid, whose current list is read in incremental mode
+        level (str): level's identifier
+        full_tiles (Set[bytes]): encoded mask tiles already known as full (process.mask_links)
+
+    Raises:
+        StorageError: Cannot read a source pyramid's list
+        Exception: Cannot read the previous output pyramid's list (incremental mode)
+
+    Yields:
+        Iterator[Dict]: planned stack, in the stacks' order : data slab's key (key), stack (stack), source slabs and their roots (process, process_roots), source masks and their roots, "" if no mask (mask, mask_roots), linked because of a full top mask (shortcut), previous output data and mask slabs' informations, None if absent (previous, incremental mode only)
+    """
+
+    # Dalles de la génération précédente, depuis la liste actuelle de la pyramide en sortie
+    previous_index = {}
+    if config["process"]["incremental"]:
+        try:
+            previous_index = index_slabs(to_pyramid, level)
+        except Exception as e:
+            raise Exception(f"Cannot read the previous output pyramid's list: {e}")
+
+    # Piles dont la dalle du dessus a un masque plein : le résultat de la superposition serait
+    # cette dalle, on fait un lien. Les tuiles de masque pleines déjà vues ne sont pas décodées.
+    def is_full(path: str) -> bool:
+        try:
+            return slab.is_full_mask(path, full_tiles)
+        except Exception as e:
+            logging.warning(f"Cannot read the mask {path}, slabs are merged: {e}")
+            return False
+
+    if config["process"]["index"]["mode"] == "SORT":
+        stacks = get_sorted_stacks(from_pyramids, level, config["process"]["index"]["buffer"])
+    else:
+        stacks = get_stacks(from_pyramids, level)
+
+    for slab_key, stack in stacks:
+        # Seule la dalle de la première pyramide est utilisée si on ne fait que des liens
+        if config["process"]["only_links"]:
+            stack = stack[:1]
+
+        process = []
+        process_roots = []
+        mask = []
+        mask_roots = []
+        for j, infos, mask_infos in stack:
+            process += [
+                storage.get_path_from_infos(
+                    from_pyramids[j].storage_type, infos["root"], infos["slab"]
+                )
+            ]
+            process_roots += [
+                storage.get_path_from_infos(from_pyramids[j].storage_type, infos["root"])
+            ]
+
+            # Masque correspondant à la dalle
+            if config["process"]["mask"] and mask_infos is not None:
+                mask += [
+                    storage.get_path_from_infos(
+                        from_pyramids[j].storage_type,
+                        mask_infos["root"],
+                        mask_infos["slab"],
+                    )
+                ]
+                mask_roots += [
+                    storage.get_path_from_infos(from_pyramids[j].storage_type, mask_infos["root"])
+                ]
+            else:
+                mask += [""]
+                mask_roots += [""]
+
+        shortcut = False
+        if (
+            config["process"]["mask_links"]
+            and len(process) > 1
+            and mask[0] != ""
+            and is_full(mask[0])
+        ):
+            process = process[:1]
+            process_roots = process_roots[:1]
+            mask = mask[:1]
+            mask_roots = mask_roots[:1]
+            shortcut = True
+
+        planned = {
+            "key": slab_key,
+            "stack": stack,
+            "process": process,
+            "process_roots": process_roots,
+            "mask": mask,
+            "mask_roots": mask_roots,
+            "shortcut": shortcut,
+        }
+        if config["process"]["incremental"]:
+            mask_key = (SlabType.MASK, slab_key[1], slab_key[2], slab_key[3])
+            planned["previous"] = (previous_index.get(slab_key), previous_index.get(mask_key))
+
+        yield planned
+
+
+# Contexte de chaque processus de planification : pyramides chargées une seule fois au démarrage du
+# processus, et tuiles de masque pleines déjà vues par le processus
+_planner = {}
+
+
+def _init_planner(config: Dict) -> None:
+    _planner["config"] = config
+    _planner["datasources"], _planner["to_pyramid"] = load_pyramids(config)
+    _planner["full_tiles"] = set()
+
+
+def _plan_fragment(datasource: int, level: str) -> str:
+    # Piles planifiées écrites à la suite dans un fichier temporaire, relu par le processus principal
+    with tempfile.NamedTemporaryFile(mode="wb", delete=False) as fragment_obj:
+        fragment_tmp = fragment_obj.name
+        try:
+            for planned in plan_level(
+                _planner["config"],
+                _planner["datasources"][datasource].pyramids,
+                _planner["to_pyramid"],
+                level,
+                _planner["full_tiles"],
+            ):
+                pickle.dump(planned, fragment_obj)
+        except Exception:
+            fragment_obj.close()
+            os.remove(fragment_tmp)
+            raise
+
+    return fragment_tmp
+
+
+def read_fragment(fragment_tmp: str) -> Iterator[Dict]:
+    """Read the planned stacks of a level, written by a planning process
+
+    Args:
+        fragment_tmp (str): local temporary file, removed once read
+
+    Yields:
+        Iterator[Dict]: planned stacks, like plan_level
+    """
+
+    try:
+        with open(fragment_tmp, "rb") as fragment_obj:
+            while True:
+                try:
+                    yield pickle.load(fragment_obj)
+                except EOFError:
+                    break
+    finally:
+        os.remove(fragment_tmp)
+
+
+def plan_levels(
+    config: Dict,
+    datasources: List[SourcePyramids],
+    to_pyramid: Pyramid,
+    levels: List[Tuple[int, str]],
+) -> Iterator[Iterator[Dict]]:
+    """Plan levels, one after another or in parallel by process.planners processes
+
+    Each planning process reads the lists and plans a whole level at once. Planned stacks are returned
+    in the levels' order, as if levels were planned one after another.
+
+    Args:
+        config (Dict): JOINCACHE configuration
+        datasources (List[SourcePyramids]): source pyramids of each datasource
+        to_pyramid (Pyramid): output pyramid
+        levels (List[Tuple[int, str]]): levels to plan : datasource's index and level's identifier
+
+    Raises:
+        StorageError: Cannot read a source pyramid's list
+        Exception: Cannot read the previous output pyramid's list (incremental mode)
+
+    Yields:
+        Iterator[Iterator[Dict]]: planned stacks of each level, like plan_level
+    """
+
+    if config["process"]["planners"] == 1:
+        full_tiles = set()
+        for datasource, level in levels:
+            yield plan_level(
+                config, datasources[datasource].pyramids, to_pyramid, level, full_tiles
+            )
+        return
+
+    # Processus démarrés à neuf ("spawn") : ils n'héritent pas des clients S3 et Ceph du processus
+    # principal, qui ne supportent pas d'être dupliqués, et rechargent eux-mêmes les pyramides
+    executor = ProcessPoolExecutor(
+        max_workers=config["process"]["planners"],
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_planner,
+        initargs=(config,),
+    )
+    futures = []
+    read = 0
+    try:
+        for datasource, level in levels:
+            futures.append(executor.submit(_plan_fragment, datasource, level))
+
+        for future in futures:
+            fragment_tmp = future.result()
+            read += 1
+            yield read_fragment(fragment_tmp)
+
+    finally:
+        # Arrêt anticipé (erreur) : les niveaux pas encore planifiés sont abandonnés et les fragments
+        # déjà écrits mais pas lus sont supprimés
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+        for future in futures[read:]:
+            if not future.cancelled() and future.exception() is None:
+                os.remove(future.result())
+
+
+def load_pyramids(config: Dict) -> Tuple[List[SourcePyramids], Pyramid]:
+    """Load and check the source pyramids of each datasource, and create the output pyramid
 
     Args:
         config (Dict): JOINCACHE configuration
@@ -31,8 +475,9 @@ def work(config: Dict) -> None:
         Exception: Cannot load the input or the output pyramid
         Exception: S3 cluster host have not to be provided into bucket names (output or inputs)
         Exception: Sources pyramid have different features
-        Exception: Cannot open stream to write todo lists
-        Exception: Cannot copy todo lists
+
+    Returns:
+        Tuple[List[SourcePyramids], Pyramid]: source pyramids of each datasource and output pyramid, without level
     """
 
     datasources = []
@@ -71,7 +516,7 @@ def work(config: Dict) -> None:
 
         # Vérification du type des pyramides
         if sources.type != PyramidType.RASTER:
-            raise Exception(f"Some sources pyramids are not a raster")
+            raise Exception("Some sources pyramids are not a raster")
 
         datasources += [sources]
 
@@ -98,30 +543,114 @@ def work(config: Dict) -> None:
             f"Do not set S3 cluster host into output bucket name ({config['pyramid']['root']}) : only one cluster can be used with JOINCACHE"
         )
 
+    return datasources, to_pyramid
+
+
+def work(config: Dict) -> None:
+    """Master steps : prepare and split copies and merge to do
+
+    Load and check input pyramids from the descriptors and write the todo lists, splitting the copies or merge to do.
+    In direct mode (only links), links are made by the master, which writes the output pyramid's descriptor and list.
+    In incremental mode, only slabs whose stack changed since the previous run (manifest) are processed.
+    With process.mask_links, a stack whose top source mask is full is linked rather than merged
+
+    Args:
+        config (Dict): JOINCACHE configuration
+
+    Raises:
+        Exception: Cannot load the input or the output pyramid
+        Exception: S3 cluster host have not to be provided into bucket names (output or inputs)
+        Exception: Sources pyramid have different features
+        Exception: Cannot open stream to write todo lists
+        Exception: Cannot copy todo lists
+        Exception: Cannot write output pyramid's descriptor or list (direct mode)
+        Exception: Cannot read the previous manifest or output pyramid's list (incremental mode)
+    """
+
+    datasources, to_pyramid = load_pyramids(config)
+
+    # Mode direct : les liens sont faits et le fichier liste écrit par le master, sans todo lists
+    direct = config["process"]["direct"]
+    link_executor = None
+    pending = set()
+    batch = []
+    links_count = 0
+    start = time.time()
+
+    # Mode incrémental : seules les dalles dont la pile de dalles sources a changé depuis la
+    # génération précédente (manifeste) sont recalculées, les autres lignes de la liste sont reprises
+    incremental = config["process"]["incremental"]
+    previous_manifest = {}
+    if incremental:
+        try:
+            previous_manifest = read_manifest(config["process"]["manifest"])
+        except Exception as e:
+            raise Exception(f"Cannot read the previous manifest: {e}")
+    kept = 0
+    recomputed = 0
+
     # Ouverture des flux vers les listes de travail à faire
+    indexed = config["process"]["todo_format"] == 2
     temp_agent_todos = []
     temp_finisher_todo = None
+    temp_manifest = None
+    temp_kept = None
     try:
-        for i in range(0, config["process"]["parallelization"]):
-            tmp = tempfile.NamedTemporaryFile(mode="w", delete=False)
-            temp_agent_todos.append(tmp)
-
-        temp_finisher_todo = tempfile.NamedTemporaryFile(mode="w", delete=False)
+        if direct:
+            link_executor = ThreadPoolExecutor(max_workers=config["process"]["threads"])
+            with tempfile.NamedTemporaryFile(mode="w", delete=False) as tmp:
+                list_lines_tmp = tmp.name
+            list_lines_obj = open(list_lines_tmp, "w")
+            temp_kept = list_lines_obj
+        else:
+            for i in range(0, config["process"]["parallelization"]):
+                temp_agent_todos.append(
+                    todo_list.TodoListWriter(config["process"]["compression"], indexed)
+                )
+
+            temp_finisher_todo = todo_list.TodoListWriter(config["process"]["compression"])
+            if incremental:
+                temp_kept = todo_list.TodoListWriter(config["process"]["compression"])
+
+        if "manifest" in config["process"]:
+            temp_manifest = todo_list.TodoListWriter(config["process"]["compression"])
 
     except Exception as e:
         raise Exception(f"Cannot open stream to write todo lists: {e}")
 
-    round_robin = itertools.cycle(temp_agent_todos)
+    round_robin = itertools.cycle(range(0, config["process"]["parallelization"]))
+
+    # Répartition par coût : tas des coûts estimés déjà attribués à chaque liste, le groupe de
+    # commandes suivant va toujours dans la liste la moins chargée
+    balance_by_cost = config["process"]["balancing"] == "COST"
+    splits_heap = [(0, i) for i in range(0, config["process"]["parallelization"])]
+    splits_groups = [0] * config["process"]["parallelization"]
+    splits_cost = [0] * config["process"]["parallelization"]
+
+    # Index des tailles des dalles sources, rempli par un listage complet de chaque racine rencontrée
+    sizes_index = SizesIndex()
+
+    # Racine de la pyramide de sortie, pour des chemins relatifs dans les todo lists
+    to_root_path = ""
+    if indexed:
+        to_root_path = storage.get_path_from_infos(
+            to_pyramid.storage_type, to_pyramid.storage_root, to_pyramid.name
+        )
+
+    shortcuts = 0
 
-    slab_finish = []
     level_finish = []
     used_pyramids_roots = {}
-    used_pyramids_count = 0
 
-    for sources in datasources:
-        from_pyramids = sources.pyramids
-        levels = from_pyramids[0].get_levels(sources.bottom, sources.top)
-        for level in levels:
+    def get_root_index(root: str) -> int:
+        # Index de la racine d'une pyramide source vers laquelle on fait des liens, pour le fichier liste
+        if root not in used_pyramids_roots:
+            used_pyramids_roots[root] = len(used_pyramids_roots) + 1
+        return used_pyramids_roots[root]
+
+    levels = []
+    for i, sources in enumerate(datasources):
+        for level in sources.pyramids[0].get_levels(sources.bottom, sources.top):
             # Vérification que plusieurs datasources ne définissent pas un même niveau
             if level.id not in level_finish:
                 try:
@@ -134,123 +663,176 @@ def work(config: Dict) -> None:
             else:
                 raise Exception(f"Different datasources cannot define the same level : {level.id}")
 
-            for i in range(len(from_pyramids)):
-                # Récupération des dalles de la pyramide
-                slabs = from_pyramids[i].list_generator(level.id)
-                slabs_mask = from_pyramids[i].list_generator(level.id)
-                # Vérification si la dalle à déjà été traitée
-                for slab in slabs:
-                    if slab[0] in slab_finish:
-                        continue
-                    if slab[0][0].name == "MASK":
-                        continue
-                    from_slab_path = storage.get_path_from_infos(
-                        from_pyramids[i].storage_type, slab[1]["root"], slab[1]["slab"]
-                    )
-                    process = [from_slab_path]
-                    slab_finish += [slab[0]]
-
-                    # Recherche du masque correspondant à la dalle
-                    if config["process"]["mask"]:
-                        slab_mask = (
-                            (SlabType["MASK"], slab[0][1], slab[0][2], slab[0][3]),
-                            slab[1],
-                        )
-                        slab_mask[1]["slab"] = from_pyramids[i].get_slab_path_from_infos(
-                            SlabType["MASK"], slab[0][1], slab[0][2], slab[0][3], False
-                        )
-                        if slab_mask in slabs_mask:
-                            mask = [
-                                storage.get_path_from_infos(
-                                    from_pyramids[i].storage_type,
-                                    slab_mask[1]["root"],
-                                    slab_mask[1]["slab"],
-                                )
-                            ]
-                        else:
-                            mask = [""]
-
-                    # Recherche de la dalle dans d'autres pyramides sources
-                    if not config["process"]["only_links"]:
-                        for j in range(i + 1, len(from_pyramids)):
-                            slabs_other = from_pyramids[j].list_generator(level.id)
-                            slabs_other_mask = from_pyramids[j].list_generator(level.id)
-                            for slab_other in slabs_other:
-                                if slab_other[0] == slab[0]:
-                                    from_slab_path_other = storage.get_path_from_infos(
-                                        from_pyramids[j].storage_type,
-                                        slab_other[1]["root"],
-                                        slab_other[1]["slab"],
-                                    )
-                                    process += [from_slab_path_other]
-                                    if config["process"]["mask"]:
-                                        slab_mask_other = (
-                                            (
-                                                SlabType["MASK"],
-                                                slab_other[0][1],
-                                                slab_other[0][2],
-                                                slab_other[0][3],
-                                            ),
-                                            slab_other[1],
-                                        )
-                                        slab_mask_other[1]["slab"] = from_pyramids[
-                                            j
-                                        ].get_slab_path_from_infos(
-                                            SlabType["MASK"],
-                                            slab_other[0][1],
-                                            slab_other[0][2],
-                                            slab_other[0][3],
-                                            False,
-                                        )
-                                        if slab_mask_other in slabs_other_mask:
-                                            mask += [
-                                                storage.get_path_from_infos(
-                                                    from_pyramids[i].storage_type,
-                                                    slab_mask_other[1]["root"],
-                                                    slab_mask_other[1]["slab"],
-                                                )
-                                            ]
-                                        else:
-                                            mask += [""]
-                                    continue
-
-                    to_slab_path = to_pyramid.get_slab_path_from_infos(
-                        slab[0][0], slab[0][1], slab[0][2], slab[0][3]
-                    )
-                    if config["pyramid"]["mask"]:
-                        to_slab_path_mask = to_pyramid.get_slab_path_from_infos(
-                            SlabType["MASK"], slab[0][1], slab[0][2], slab[0][3]
-                        )
-
-                    # Ecriture des commandes dans les todo-lists
-                    if len(process) == 1:
-                        if slab[1]["root"] in used_pyramids_roots:
-                            root_index = used_pyramids_roots[slab[1]["root"]]
-                        else:
-                            used_pyramids_count += 1
-                            root_index = used_pyramids_count
-                            used_pyramids_roots[slab[1]["root"]] = used_pyramids_count
-
-                        next(round_robin).write(
-                            f"link {to_slab_path} {from_slab_path} {root_index}\n"
-                        )
-                        if config["pyramid"]["mask"]:
-                            if mask[0] != "":
-                                next(round_robin).write(
-                                    f"link {to_slab_path_mask} {mask[0]} {root_index}\n"
-                                )
-                    else:
-                        command = ""
-                        for j in range(len(process)):
-                            command += f"c2w {process[j]}\n"
-                            if config["process"]["mask"]:
-                                if mask[j] != "":
-                                    command += f"c2w {mask[j]}\n"
-                        command += "oNt\n"
-                        command += f"w2c {to_slab_path}\n"
-                        if config["pyramid"]["mask"]:
-                            command += f"w2c {to_slab_path_mask}\n"
-                        next(round_robin).write(command)
+            levels.append((i, level.id))
+
+    # Planification des niveaux (lecture des listes et piles de dalles sources), éventuellement en
+    # parallèle, puis répartition des commandes dans l'ordre des niveaux
+    for planned_stacks in plan_levels(config, datasources, to_pyramid, levels):
+        for planned in planned_stacks:
+            slab_key = planned["key"]
+            stack = planned["stack"]
+            slab_infos = stack[0][1]
+            process = planned["process"]
+            process_roots = planned["process_roots"]
+            mask = planned["mask"]
+            mask_roots = planned["mask_roots"]
+            if planned["shortcut"]:
+                shortcuts += 1
+
+            to_slab_path = to_pyramid.get_slab_path_from_infos(
+                slab_key[0], slab_key[1], slab_key[2], slab_key[3]
+            )
+            if config["pyramid"]["mask"]:
+                to_slab_path_mask = to_pyramid.get_slab_path_from_infos(
+                    SlabType.MASK, slab_key[1], slab_key[2], slab_key[3]
+                )
+
+            if temp_manifest is not None:
+                signature = get_signature(stack, config["process"]["mask"])
+                temp_manifest.write(f"{slab_key[1]} {slab_key[2]} {slab_key[3]} {signature}\n")
+
+            if incremental:
+                # Dalles en sortie de la génération précédente : données puis masque, s'il a été
+                # écrit (superposition, ou lien vers le masque de l'unique source)
+                previous = [(planned["previous"][0], to_slab_path)]
+                if config["pyramid"]["mask"] and (len(process) > 1 or mask[0] != ""):
+                    previous.append((planned["previous"][1], to_slab_path_mask))
+
+                if previous_manifest.get(slab_key[1:]) == signature and all(
+                    infos is not None for infos, path in previous
+                ):
+                    # Pile inchangée, on reprend les lignes de la liste précédente
+                    for infos, path in previous:
+                        root_index = get_root_index(infos["root"]) if infos["link"] else 0
+                        line = f"{root_index}/{infos['slab']}"
+                        if infos["md5"] is not None:
+                            line += f" {infos['md5']}"
+                        temp_kept.write(f"{line}\n")
+                    kept += 1
+                    continue
+
+                # Un lien précédent vers une dalle désormais superposée est supprimé par l'agent, juste
+                # avant l'écriture : la pyramide publiée reste cohérente si le traitement échoue avant
+                recomputed += 1
+
+            if direct:
+                # Une seule dalle source, liens faits par lots et en parallèle
+                root_index = get_root_index(slab_infos["root"])
+                batch.append((process[0], to_slab_path))
+                list_lines_obj.write(f"{root_index}/{slab_infos['slab']}\n")
+                if config["pyramid"]["mask"] and mask[0] != "":
+                    batch.append((mask[0], to_slab_path_mask))
+                    mask_root_index = get_root_index(stack[0][2]["root"])
+                    list_lines_obj.write(f"{mask_root_index}/{stack[0][2]['slab']}\n")
+
+                if len(batch) >= LINK_BATCH:
+                    links_count += len(batch)
+                    pending.add(link_executor.submit(make_links, batch))
+                    batch = []
+
+                # On borne le nombre de lots en attente
+                if len(pending) >= 2 * config["process"]["threads"]:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                continue
+
+            # Coût estimé du groupe de commandes
+            if len(process) == 1:
+                links = 2 if config["pyramid"]["mask"] and mask[0] != "" else 1
+                cost = links * REQUEST_COST
+            else:
+                writes = 2 if config["pyramid"]["mask"] else 1
+                cost = writes * REQUEST_COST
+                for j in range(len(process)):
+                    cost += REQUEST_COST
+                    if balance_by_cost:
+                        cost += sizes_index.get_size(process_roots[j], process[j]) or 0
+                    if mask[j] != "":
+                        cost += REQUEST_COST
+                        if balance_by_cost:
+                            cost += sizes_index.get_size(mask_roots[j], mask[j]) or 0
+
+            # Les commandes de la dalle de données et de son masque vont dans la même liste
+            if balance_by_cost:
+                split_cost, split = heapq.heappop(splits_heap)
+                heapq.heappush(splits_heap, (split_cost + cost, split))
+            else:
+                split = next(round_robin)
+
+            splits_groups[split] += 1
+            splits_cost[split] += cost
+            todo = temp_agent_todos[split]
+
+            # Ecriture des commandes dans les todo-lists
+            if len(process) == 1:
+                root_index = get_root_index(slab_infos["root"])
+
+                command = f"link {todo.get_path(to_root_path, to_slab_path)} {todo.get_path(process_roots[0], process[0])} {root_index}\n"
+                if config["pyramid"]["mask"] and mask[0] != "":
+                    command += f"link {todo.get_path(to_root_path, to_slab_path_mask)} {todo.get_path(mask_roots[0], mask[0])} {root_index}\n"
+                todo.write(command)
+            else:
+                command = ""
+                for j in range(len(process)):
+                    command += f"c2w {todo.get_path(process_roots[j], process[j])}\n"
+                    if mask[j] != "":
+                        command += f"c2w {todo.get_path(mask_roots[j], mask[j])}\n"
+                command += "oNt\n"
+                command += f"w2c {todo.get_path(to_root_path, to_slab_path)}\n"
+                if config["pyramid"]["mask"]:
+                    command += f"w2c {todo.get_path(to_root_path, to_slab_path_mask)}\n"
+                todo.write(command)
+
+    if direct:
+        try:
+            if batch:
+                links_count += len(batch)
+                pending.add(link_executor.submit(make_links, batch))
+            for future in wait(pending).done:
+                future.result()
+        finally:
+            link_executor.shutdown()
+
+        logging.info(f"{links_count} links made in {time.time() - start:.1f} s")
+        if incremental:
+            logging.info(f"{kept} slabs unchanged, {recomputed} slabs recomputed")
+
+        list_lines_obj.close()
+        try:
+            to_pyramid.write_descriptor()
+        except Exception as e:
+            raise Exception(f"Cannot write output pyramid's descriptor to final location: {e}")
+
+        try:
+            write_list(to_pyramid, used_pyramids_roots, list_lines_tmp)
+        except Exception as e:
+            raise Exception(
+                f"Cannot write the final output pyramid's list to the final location: {e}"
+            )
+
+        if temp_manifest is not None:
+            try:
+                temp_manifest.upload(config["process"]["manifest"])
+            except Exception as e:
+                raise Exception(f"Cannot write the manifest to the final location: {e}")
+
+        return
+
+    if incremental:
+        logging.info(f"{kept} slabs unchanged, {recomputed} slabs to recompute")
+    if config["process"]["mask_links"]:
+        logging.info(
+            f"{shortcuts} slabs linked rather than merged, their top source mask being full"
+        )
+
+    for i in range(0, config["process"]["parallelization"]):
+        if balance_by_cost:
+            logging.info(
+                f"Todo list {i+1} : {splits_groups[i]} slabs to process, estimated cost {splits_cost[i]}"
+            )
+        else:
+            logging.info(f"Todo list {i+1} : {splits_groups[i]} slabs to process")
 
     for root in used_pyramids_roots:
         temp_finisher_todo.write(f"{used_pyramids_roots[root]}={root}\n")
@@ -258,20 +840,19 @@ def work(config: Dict) -> None:
     # Copie des listes de recopies à l'emplacement partagé (peut être du stockage objet)
     try:
         for i in range(0, config["process"]["parallelization"]):
-            tmp = temp_agent_todos[i]
-            tmp.close()
-            storage.copy(
-                f"file://{tmp.name}",
-                os.path.join(config["process"]["directory"], f"todo.{i+1}.list"),
+            temp_agent_todos[i].upload(
+                os.path.join(config["process"]["directory"], f"todo.{i+1}.list")
             )
-            storage.remove(f"file://{tmp.name}")
 
-        temp_finisher_todo.close()
-        storage.copy(
-            f"file://{temp_finisher_todo.name}",
-            os.path.join(config["process"]["directory"], f"todo.finisher.list"),
+        temp_finisher_todo.upload(
+            os.path.join(config["process"]["directory"], "todo.finisher.list")
         )
-        storage.remove(f"file://{temp_finisher_todo.name}")
+
+        # Lignes reprises de la liste précédente et manifeste, finalisés par le finisher
+        if temp_kept is not None:
+            temp_kept.upload(os.path.join(config["process"]["directory"], "todo.kept.list"))
+        if temp_manifest is not None:
+            temp_manifest.upload(os.path.join(config["process"]["directory"], "todo.manifest"))
 
     except Exception as e:
         raise Exception(f"Cannot copy todo lists to final location and clean: {e}")
@@ -9,8 +9,10 @@ from json.decoder import JSONDecodeError
 
 from jsonschema import ValidationError, validate
 from rok4 import storage
+from rok4.enums import StorageType
 
 from rok4_tools import __version__
+from rok4_tools.global_utils import todo_list
 from rok4_tools.pyr2pyr_utils.agent import work as agent_work
 from rok4_tools.pyr2pyr_utils.finisher import work as finisher_work
 from rok4_tools.pyr2pyr_utils.master import work as master_work
@@ -109,17 +111,57 @@ def configuration() -> None:
     if "parallelization" not in config["process"]:
         config["process"]["parallelization"] = 1
 
-    if args.role == "agent" and args.split > config["process"]["parallelization"]:
+    if "mode" not in config["process"]:
+        config["process"]["mode"] = "SPLIT"
+
+    if "queue" not in config["process"]:
+        config["process"]["queue"] = {}
+    config["process"]["queue"].setdefault("chunk_size", 1000)
+    config["process"]["queue"].setdefault("lease", 600)
+
+    if config["process"]["mode"] == "QUEUE":
+        # Les baux sont posés par création exclusive, possible uniquement sur ces stockages
+        directory_type = storage.get_infos_from_path(config["process"]["directory"])[0]
+        if directory_type not in [StorageType.FILE, StorageType.S3]:
+            raise Exception(
+                f"Queue mode needs a processing directory on FILE or S3 storage: {config['process']['directory']}"
+            )
+
+    elif args.role == "agent" and args.split > config["process"]["parallelization"]:
         raise Exception(
             f"Split number have to be consistent with the parallelization level: {args.split} > {config['process']['parallelization']}"
         )
 
+    if "balancing" not in config["process"]:
+        config["process"]["balancing"] = "COUNT"
+
+    if "threads" not in config["process"]:
+        config["process"]["threads"] = 1
+
+    if "checkpoint" not in config["process"]:
+        config["process"]["checkpoint"] = {}
+    config["process"]["checkpoint"].setdefault("lines", 10000)
+    config["process"]["checkpoint"].setdefault("seconds", 60)
+
+    if "compression" not in config["process"]:
+        config["process"]["compression"] = "NONE"
+
+    if config["process"]["compression"] == "ZSTD" and not todo_list.ZSTD_AVAILABLE:
+        logging.warning("zstandard package is not installed, todo lists are compressed with gzip")
+        config["process"]["compression"] = "GZIP"
+
+    if "todo_format" not in config["process"]:
+        config["process"]["todo_format"] = 1
+
     if "follow_links" not in config["process"]:
         config["process"]["follow_links"] = False
 
     if "slab_limit" not in config["process"]:
         config["process"]["slab_limit"] = 0
 
+    if "incremental" not in config["process"]:
+        config["process"]["incremental"] = False
+
     # Logger
     if "logger" in config:
         # On supprime l'ancien logger (celui configuré par défaut) et on le reconfigure avec les nouveaux paramètres
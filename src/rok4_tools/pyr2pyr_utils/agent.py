@@ -1,60 +1,115 @@
+import json
 import logging
 import os
-import tempfile
-from typing import Dict, List, Tuple, Union
+import socket
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict
 
 from rok4 import storage
-from rok4.pyramid import Pyramid
 
+from rok4_tools.global_utils import storage_tools, todo_list, work_queue
+from rok4_tools.global_utils.checkpoint import Checkpoint
 
-def work(config: Dict, split: int) -> None:
-    """Agent steps : make slabs' copy
 
-    Expects the configuration, the todo list and the optionnal last done slab name : if exists, work
-    does not start from the beginning, but after the last copied slab. This file contains only the
-    destination path of the last processed slab.
+def copy_todo_list(
+    config: Dict, todo_list_path: str, checkpoint_path: str, heartbeat: Callable[[], None] = None
+) -> int:
+    """Make the slabs' copies of a todo list
 
-    For each line in the todo list, a slab copy is done.
+    Expects the todo list and the optionnal checkpoint : if exists, work does not start from the
+    beginning, but at the saved offset in the todo list, after the already copied lines.
+
+    For each line in the todo list, a slab copy is done (server-side when source and destination are
+    on the same object storage cluster). Copies are made by a pool of threads (process.threads), so
+    they can end in any order : the checkpoint only moves forward when all the previous lines are
+    copied. It is saved every process.checkpoint.lines lines or process.checkpoint.seconds seconds, and
+    when an error occurs.
 
     Args:
         config (Dict): PYR2PYR configuration
-        split (int): Split number
+        todo_list_path (str): todo list's path
+        checkpoint_path (str): checkpoint's path
+        heartbeat (Callable[[], None], optional): called regularly while copies are made, can interrupt the work raising an exception. Defaults to None.
 
     Raises:
         Exception: Cannot get todo list
         Exception: Invalid todo list line
+        LeaseLostError: Interruption by the heartbeat, in queue mode
         storageError: Slab copy issue
         MissingEnvironmentError: Missing object storage informations
+
+    Returns:
+        int: number of copied slabs
     """
 
     # On récupère la todo list sous forme de fichier temporaire
     try:
-        todo_list_obj = tempfile.NamedTemporaryFile(mode="r", delete=False)
-        storage.copy(
-            os.path.join(config["process"]["directory"], f"todo.{split}.list"),
-            f"file://{todo_list_obj.name}",
-        )
+        todo_list_tmp = todo_list.download(todo_list_path)
 
     except Exception as e:
         raise Exception(f"Cannot copy todo lists to final location: {e}")
 
-    last_done_slab = None
-    have_to_work = True
-    last_done_fo = os.path.join(config["process"]["directory"], f"slab.{split}.last")
+    checkpoint = Checkpoint(
+        checkpoint_path,
+        config["process"]["checkpoint"]["lines"],
+        config["process"]["checkpoint"]["seconds"],
+    )
+
+    # Copies en cours : futur -> numéro de ligne, lignes terminées au-delà de la progression
+    # sauvegardée et offset de la fin de chaque ligne en cours
+    pending = {}
+    finished = set()
+    line_ends = {}
+
+    def collect(return_when: str) -> None:
+        """Wait for pending copies and move the checkpoint forward"""
+
+        done, not_done = wait(pending, return_when=return_when)
+        error = None
+        for future in done:
+            index = pending.pop(future)
+            if future.exception() is not None:
+                # Erreur propagée une fois les copies réussies prises en compte
+                error = error or future.exception()
+            else:
+                finished.add(index)
+
+        # On avance tant que les lignes suivantes sont terminées
+        done_lines = checkpoint.lines
+        while done_lines in finished:
+            finished.remove(done_lines)
+            done_lines += 1
+
+        if done_lines != checkpoint.lines:
+            offset = line_ends[done_lines - 1]
+            for index in range(checkpoint.lines, done_lines):
+                del line_ends[index]
+            checkpoint.update(offset, done_lines)
+
+        if error is not None:
+            raise error
+
+        if heartbeat is not None:
+            heartbeat()
+
+    executor = ThreadPoolExecutor(max_workers=config["process"]["threads"])
 
     try:
-        if storage.exists(last_done_fo):
-            last_done_slab = storage.get_data_str(last_done_fo)
-            logging.info(
-                f"The last done slab file exists, last slab to have been copied is {last_done_slab}"
-            )
-            have_to_work = False
-
-        # On ouvre à nouveau en lecture le fichier pour avoir le contenu après la copie
-        todo_list_obj = open(todo_list_obj.name)
-
-        for line in todo_list_obj:
-            line = line.rstrip()
+        checkpoint.load()
+        first_line = checkpoint.lines
+
+        # On ouvre en lecture le fichier (compressé ou non), directement à la fin de la dernière
+        # ligne traitée, ou après la table des racines
+        todo_list_obj = todo_list.open_local(todo_list_tmp, binary=True)
+        roots, offset = todo_list.read_header(todo_list_obj)
+        if checkpoint.offset > offset:
+            offset = checkpoint.offset
+        todo_list.seek_forward(todo_list_obj, offset)
+
+        for index, line in enumerate(todo_list_obj, start=first_line):
+            offset += len(line)
+            line = line.decode().rstrip()
             parts = line.split(" ")
 
             if (len(parts) != 3 and len(parts) != 4) or parts[0] != "cp":
@@ -62,27 +117,133 @@ def work(config: Dict, split: int) -> None:
                     f"Invalid todo list line: we need a cp command and 3 or 4 more elements (source and destination): {line}"
                 )
 
-            if not have_to_work:
-                if parts[2] == last_done_slab:
-                    # On est retombé sur la dernière dalles traitées, on passe à la suivante mais on arrête de passer
-                    logging.info(f"Last copied slab reached, copies can start again")
-                    have_to_work = True
-
-                continue
-
             slab_md5 = None
             if len(parts) == 4:
                 slab_md5 = parts[3]
 
-            storage.copy(parts[1], parts[2], slab_md5)
-            last_done_slab = parts[2]
+            pending[
+                executor.submit(
+                    storage_tools.copy,
+                    todo_list.resolve(parts[1], roots),
+                    todo_list.resolve(parts[2], roots),
+                    slab_md5,
+                )
+            ] = index
+            line_ends[index] = offset
+
+            # On borne le nombre de copies en attente pour ne pas charger toute la liste en mémoire
+            if len(pending) >= 2 * config["process"]["threads"]:
+                collect(FIRST_COMPLETED)
+
+        collect(ALL_COMPLETED)
+        executor.shutdown()
+
+        logging.info(f"{checkpoint.lines - first_line} slabs copied")
 
         # On nettoie les fichiers locaux et comme tout s'est bien passé, on peut supprimer aussi le fichier local du travail fait
         todo_list_obj.close()
-        storage.remove(f"file://{todo_list_obj.name}")
-        storage.remove(last_done_fo)
+        storage.remove(f"file://{todo_list_tmp}")
+        checkpoint.remove()
+
+        return checkpoint.lines - first_line
 
     except Exception as e:
-        if last_done_slab is not None:
-            storage.put_data_str(last_done_slab, last_done_fo)
+        # Les copies pas encore commencées sont abandonnées, on attend celles en cours
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+        if isinstance(e, work_queue.LeaseLostError):
+            # La progression appartient maintenant à l'agent qui a repris le morceau
+            raise
+
+        checkpoint.save()
         raise Exception(f"Cannot process the todo list: {e}")
+
+
+def work_queue_mode(config: Dict, split: int) -> None:
+    """Agent steps in queue mode : claim chunks and make their slabs' copies, until all are done
+
+    A chunk without lease or with an expired lease is claimed, its copies are made while the lease is
+    renewed, then it is marked as done. When all not done chunks are claimed by other agents, we wait
+    for them to be done or their leases to expire.
+
+    Args:
+        config (Dict): PYR2PYR configuration
+        split (int): Split number, used as agent's identifier
+
+    Raises:
+        Exception: Cannot read the queue
+        Exception: Cannot process a chunk
+        storageError: Slab copy issue
+        MissingEnvironmentError: Missing object storage informations
+    """
+
+    directory = config["process"]["directory"]
+    owner = f"{socket.gethostname()}:{os.getpid()}:{split}"
+
+    try:
+        chunks = json.loads(storage.get_data_str(os.path.join(directory, "queue.json")))["chunks"]
+    except Exception as e:
+        raise Exception(f"Cannot read the queue's description: {e}")
+
+    processed_chunks = 0
+    while True:
+        lease, remaining = work_queue.claim(
+            directory, chunks, owner, config["process"]["queue"]["lease"]
+        )
+
+        if lease is None:
+            if remaining == 0:
+                break
+
+            # Tous les morceaux restants sont en cours de traitement par d'autres agents
+            logging.debug(f"{remaining} chunks not done and all claimed, wait")
+            time.sleep(work_queue.POLL_INTERVAL)
+            continue
+
+        logging.info(f"Chunk {lease.chunk} claimed ({remaining} chunks not done)")
+
+        try:
+            copy_todo_list(
+                config,
+                work_queue.get_chunk_path(directory, lease.chunk, "list"),
+                work_queue.get_chunk_path(directory, lease.chunk, "checkpoint"),
+                heartbeat=lease.renew,
+            )
+        except work_queue.LeaseLostError as e:
+            logging.warning(e)
+            continue
+
+        storage.put_data_str(owner, work_queue.get_chunk_path(directory, lease.chunk, "done"))
+        processed_chunks += 1
+
+    logging.info(f"All chunks are done, {processed_chunks} processed by this agent")
+
+
+def work(config: Dict, split: int) -> None:
+    """Agent steps : make slabs' copy
+
+    Expects the configuration, the todo list and the optionnal checkpoint. In queue mode, chunks are
+    claimed and processed until all of them are done.
+
+    Args:
+        config (Dict): PYR2PYR configuration
+        split (int): Split number
+
+    Raises:
+        Exception: Cannot get todo list
+        Exception: Invalid todo list line
+        storageError: Slab copy issue
+        MissingEnvironmentError: Missing object storage informations
+    """
+
+    if config["process"]["mode"] == "QUEUE":
+        work_queue_mode(config, split)
+        return
+
+    copy_todo_list(
+        config,
+        os.path.join(config["process"]["directory"], f"todo.{split}.list"),
+        os.path.join(config["process"]["directory"], f"todo.{split}.checkpoint"),
+    )
@@ -1,27 +1,122 @@
+import itertools
+import json
 import logging
 import os
-import tempfile
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Union
 
 from rok4 import storage
+from rok4.enums import StorageType
 from rok4.pyramid import Pyramid
 
+from rok4_tools.global_utils import storage_tools, todo_list, work_queue
+
+# Taille des blocs de TODO list traités d'un coup
+BLOCK_SIZE = 8 * 1024 * 1024
+
+# Ligne convertie : chemin relatif à la racine et signature MD5 optionnelle
+CONVERTED_LINE = re.compile(r"^(?!0/[^ \n]+(?: [^ \n]+)?$)", re.MULTILINE)
+
+
+def convert_todo_list(
+    todo_list_tmp: str, storage_type: StorageType, to_root: str, writer: storage_tools.StreamWriter
+) -> None:
+    """Convert todo list's lines to pyramid's list lines and write them
+
+    Lines are processed by blocks of BLOCK_SIZE bytes : the command, the source and the destination root
+    (absolute, or its index in a root-indexed todo list) are replaced by the root index with one
+    regular expression substitution per block.
+
+    Args:
+        todo_list_tmp (str): local todo list's path
+        storage_type (StorageType): output pyramid's storage type
+        to_root (str): output pyramid's root, without storage prefix, to replace by the root index
+        writer (storage_tools.StreamWriter): pyramid's list writer
+
+    Raises:
+        Exception: Invalid todo list line
+        StorageError: Storage write issue
+    """
+
+    with todo_list.open_local(todo_list_tmp) as todo_list_obj:
+        roots, offset = todo_list.read_header(todo_list_obj)
+
+        # Commande et source (cp) puis racine de la destination, remplacées par l'index de la racine
+        destinations = [rf"(?:{re.escape(storage_type.value)})?{re.escape(to_root)}"]
+        for index, root in roots.items():
+            if root in [f"{storage_type.value}{to_root}", to_root]:
+                destinations.append(re.escape(index))
+        line_pattern = re.compile(
+            rf"^(?:cp [^ \n]+ |keep )(?:{'|'.join(destinations)})/", re.MULTILINE
+        )
+
+        remainder = ""
+        while True:
+            data = todo_list_obj.read(BLOCK_SIZE)
+            if data == "":
+                block = remainder
+                remainder = ""
+            else:
+                block, newline, end = (remainder + data).rpartition("\n")
+                remainder = end
+            block = block.rstrip("\n")
+
+            if block != "":
+                converted = line_pattern.sub("0/", block)
+
+                invalid = CONVERTED_LINE.search(converted)
+                if invalid is not None:
+                    line = block.split("\n")[converted.count("\n", 0, invalid.start())]
+                    raise Exception(
+                        f"Invalid todo list line: we need a cp command and 3 or 4 more elements (source and destination) or a keep command and 2 or 3 more elements (destination): {line}"
+                    )
+
+                writer.write(converted + "\n")
+
+            if data == "":
+                break
+
 
 def work(config: Dict) -> None:
     """Finisher steps : finalize the pyramid's transfer
 
     Expects the configuration and all todo lists. Write the output pyramid's descriptor to the final location,
-    write the output pyramid's list to the final location (from the todo lists) and remove the todo lists
+    write the output pyramid's list to the final location (from the todo lists) and remove the todo lists.
+    In incremental mode, unchanged slabs from the finisher todo list are written in the list too.
+    In queue mode, we wait for all chunks to be done, then the chunks are used as todo lists.
 
     Args:
         config (Dict): PYR2PYR configuration
 
     Raises:
+        Exception: Cannot read the queue
         Exception: Cannot load the input or the output pyramid
         Exception: Cannot write output pyramid's descriptor
         Exception: Cannot concatenate todo lists to write the output pyramid's list
     """
 
+    queue_mode = config["process"]["mode"] == "QUEUE"
+
+    if queue_mode:
+        # On attend que les agents aient traité tous les morceaux
+        try:
+            chunks = json.loads(
+                storage.get_data_str(os.path.join(config["process"]["directory"], "queue.json"))
+            )["chunks"]
+
+            while True:
+                done, generations = work_queue.get_state(config["process"]["directory"])
+                if len(done) >= chunks:
+                    break
+                logging.info(f"{len(done)}/{chunks} chunks done, wait")
+                time.sleep(work_queue.POLL_INTERVAL)
+
+        except Exception as e:
+            raise Exception(f"Cannot read the queue's state: {e}")
+
     # Chargement de la pyramide à recopier
     try:
         from_pyramid = Pyramid.from_descriptor(config["from"]["descriptor"])
@@ -41,51 +136,72 @@ def work(config: Dict) -> None:
     except Exception as e:
         raise Exception(f"Cannot write output pyramid's descriptor to final location: {e}")
 
+    # Écriture de l'en-tête du fichier liste : une seule racine, celle de la pyramide en sortie
+    to_root = os.path.join(to_pyramid.storage_root, to_pyramid.name)
+    header = f"0={to_root}\n#\n"
+
+    if to_pyramid.storage_s3_cluster is not None:
+        # Les chemins de destination contiendront l'hôte du cluster S3 utilisé,
+        # Il faut donc l'inclure dans la racine à supprimer des chemins vers les dalles
+        to_root = os.path.join(
+            f"{to_pyramid.storage_root}@{to_pyramid.storage_s3_cluster}", to_pyramid.name
+        )
+
+    if queue_mode:
+        todo_lists = [
+            work_queue.get_chunk_path(config["process"]["directory"], i + 1, "list")
+            for i in range(0, chunks)
+        ]
+    else:
+        todo_lists = [
+            os.path.join(config["process"]["directory"], f"todo.{i+1}.list")
+            for i in range(0, config["process"]["parallelization"])
+        ]
+    if config["process"]["incremental"]:
+        # Dalles inchangées, non recopiées mais à remettre dans la liste
+        todo_lists.append(os.path.join(config["process"]["directory"], "todo.finisher.list"))
+
+    writer = None
+    executor = ThreadPoolExecutor(max_workers=config["process"]["threads"])
+    downloads = deque()
     try:
-        with tempfile.NamedTemporaryFile(mode="w", delete=False) as list_file_obj:
-            list_file_tmp = list_file_obj.name
-
-            # Écriture de l'en-tête du fichier liste : une seule racine, celle de la pyramide en sortie
-            to_root = os.path.join(to_pyramid.storage_root, to_pyramid.name)
-            list_file_obj.write(f"0={to_root}\n#\n")
-
-            if to_pyramid.storage_s3_cluster is not None:
-                # Les chemins de destination contiendront l'hôte du cluster S3 utilisé,
-                # Il faut donc l'inclure dans la racine à supprimer des chemins vers les dalles
-                to_root = os.path.join(
-                    f"{to_pyramid.storage_root}@{to_pyramid.storage_s3_cluster}", to_pyramid.name
-                )
-
-            for i in range(0, config["process"]["parallelization"]):
-                todo_list_obj = tempfile.NamedTemporaryFile(mode="r", delete=False)
-                storage.copy(
-                    os.path.join(config["process"]["directory"], f"todo.{i+1}.list"),
-                    f"file://{todo_list_obj.name}",
-                )
-
-                # On ouvre à nouveau en lecture le fichier pour avoir le contenu après la copie
-                todo_list_obj = open(todo_list_obj.name)
-                for line in todo_list_obj:
-                    line = line.rstrip()
-                    parts = line.split(" ")
-
-                    if (len(parts) != 3 and len(parts) != 4) or parts[0] != "cp":
-                        raise Exception(
-                            f"Invalid todo list line: we need a cp command and 3 or 4 more elements (source and destination): {line}"
-                        )
-
-                    storage_type, path, tray, base_name = storage.get_infos_from_path(parts[2])
-                    path = path.replace(to_root, "0")
-                    list_file_obj.write(f"{path}\n")
-
-                todo_list_obj.close()
-                storage.remove(f"file://{todo_list_obj.name}")
-                storage.remove(os.path.join(config["process"]["directory"], f"todo.{i+1}.list"))
-
-        storage.copy(f"file://{list_file_tmp}", to_pyramid.list)
-        storage.remove(f"file://{list_file_tmp}")
+        writer = storage_tools.StreamWriter(to_pyramid.list)
+        writer.write(header)
+
+        # Les TODO lists sont téléchargées en avance, en parallèle, mais traitées dans l'ordre
+        todo_lists_iterator = iter(todo_lists)
+        for path in itertools.islice(todo_lists_iterator, config["process"]["threads"]):
+            downloads.append(executor.submit(todo_list.download, path))
+
+        while downloads:
+            todo_list_tmp = downloads.popleft().result()
+            for path in itertools.islice(todo_lists_iterator, 1):
+                downloads.append(executor.submit(todo_list.download, path))
+
+            convert_todo_list(todo_list_tmp, to_pyramid.storage_type, to_root, writer)
+            storage.remove(f"file://{todo_list_tmp}")
+
+        writer.close()
+        executor.shutdown()
 
     except Exception as e:
+        for future in downloads:
+            future.cancel()
+        executor.shutdown()
+        if writer is not None:
+            writer.abort()
         raise Exception(
             f"Cannot concatenate splits' done lists and write the final output pyramid's list to the final location: {e}"
         )
+
+    # La liste finale est écrite, les TODO lists ne sont plus utiles
+    try:
+        for path in todo_lists:
+            storage.remove(path)
+
+        if queue_mode:
+            # Suppression des baux, marqueurs de fin et de la description de la file
+            work_queue.clean(config["process"]["directory"])
+
+    except Exception as e:
+        raise Exception(f"Cannot clean the todo lists: {e}")
@@ -1,24 +1,76 @@
+import heapq
 import itertools
+import json
 import logging
 import os
-import tempfile
-from typing import Dict, List, Tuple, Union
+from typing import Dict, Tuple
 
 from rok4 import storage
+from rok4.enums import SlabType
 from rok4.pyramid import Pyramid
 
+from rok4_tools.global_utils import local_cache, todo_list, work_queue
+from rok4_tools.global_utils.storage_tools import SizesIndex
+
 """Todo list instructions
 
 * cp <source slab> <destination slab> [<md5>] - Make a copy from source to destination. If a MD5 hash is present, it is calculate again afetr copy and have to be equal
 
+Finisher todo list instructions (incremental mode)
+
+* keep <destination slab> [<md5>] - Slab already present and unchanged in the destination pyramid, to write in the final list
+
 """
 
 
+def load_destination(to_pyramid: Pyramid) -> Dict[Tuple[SlabType, str, int, int], str]:
+    """Load the slabs of the destination pyramid, if it already exists
+
+    Args:
+        to_pyramid (Pyramid): destination pyramid
+
+    Raises:
+        Exception: Cannot load the existing destination pyramid
+
+    Returns:
+        Dict[Tuple[SlabType, str, int, int], str]: MD5 sum (None if unknown) of each slab owned by the destination pyramid, empty if the pyramid does not exist
+    """
+
+    to_slabs = {}
+
+    if not storage.exists(to_pyramid.descriptor):
+        logging.info(
+            f"No existing destination pyramid {to_pyramid.descriptor}, all slabs are copied"
+        )
+        return to_slabs
+
+    try:
+        existing_pyramid = Pyramid.from_descriptor(to_pyramid.descriptor)
+        for slab, infos in local_cache.list_generator(existing_pyramid):
+            if infos["link"]:
+                # Les dalles de la pyramide de sortie sont toutes des copies, un lien sera remplacé
+                continue
+            to_slabs[slab] = infos["md5"]
+
+    except Exception as e:
+        raise Exception(f"Cannot load the existing destination pyramid: {e}")
+
+    logging.info(f"{len(to_slabs)} slabs in the existing destination pyramid")
+
+    return to_slabs
+
+
 def work(config: Dict) -> None:
     """Master steps : prepare and split copies to do
 
     Load the input pyramid from the descriptor and write the todo lists, splitting the copies to do
 
+    In incremental mode, slabs already present in the destination pyramid with the same MD5 sum (or the
+    same size if a sum is missing) are not copied but written in the finisher todo list
+
+    In queue mode, copies are written in chunks of process.queue.chunk_size slabs, claimed by any number
+    of agents, instead of process.parallelization todo lists
+
     Args:
         config (Dict): PYR2PYR configuration
 
@@ -43,53 +95,185 @@ def work(config: Dict) -> None:
             f"Cannot create the destination pyramid descriptor from the source one: {e}"
         )
 
+    queue_mode = config["process"]["mode"] == "QUEUE"
+
     # Ouverture des flux vers les listes de recopies à faire
+    compression = config["process"]["compression"]
+    indexed = config["process"]["todo_format"] == 2
     file_objects = []
+    finisher_todo = None
+    chunk_obj = None
     try:
-        for i in range(0, config["process"]["parallelization"]):
-            tmp = tempfile.NamedTemporaryFile(mode="w", delete=False)
-            file_objects.append(tmp)
+        if queue_mode:
+            # Les fichiers d'un éventuel traitement précédent ne doivent pas être pris en compte
+            work_queue.clean(config["process"]["directory"])
+            chunk_obj = todo_list.TodoListWriter(compression, indexed)
+        else:
+            for i in range(0, config["process"]["parallelization"]):
+                file_objects.append(todo_list.TodoListWriter(compression, indexed))
+
+        if config["process"]["incremental"]:
+            finisher_todo = todo_list.TodoListWriter(compression, indexed)
 
     except Exception as e:
         raise Exception(f"Cannot open stream to write todo lists: {e}")
 
-    round_robin = itertools.cycle(file_objects)
+    round_robin = itertools.cycle(range(0, config["process"]["parallelization"]))
+
+    # Répartition par taille : tas des volumes déjà attribués à chaque liste, la dalle suivante va
+    # toujours dans la liste la moins chargée
+    balance_by_size = config["process"]["balancing"] == "SIZE"
+    splits_heap = [(0, i) for i in range(0, config["process"]["parallelization"])]
 
-    for (slab_type, level, column, row), infos in from_pyramid.list_generator():
+    # La taille des dalles n'est connue que si on en a besoin (filtre ou répartition)
+    sizes_known = balance_by_size or config["process"]["slab_limit"] != 0
+    splits_slabs = [0] * config["process"]["parallelization"]
+    splits_bytes = [0] * config["process"]["parallelization"]
+
+    # Mode file d'attente : morceaux remplis les uns après les autres
+    chunks = 0
+    chunk_slabs = 0
+    queue_slabs = 0
+    queue_bytes = 0
+
+    # Index des tailles des dalles, rempli par un listage complet de chaque racine rencontrée
+    sizes_index = SizesIndex()
+
+    # Mode incrémental : dalles déjà présentes dans la pyramide de sortie
+    to_slabs = {}
+    kept_slabs = 0
+    if config["process"]["incremental"]:
+        to_slabs = load_destination(to_pyramid)
+
+    to_root_path = storage.get_path_from_infos(
+        to_pyramid.storage_type, config["to"]["storage"]["root"], to_pyramid.name
+    )
+
+    for (slab_type, level, column, row), infos in local_cache.list_generator(from_pyramid):
         # On traite une dalle
 
         if infos["link"] is True and not config["process"]["follow_links"]:
             # On ne veut pas traiter les dalles symboliques, et c'en est une
             continue
 
+        from_root_path = storage.get_path_from_infos(from_pyramid.storage_type, infos["root"])
         from_slab_path = storage.get_path_from_infos(
             from_pyramid.storage_type, infos["root"], infos["slab"]
         )
 
-        if (
-            config["process"]["slab_limit"] != 0
-            and storage.get_size(from_slab_path) < config["process"]["slab_limit"]
-        ):
+        slab_size = None
+        if sizes_known:
+            slab_size = sizes_index.get_size(from_root_path, from_slab_path)
+
+        if config["process"]["slab_limit"] != 0 and slab_size < config["process"]["slab_limit"]:
             logging.debug(f"Slab {from_slab_path} too small, skip it")
             continue
 
         to_slab_path = to_pyramid.get_slab_path_from_infos(slab_type, level, column, row)
 
+        if (slab_type, level, column, row) in to_slabs:
+            to_md5 = to_slabs[(slab_type, level, column, row)]
+
+            if infos["md5"] is not None and to_md5 is not None:
+                unchanged = infos["md5"] == to_md5
+            else:
+                if slab_size is None:
+                    slab_size = sizes_index.get_size(from_root_path, from_slab_path)
+                to_size = sizes_index.get_size(to_root_path, to_slab_path, fallback=False)
+                unchanged = to_size == slab_size
+
+            if unchanged:
+                # La dalle est déjà dans la pyramide de sortie, le finisher la remettra dans la liste
+                slab_md5 = infos["md5"] if infos["md5"] is not None else to_md5
+                to_todo_path = finisher_todo.get_path(to_root_path, to_slab_path)
+                if slab_md5 is None:
+                    finisher_todo.write(f"keep {to_todo_path}\n")
+                else:
+                    finisher_todo.write(f"keep {to_todo_path} {slab_md5}\n")
+                kept_slabs += 1
+                continue
+
+        if slab_size is None:
+            slab_size = 0
+
+        if queue_mode:
+            if chunk_slabs == config["process"]["queue"]["chunk_size"]:
+                # Le morceau est plein, il est déposé et on passe au suivant
+                chunks += 1
+                try:
+                    chunk_obj.upload(
+                        work_queue.get_chunk_path(config["process"]["directory"], chunks, "list")
+                    )
+                    chunk_obj = todo_list.TodoListWriter(compression, indexed)
+                except Exception as e:
+                    raise Exception(f"Cannot copy chunk to final location and clean: {e}")
+                chunk_slabs = 0
+
+            chunk_slabs += 1
+            queue_slabs += 1
+            queue_bytes += slab_size
+            todo_list_obj = chunk_obj
+
+        else:
+            if balance_by_size:
+                split_bytes, split = heapq.heappop(splits_heap)
+                heapq.heappush(splits_heap, (split_bytes + slab_size, split))
+            else:
+                split = next(round_robin)
+
+            splits_slabs[split] += 1
+            splits_bytes[split] += slab_size
+            todo_list_obj = file_objects[split]
+
+        from_todo_path = todo_list_obj.get_path(from_root_path, from_slab_path)
+        to_todo_path = todo_list_obj.get_path(to_root_path, to_slab_path)
         if infos["md5"] is None:
-            next(round_robin).write(f"cp {from_slab_path} {to_slab_path}\n")
+            todo_list_obj.write(f"cp {from_todo_path} {to_todo_path}\n")
+        else:
+            todo_list_obj.write(f"cp {from_todo_path} {to_todo_path} {infos['md5']}\n")
+
+    if config["process"]["incremental"]:
+        logging.info(f"{kept_slabs} slabs unchanged in the destination pyramid, not copied")
+
+    if queue_mode:
+        if chunk_slabs != 0:
+            chunks += 1
+        if sizes_known:
+            logging.info(
+                f"Queue : {chunks} chunks, {queue_slabs} slabs to copy, {queue_bytes} bytes expected"
+            )
         else:
-            next(round_robin).write(f"cp {from_slab_path} {to_slab_path} {infos['md5']}\n")
+            logging.info(f"Queue : {chunks} chunks, {queue_slabs} slabs to copy")
+
+    for i in range(0, len(file_objects)):
+        if sizes_known:
+            logging.info(
+                f"Todo list {i+1} : {splits_slabs[i]} slabs to copy, {splits_bytes[i]} bytes expected"
+            )
+        else:
+            logging.info(f"Todo list {i+1} : {splits_slabs[i]} slabs to copy")
 
     # Copie des listes de recopies à l'emplacement partagé (peut être du stockage objet)
     try:
-        for i in range(0, config["process"]["parallelization"]):
-            tmp = file_objects[i]
-            tmp.close()
-            storage.copy(
-                f"file://{tmp.name}",
-                os.path.join(config["process"]["directory"], f"todo.{i+1}.list"),
+        for i in range(0, len(file_objects)):
+            file_objects[i].upload(os.path.join(config["process"]["directory"], f"todo.{i+1}.list"))
+
+        if finisher_todo is not None:
+            finisher_todo.upload(os.path.join(config["process"]["directory"], "todo.finisher.list"))
+
+        if queue_mode:
+            if chunk_slabs != 0:
+                chunk_obj.upload(
+                    work_queue.get_chunk_path(config["process"]["directory"], chunks, "list")
+                )
+            else:
+                chunk_obj.discard()
+
+            # Le nombre de morceaux est écrit en dernier : les agents peuvent alors commencer
+            storage.put_data_str(
+                json.dumps({"chunks": chunks}),
+                os.path.join(config["process"]["directory"], "queue.json"),
             )
-            storage.remove(f"file://{tmp.name}")
 
     except Exception as e:
         raise Exception(f"Cannot copy todo lists to final location and clean: {e}")
@@ -16,6 +16,7 @@ from rok4.pyramid import Pyramid, ROK4_IMAGE_HEADER_SIZE, SlabType
 from rok4.storage import put_data_str, get_size, get_path_from_infos, get_data_binary
 
 from rok4_tools import __version__
+from rok4_tools.global_utils import local_cache
 
 # Default logger
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s', level=logging.INFO)
@@ -145,7 +146,7 @@ def load() -> None:
     global pyramid, total, pbar
 
     pyramid = Pyramid.from_descriptor(args.pyramid)
-    total = pyramid.load_list()
+    total = local_cache.load_list(pyramid)
 
     if args.progress:
         pbar = tqdm(total=total)
@@ -162,7 +163,7 @@ def work() -> None:
     slab_sizes_offset = ROK4_IMAGE_HEADER_SIZE + 4 * slab_tiles_count
     slab_sizes_size = 4 * slab_tiles_count
 
-    for (slab_type, level, column, row), infos in pyramid.list_generator():
+    for (slab_type, level, column, row), infos in local_cache.list_generator(pyramid):
         if slab_type != SlabType.DATA:
             continue
 
@@ -0,0 +1,137 @@
+import json
+import math
+import os
+import struct
+from unittest.mock import MagicMock
+
+import numpy
+import pytest
+from rok4.enums import SlabType
+
+from rok4_tools.global_utils.slab import Slab, encode_tile
+
+
+@pytest.fixture
+def slab_header():
+    """Build a ROK4 slab's TIFF header, with only the tags giving the slab's structure"""
+
+    def get_header(width, height, tile_width, tile_height):
+        count = math.ceil(width / tile_width) * math.ceil(height / tile_height)
+        tags = [
+            (256, 4, 1, width),
+            (257, 4, 1, height),
+            (322, 4, 1, tile_width),
+            (323, 4, 1, tile_height),
+            (324, 4, count, 2048),
+            (325, 4, count, 2048 + 4 * count),
+        ]
+        header = b"II*\x00" + struct.pack("<I", 16) + bytes(8) + struct.pack("<H", len(tags))
+        header += b"".join([struct.pack("<HHII", *tag) for tag in tags]) + struct.pack("<I", 0)
+        return header.ljust(2048, b"\x00")
+
+    return get_header
+
+
+@pytest.fixture
+def write_slab(slab_header):
+    """Write a slab of 2 tiles of 2x2 pixels, None for an empty tile"""
+
+    def write(path, tiles, channels, format="TIFF_ZIP_UINT8"):
+        Slab(
+            slab_header(4, 2, 2, 2),
+            [b"" if tile is None else encode_tile(tile, format) for tile in tiles],
+        ).write(path)
+
+    return write
+
+
+@pytest.fixture
+def full_tile():
+    """Build a 2x2 pixels RGB tile, with the same value everywhere"""
+
+    def full(value):
+        return numpy.full((2, 2, 3), value, dtype="uint8")
+
+    return full
+
+
+@pytest.fixture
+def engine_pyramid():
+    """Source pyramid to merge slabs in process : slab's type from its path"""
+
+    pyramid = MagicMock()
+    pyramid.format = "TIFF_ZIP_UINT8"
+    pyramid.raster_specifications = {"channels": 3, "nodata": "255,255,255"}
+    pyramid.get_infos_from_slab_path.side_effect = lambda path: (
+        SlabType.MASK if "MASK" in path else SlabType.DATA,
+        "6",
+        0,
+        0,
+    )
+    return pyramid
+
+
+@pytest.fixture
+def file_pyramid(tmp_path, monkeypatch):
+    """Write a raster pyramid's descriptor, stored in the temporary directory, with levels 6 to 8 of
+    the PM TMS (written too), with masks or not. Its list is left to the test"""
+
+    os.makedirs(f"{tmp_path}/tms", exist_ok=True)
+    with open(f"{tmp_path}/tms/PM.json", "w") as f:
+        json.dump(
+            {
+                "id": "PM",
+                "crs": "EPSG:3857",
+                "orderedAxes": ["X", "Y"],
+                "tileMatrices": [
+                    {
+                        "id": level_id,
+                        "cellSize": 2 ** (20 - int(level_id)),
+                        "pointOfOrigin": [-20037508.3427892, 20037508.3427892],
+                        "tileWidth": 256,
+                        "tileHeight": 256,
+                        "matrixWidth": 2 ** int(level_id),
+                        "matrixHeight": 2 ** int(level_id),
+                    }
+                    for level_id in ["6", "7", "8"]
+                ],
+            },
+            f,
+        )
+    monkeypatch.setenv("ROK4_TMS_DIRECTORY", f"{tmp_path}/tms")
+
+    def write_descriptor(name, format="TIFF_PNG_UINT8", masks=False):
+        storage = {"type": "FILE", "path_depth": 2}
+        descriptor = {
+            "tile_matrix_set": "PM",
+            "format": format,
+            "raster_specifications": {
+                "channels": 3,
+                "nodata": "255,255,255",
+                "photometric": "rgb",
+                "interpolation": "bicubic",
+            },
+            "levels": [],
+        }
+        if masks:
+            descriptor["mask_format"] = "TIFF_ZIP_UINT8"
+
+        for level_id in ["6", "7", "8"]:
+            level_storage = dict(storage, image_directory=f"{name}/DATA/{level_id}")
+            if masks:
+                level_storage["mask_directory"] = f"{name}/MASK/{level_id}"
+            descriptor["levels"].append(
+                {
+                    "id": level_id,
+                    "tiles_per_width": 16,
+                    "tiles_per_height": 16,
+                    "tile_limits": {"min_col": 0, "max_col": 63, "min_row": 0, "max_row": 63},
+                    "storage": level_storage,
+                }
+            )
+
+        with open(f"{tmp_path}/{name}.json", "w") as f:
+            json.dump(descriptor, f)
+        return f"{tmp_path}/{name}.json"
+
+    return write_descriptor
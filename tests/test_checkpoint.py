@@ -0,0 +1,99 @@
+import json
+import os
+from unittest import mock
+
+from rok4_tools.global_utils.checkpoint import *
+
+
+def test_no_checkpoint(tmp_path):
+    checkpoint = Checkpoint(f"file://{tmp_path}/todo.1.checkpoint", 10, 60)
+    assert not checkpoint.load()
+    assert checkpoint.offset == 0
+    assert checkpoint.lines == 0
+
+    # Rien n'est fait, rien n'est sauvegardé
+    checkpoint.save()
+    assert not os.path.exists(os.path.join(tmp_path, "todo.1.checkpoint"))
+
+
+def test_save_every_lines(tmp_path):
+    path = os.path.join(tmp_path, "todo.1.checkpoint")
+    checkpoint = Checkpoint(f"file://{path}", 10, 60)
+
+    checkpoint.update(90, 9)
+    assert not os.path.exists(path)
+
+    checkpoint.update(100, 10)
+    with open(path) as f:
+        assert json.load(f) == {"offset": 100, "lines": 10}
+
+    checkpoint.update(110, 11)
+    with open(path) as f:
+        assert json.load(f) == {"offset": 100, "lines": 10}
+
+    checkpoint.save()
+    with open(path) as f:
+        assert json.load(f) == {"offset": 110, "lines": 11}
+
+    resumed = Checkpoint(f"file://{path}", 10, 60)
+    assert resumed.load()
+    assert resumed.offset == 110
+    assert resumed.lines == 11
+
+    resumed.remove()
+    assert not os.path.exists(path)
+
+
+@mock.patch("rok4_tools.global_utils.checkpoint.time.time")
+def test_load_saved_again(mocked_time, tmp_path):
+    # Lectures dans une même fenêtre du cache de lecture de rok4
+    mocked_time.return_value = 1000
+    path = f"file://{tmp_path}/todo.1.checkpoint"
+    checkpoint = Checkpoint(path, 10, 60)
+    checkpoint.update(100, 10)
+    assert Checkpoint(path, 10, 60).load()
+
+    # Progression enregistrée à nouveau : une reprise part de la dernière position
+    checkpoint.update(200, 20)
+    resumed = Checkpoint(path, 10, 60)
+    assert resumed.load()
+    assert resumed.offset == 200
+    assert resumed.lines == 20
+
+
+@mock.patch("rok4_tools.global_utils.checkpoint.time.time")
+def test_save_every_seconds(mocked_time, tmp_path):
+    path = os.path.join(tmp_path, "todo.1.checkpoint")
+    mocked_time.return_value = 1000
+    checkpoint = Checkpoint(f"file://{path}", 10, 60)
+
+    mocked_time.return_value = 1059
+    checkpoint.update(10, 1)
+    assert not os.path.exists(path)
+
+    mocked_time.return_value = 1060
+    checkpoint.update(20, 2)
+    with open(path) as f:
+        assert json.load(f) == {"offset": 20, "lines": 2}
+
+
+def test_ordered_progress(tmp_path):
+    path = os.path.join(tmp_path, "todo.1.checkpoint")
+    checkpoint = Checkpoint(f"file://{path}", 1, 60)
+    progress = OrderedProgress(checkpoint)
+
+    indices = [progress.add(offset, lines) for offset, lines in [(10, 1), (70, 6), (80, 1)]]
+    assert indices == [0, 1, 2]
+
+    # Le dernier groupe est terminé avant les autres : pas de progression
+    progress.done(2)
+    assert checkpoint.lines == 0
+    assert not os.path.exists(path)
+
+    progress.done(0)
+    assert (checkpoint.offset, checkpoint.lines) == (10, 1)
+
+    progress.done(1)
+    assert (checkpoint.offset, checkpoint.lines) == (80, 8)
+    with open(path) as f:
+        assert json.load(f) == {"offset": 80, "lines": 8}
@@ -0,0 +1,50 @@
+import heapq
+import os
+from unittest import mock
+
+import pytest
+
+from rok4_tools.global_utils.external_sort import *
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_sort(chunk_size, tmp_path):
+    items = [(5, "a"), (2, "b"), (5, "c"), (1, "d"), (3, "e"), (2, "f"), (4, "g")]
+
+    result = list(
+        sort(iter(items), key=lambda item: item[0], chunk_size=chunk_size, directory=tmp_path)
+    )
+
+    # Tri stable : à clé égale, l'ordre de lecture est conservé
+    assert result == [(1, "d"), (2, "b"), (2, "f"), (3, "e"), (4, "g"), (5, "a"), (5, "c")]
+    assert os.listdir(tmp_path) == []
+
+
+def test_sort_closed(tmp_path):
+    sorted_items = sort(
+        iter(range(10, 0, -1)), key=lambda item: item, chunk_size=2, directory=tmp_path
+    )
+
+    assert next(sorted_items) == 1
+    assert len(os.listdir(tmp_path)) == 5
+
+    # Fichiers temporaires supprimés même si le tri n'est pas lu entièrement
+    sorted_items.close()
+    assert os.listdir(tmp_path) == []
+
+
+@mock.patch("rok4_tools.global_utils.external_sort.heapq.merge", wraps=heapq.merge)
+def test_sort_fan_in(mocked_merge, tmp_path):
+    items = [(item % 7, item) for item in range(50, 0, -1)]
+
+    result = list(
+        sort(iter(items), key=lambda item: item[0], chunk_size=2, directory=tmp_path, fan_in=3)
+    )
+
+    # 25 runs fusionnés en plusieurs passes, sans perdre la stabilité du tri
+    assert result == sorted(items, key=lambda item: item[0])
+    assert os.listdir(tmp_path) == []
+    # Jamais plus de 3 runs ouverts à la fois : 25 runs -> 9 -> 3 -> fusion finale
+    assert mocked_merge.call_count == 8 + 3 + 1
+    for call in mocked_merge.call_args_list:
+        assert len(call.args) <= 3
@@ -1,8 +1,10 @@
+import json
 import os
 import subprocess
 from unittest import mock
 from unittest.mock import *
 
+import numpy
 import pytest
 
 from rok4_tools.joincache_utils.agent import *
@@ -34,8 +36,381 @@ def test_ok(mocked_os_system, mocked_link, mocked_from_descriptor):
             "parallelization": 3,
             "mask": True,
             "only_links": False,
+            "engine": "TOOLS",
+            "threads": 1,
+            "workers": 1,
+            "prefetch": 0,
+            "scratch": {"compression": "ZIP", "min_free": 0},
             "directory": "tests/fixtures/list_agent",
+            "checkpoint": {"lines": 10000, "seconds": 60},
         },
     }
     resultat = work(config, 1)
     mocked_from_descriptor.assert_called_once_with("path")
+
+
+def test_read_groups():
+    with open("tests/fixtures/list_agent/todo.1.list", "rb") as f:
+        groups = list(read_groups(f, 0))
+
+    assert [[parts[0] for parts in group] for group, offset in groups] == [
+        ["c2w", "c2w", "c2w", "c2w", "oNt", "w2c", "w2c"],
+        ["link"],
+    ]
+    assert groups[-1][1] == os.path.getsize("tests/fixtures/list_agent/todo.1.list")
+
+    # Reprise après le bloc de fusion
+    with open("tests/fixtures/list_agent/todo.1.list", "rb") as f:
+        assert list(read_groups(f, groups[0][1])) == groups[1:]
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+@mock.patch("rok4_tools.joincache_utils.agent.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.joincache_utils.agent.storage.link")
+@mock.patch("rok4_tools.joincache_utils.agent.engine.merge_sources")
+@mock.patch("rok4_tools.joincache_utils.agent.engine.read_group")
+@mock.patch("rok4_tools.joincache_utils.agent.os.system")
+def test_engine(
+    mocked_os_system,
+    mocked_read_group,
+    mocked_merge_sources,
+    mocked_link,
+    mocked_from_descriptor,
+    prefetch,
+    tmp_path,
+):
+    with open("tests/fixtures/list_agent/todo.1.list") as f:
+        todo = f.read()
+    with open(os.path.join(tmp_path, "todo.1.list"), "w") as f:
+        f.write(todo)
+
+    pyramid = MagicMock()
+    pyramid.raster_specifications = {"channels": 3, "nodata": "255,255,255"}
+    pyramid.format = "TIFF_ZIP_UINT8"
+    mocked_from_descriptor.return_value = pyramid
+
+    mocked_read_group.return_value = ("slabs", "plans", "to_data", "to_mask")
+    output = MagicMock()
+    mocked_merge_sources.return_value = [("to_data", output)]
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "10", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache.png", "root": "bucket", "mask": True},
+        "process": {
+            "parallelization": 1,
+            "mask": True,
+            "only_links": False,
+            "engine": "PYTHON",
+            "threads": 1,
+            "workers": 1,
+            "prefetch": prefetch,
+            "scratch": {"compression": "ZIP", "min_free": 0},
+            "directory": str(tmp_path),
+            "checkpoint": {"lines": 10000, "seconds": 60},
+        },
+    }
+    work(config, 1)
+
+    # Le bloc de fusion est traité sans outils externes, le lien est fait
+    mocked_read_group.assert_called_once()
+    assert [parts[0] for parts in mocked_read_group.call_args.args[1]] == [
+        "c2w",
+        "c2w",
+        "c2w",
+        "c2w",
+        "oNt",
+        "w2c",
+        "w2c",
+    ]
+    mocked_merge_sources.assert_called_once_with(pyramid, "slabs", "plans", "to_data", "to_mask")
+    output.write.assert_called_once_with("to_data")
+    mocked_os_system.assert_not_called()
+    mocked_link.assert_called_once()
+    assert not os.path.exists(os.path.join(tmp_path, "todo.1.checkpoint"))
+
+
+@mock.patch("rok4_tools.joincache_utils.agent.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.joincache_utils.agent.storage.link")
+@mock.patch("rok4_tools.joincache_utils.agent.os.system")
+def test_prefetch_error(mocked_os_system, mocked_link, mocked_from_descriptor, tmp_path):
+    link = "link s3://to/DATA_6_1_1 s3://from/DATA_6_1_1 1\n"
+    with open("tests/fixtures/list_agent/todo.1.list") as f:
+        todo = f.read()
+    with open(os.path.join(tmp_path, "todo.1.list"), "w") as f:
+        f.write(link + todo)
+
+    pyramid = MagicMock()
+    pyramid.raster_specifications = {"channels": 3, "nodata": "255,255,255", "photometric": "rgb"}
+    pyramid.format = "TIFF_ZIP_UINT8"
+    mocked_from_descriptor.return_value = pyramid
+    mocked_os_system.return_value = 1
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "10", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache.png", "root": "bucket", "mask": True},
+        "process": {
+            "parallelization": 1,
+            "mask": True,
+            "only_links": False,
+            "engine": "TOOLS",
+            "threads": 1,
+            "workers": 1,
+            "prefetch": 2,
+            "scratch": {"compression": "ZIP", "min_free": 0},
+            "directory": str(tmp_path),
+            "checkpoint": {"lines": 10000, "seconds": 60},
+        },
+    }
+
+    # L'erreur de la conversion, dans son thread, est remontée après l'écriture des groupes
+    # précédents, et la progression est sauvegardée
+    with pytest.raises(Exception) as exc:
+        work(config, 1)
+    assert "cache2work raises an error" in str(exc.value)
+    mocked_link.assert_called_once_with("s3://from/DATA_6_1_1", "s3://to/DATA_6_1_1")
+    with open(os.path.join(tmp_path, "todo.1.checkpoint")) as f:
+        assert json.load(f) == {"offset": len(link), "lines": 1}
+
+
+def get_slab_path(tmp_path, root, slab_type, i):
+    # Dalle de la colonne i du niveau 6, rangée comme dans une pyramide fichier de profondeur 2
+    return f"{tmp_path}/{root}/{slab_type}/6/00/00/{i}1.tif"
+
+
+def write_merge_todo(path, tmp_path, output, blocks):
+    lines = []
+    for i in blocks:
+        lines.append(
+            "".join(
+                f"{command} {get_slab_path(tmp_path, root, slab_type, i)}\n"
+                for command, root, slab_type in [
+                    ("c2w", "p1", "DATA"),
+                    ("c2w", "p1", "MASK"),
+                    ("c2w", "p2", "DATA"),
+                ]
+            )
+            + "oNt\n"
+            + f"w2c {get_slab_path(tmp_path, output, 'DATA', i)}\n"
+            + f"w2c {get_slab_path(tmp_path, output, 'MASK', i)}\n"
+        )
+    with open(path, "w") as f:
+        f.write("".join(lines))
+    return lines
+
+
+def get_workers_config(directory, workers, descriptor):
+    return {
+        "datasources": [{"bottom": "6", "top": "10", "source": {"descriptors": [descriptor]}}],
+        "pyramid": {"name": "joincache.png", "root": "bucket", "mask": True},
+        "process": {
+            "parallelization": 1,
+            "mask": True,
+            "only_links": False,
+            "engine": "PYTHON",
+            "threads": 1,
+            "workers": workers,
+            "prefetch": 0,
+            "scratch": {"compression": "ZIP", "min_free": 0},
+            "directory": str(directory),
+            "checkpoint": {"lines": 10000, "seconds": 60},
+        },
+    }
+
+
+def write_workers_slabs(tmp_path, write_slab, full_tile, blocks):
+    half = numpy.array([[[255], [0]], [[0], [255]]], dtype="uint8")
+    for i in blocks:
+        write_slab(get_slab_path(tmp_path, "p1", "DATA", i), [full_tile(i), None], 3)
+        write_slab(get_slab_path(tmp_path, "p1", "MASK", i), [half, None], 1)
+        write_slab(
+            get_slab_path(tmp_path, "p2", "DATA", i), [full_tile(100 + i), full_tile(200 + i)], 3
+        )
+
+
+def test_workers(tmp_path, write_slab, full_tile, file_pyramid):
+    # Vraie pyramide fichier : chaque processus de fusion, démarré à neuf, charge son descripteur
+    descriptor = file_pyramid("p1", "TIFF_ZIP_UINT8", masks=True)
+    write_workers_slabs(tmp_path, write_slab, full_tile, range(6))
+
+    os.makedirs(f"{tmp_path}/sequential")
+    write_merge_todo(f"{tmp_path}/sequential/todo.1.list", tmp_path, "seq", range(6))
+    work(get_workers_config(f"{tmp_path}/sequential", 1, descriptor), 1)
+
+    os.makedirs(f"{tmp_path}/workers")
+    write_merge_todo(f"{tmp_path}/workers/todo.1.list", tmp_path, "par", range(6))
+    work(get_workers_config(f"{tmp_path}/workers", 3, descriptor), 1)
+
+    # Même résultat qu'un traitement séquentiel
+    for i in range(6):
+        for slab_type in ["DATA", "MASK"]:
+            with open(get_slab_path(tmp_path, "seq", slab_type, i), "rb") as f:
+                sequential = f.read()
+            with open(get_slab_path(tmp_path, "par", slab_type, i), "rb") as f:
+                assert f.read() == sequential
+    assert not os.path.exists(f"{tmp_path}/workers/todo.1.checkpoint")
+
+
+def test_workers_error(tmp_path, write_slab, full_tile, file_pyramid):
+    descriptor = file_pyramid("p1", "TIFF_ZIP_UINT8", masks=True)
+    write_workers_slabs(tmp_path, write_slab, full_tile, [0, 2, 3])
+
+    # Le deuxième bloc échoue (dalles sources absentes), les suivants peuvent se terminer avant
+    blocks = write_merge_todo(f"{tmp_path}/todo.1.list", tmp_path, "to", range(4))
+    with pytest.raises(Exception):
+        work(get_workers_config(tmp_path, 2, descriptor), 1)
+
+    # La progression s'arrête avant le bloc en échec
+    with open(os.path.join(tmp_path, "todo.1.checkpoint")) as f:
+        assert json.load(f) == {"offset": len(blocks[0]), "lines": 6}
+
+
+def get_links_config(directory, threads):
+    return {
+        "datasources": [{"bottom": "6", "top": "10", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache.png", "root": "bucket", "mask": False},
+        "process": {
+            "parallelization": 1,
+            "mask": False,
+            "only_links": True,
+            "engine": "TOOLS",
+            "threads": threads,
+            "workers": 1,
+            "prefetch": 0,
+            "scratch": {"compression": "ZIP", "min_free": 0},
+            "directory": str(directory),
+            "checkpoint": {"lines": 10000, "seconds": 60},
+        },
+    }
+
+
+@mock.patch("rok4_tools.joincache_utils.agent.LINK_BATCH", 3)
+@mock.patch("rok4_tools.joincache_utils.agent.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.joincache_utils.agent.storage.link")
+def test_links(mocked_link, mocked_from_descriptor, tmp_path):
+    lines = [f"link s3://to/DATA_{i} s3://from/DATA_{i} 1\n" for i in range(20)]
+    with open(os.path.join(tmp_path, "todo.1.list"), "w") as f:
+        f.write("".join(lines))
+
+    work(get_links_config(tmp_path, 4), 1)
+
+    assert sorted(mocked_link.call_args_list) == sorted(
+        [call(f"s3://from/DATA_{i}", f"s3://to/DATA_{i}") for i in range(20)]
+    )
+    assert not os.path.exists(os.path.join(tmp_path, "todo.1.checkpoint"))
+
+
+@mock.patch("rok4_tools.joincache_utils.agent.LINK_BATCH", 3)
+@mock.patch("rok4_tools.joincache_utils.agent.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.joincache_utils.agent.storage.link")
+def test_links_error(mocked_link, mocked_from_descriptor, tmp_path):
+    lines = [f"link s3://to/DATA_{i} s3://from/DATA_{i} 1\n" for i in range(20)]
+    with open(os.path.join(tmp_path, "todo.1.list"), "w") as f:
+        f.write("".join(lines))
+
+    def link(target, path):
+        if path == "s3://to/DATA_7":
+            raise Exception("Cannot link DATA_7")
+
+    mocked_link.side_effect = link
+
+    with pytest.raises(Exception) as exc:
+        work(get_links_config(tmp_path, 4), 1)
+    assert "Cannot link DATA_7" in str(exc.value)
+
+    # Les lots précédant le lot en échec (lignes 6 à 8) sont comptés
+    with open(os.path.join(tmp_path, "todo.1.checkpoint")) as f:
+        assert json.load(f) == {"offset": len("".join(lines[0:6])), "lines": 6}
+
+    # Reprise : les liens restants sont faits
+    mocked_link.reset_mock()
+    mocked_link.side_effect = None
+    work(get_links_config(tmp_path, 4), 1)
+    assert sorted(mocked_link.call_args_list) == sorted(
+        [call(f"s3://from/DATA_{i}", f"s3://to/DATA_{i}") for i in range(6, 20)]
+    )
+
+
+def get_scratch_config(directory, compression):
+    return {
+        "datasources": [{"bottom": "6", "top": "10", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache.png", "root": "bucket", "mask": True},
+        "process": {
+            "parallelization": 1,
+            "mask": True,
+            "only_links": False,
+            "engine": "TOOLS",
+            "threads": 1,
+            "workers": 1,
+            "prefetch": 0,
+            "scratch": {
+                "directory": str(directory / "scratch"),
+                "compression": compression,
+                "min_free": 0,
+            },
+            "directory": str(directory),
+            "checkpoint": {"lines": 10000, "seconds": 60},
+        },
+    }
+
+
+@pytest.mark.parametrize("failing", [None, "overlayNtiff", "work2cache"])
+@mock.patch("rok4_tools.joincache_utils.agent.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.joincache_utils.agent.os.system")
+def test_scratch(mocked_os_system, mocked_from_descriptor, failing, tmp_path):
+    os.mkdir(tmp_path / "scratch")
+    write_merge_todo(os.path.join(tmp_path, "todo.1.list"), tmp_path, "out", [1, 2])
+
+    pyramid = MagicMock()
+    pyramid.raster_specifications = {"channels": 3, "nodata": "255,255,255", "photometric": "rgb"}
+    pyramid.format = "TIFF_ZIP_UINT8"
+    pyramid.get_infos_from_slab_path.side_effect = lambda path: (
+        SlabType.MASK if "MASK" in path else SlabType.DATA,
+        "6",
+        1,
+        1,
+    )
+    mocked_from_descriptor.return_value = pyramid
+
+    mocked_os_system.side_effect = lambda command: 1 if command.startswith(str(failing)) else 0
+
+    config = get_scratch_config(tmp_path, "RAW")
+    if failing is None:
+        work(config, 1)
+    else:
+        with pytest.raises(Exception) as exc:
+            work(config, 1)
+        assert f"{failing} raises an error" in str(exc.value)
+
+    # Images intermédiaires non compressées, dans le dossier de travail, toutes supprimées
+    commands = [c.args[0] for c in mocked_os_system.call_args_list]
+    assert all(" -c raw " in c for c in commands if not c.startswith("work2cache"))
+    assert any(str(tmp_path / "scratch") in c for c in commands)
+    assert os.listdir(tmp_path / "scratch") == []
+
+
+def test_unlink_outputs(tmp_path):
+    os.makedirs(f"{tmp_path}/source")
+    os.makedirs(f"{tmp_path}/to")
+    with open(f"{tmp_path}/source/DATA", "w") as f:
+        f.write("source")
+    os.symlink(f"{tmp_path}/source/DATA", f"{tmp_path}/to/DATA")
+
+    def write(path):
+        with open(path, "w") as f:
+            f.write("merged")
+
+    output = MagicMock()
+    output.write.side_effect = write
+    group = [
+        ["c2w", f"{tmp_path}/source/DATA"],
+        ["oNt"],
+        ["w2c", f"{tmp_path}/to/DATA"],
+    ]
+    write_stage(MagicMock(), group, ("PYTHON", [(f"{tmp_path}/to/DATA", output)]), MagicMock())
+
+    # Le lien de la génération précédente est remplacé, la dalle source n'est pas modifiée
+    assert not os.path.islink(f"{tmp_path}/to/DATA")
+    with open(f"{tmp_path}/to/DATA") as f:
+        assert f.read() == "merged"
+    with open(f"{tmp_path}/source/DATA") as f:
+        assert f.read() == "source"
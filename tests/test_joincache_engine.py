@@ -0,0 +1,115 @@
+import os
+from unittest import mock
+from unittest.mock import *
+
+import numpy
+
+from rok4_tools.global_utils.slab import Slab, decode_tile
+from rok4_tools.joincache_utils.engine import *
+
+
+def read_tiles(path, channels):
+    return [
+        decode_tile(tile, "TIFF_ZIP_UINT8", 2, 2, channels) for tile in Slab.from_path(path).tiles
+    ]
+
+
+def test_overlay():
+    top = numpy.full((2, 2, 1), 10, dtype="uint8")
+    top_mask = numpy.array([[[255], [0]], [[0], [0]]], dtype="uint8")
+    bottom = numpy.full((2, 2, 1), 20, dtype="uint8")
+
+    data, filled = overlay([(top, top_mask)], [255], (2, 2, 1), numpy.dtype("uint8"))
+    assert data[:, :, 0].tolist() == [[10, 255], [255, 255]]
+    assert filled.tolist() == [[True, False], [False, False]]
+
+    data, filled = overlay(
+        [(top, top_mask), (bottom, None)], [255], (2, 2, 1), numpy.dtype("uint8")
+    )
+    assert data[:, :, 0].tolist() == [[10, 20], [20, 20]]
+    assert filled.all()
+
+
+def test_merge_group(tmp_path, write_slab, full_tile, engine_pyramid):
+    write_slab(f"{tmp_path}/p1/DATA.tif", [full_tile(10), None], 3)
+    write_slab(
+        f"{tmp_path}/p1/MASK.tif", [numpy.array([[[255], [0]], [[0], [0]]], dtype="uint8"), None], 1
+    )
+    write_slab(f"{tmp_path}/p2/DATA.tif", [full_tile(20), full_tile(30)], 3)
+
+    group = [
+        ["c2w", f"{tmp_path}/p1/DATA.tif"],
+        ["c2w", f"{tmp_path}/p1/MASK.tif"],
+        ["c2w", f"{tmp_path}/p2/DATA.tif"],
+        ["oNt"],
+        ["w2c", f"{tmp_path}/to/DATA.tif"],
+        ["w2c", f"{tmp_path}/to/MASK.tif"],
+    ]
+    assert merge_group(engine_pyramid, group)
+
+    tiles = read_tiles(f"{tmp_path}/to/DATA.tif", 3)
+    assert tiles[0][:, :, 0].tolist() == [[10, 20], [20, 20]]
+    assert numpy.array_equal(tiles[1], full_tile(30))
+
+    masks = read_tiles(f"{tmp_path}/to/MASK.tif", 1)
+    assert all(mask.all() for mask in masks)
+
+
+def test_merge_group_without_source_mask(tmp_path, engine_pyramid):
+    group = [
+        ["c2w", f"{tmp_path}/p1/DATA.tif"],
+        ["c2w", f"{tmp_path}/p2/DATA.tif"],
+        ["oNt"],
+        ["w2c", f"{tmp_path}/to/DATA.tif"],
+        ["w2c", f"{tmp_path}/to/MASK.tif"],
+    ]
+    assert not merge_group(engine_pyramid, group)
+    assert not os.path.exists(f"{tmp_path}/to")
+
+
+def test_merge_group_copy(tmp_path, write_slab, full_tile, engine_pyramid):
+    write_slab(f"{tmp_path}/p1/DATA.tif", [full_tile(10), None], 3)
+    write_slab(f"{tmp_path}/p2/DATA.tif", [full_tile(20), full_tile(30)], 3)
+
+    group = [
+        ["c2w", f"{tmp_path}/p1/DATA.tif"],
+        ["c2w", f"{tmp_path}/p2/DATA.tif"],
+        ["oNt"],
+        ["w2c", f"{tmp_path}/to/DATA.tif"],
+    ]
+
+    # Source du dessus sans masque ou source unique : aucune tuile décodée
+    with mock.patch("rok4_tools.joincache_utils.engine.rok4_slab.decode_tile") as mocked_decode:
+        assert merge_group(engine_pyramid, group)
+    mocked_decode.assert_not_called()
+
+    tiles = Slab.from_path(f"{tmp_path}/to/DATA.tif").tiles
+    assert tiles[0] == Slab.from_path(f"{tmp_path}/p1/DATA.tif").tiles[0]
+    assert tiles[1] == Slab.from_path(f"{tmp_path}/p2/DATA.tif").tiles[1]
+
+
+def test_merge_group_copy_mask(tmp_path, write_slab, full_tile, engine_pyramid):
+    mask = numpy.array([[[255], [0]], [[0], [0]]], dtype="uint8")
+
+    write_slab(f"{tmp_path}/p1/DATA.tif", [full_tile(10), None], 3)
+    write_slab(f"{tmp_path}/p1/MASK.tif", [mask, None], 1)
+    write_slab(f"{tmp_path}/p2/DATA.tif", [None, None], 3)
+
+    group = [
+        ["c2w", f"{tmp_path}/p1/DATA.tif"],
+        ["c2w", f"{tmp_path}/p1/MASK.tif"],
+        ["c2w", f"{tmp_path}/p2/DATA.tif"],
+        ["oNt"],
+        ["w2c", f"{tmp_path}/to/DATA.tif"],
+        ["w2c", f"{tmp_path}/to/MASK.tif"],
+    ]
+    assert merge_group(engine_pyramid, group)
+
+    # Tuile 0 recopiée avec son masque, tuile 1 sans donnée
+    masks = Slab.from_path(f"{tmp_path}/to/MASK.tif").tiles
+    assert masks[0] == Slab.from_path(f"{tmp_path}/p1/MASK.tif").tiles[0]
+    assert not decode_tile(masks[1], "TIFF_ZIP_UINT8", 2, 2, 1).any()
+
+    tiles = read_tiles(f"{tmp_path}/to/DATA.tif", 3)
+    assert numpy.array_equal(tiles[0], full_tile(10))
+    assert numpy.array_equal(tiles[1], full_tile(255))
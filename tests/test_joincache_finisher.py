@@ -99,6 +99,7 @@ def test_ok(mocked_copy, mocked_from_other, mocked_source):
             "parallelization": 3,
             "mask": True,
             "only_links": False,
+            "incremental": False,
             "directory": "tests/fixtures/list_finisher",
         },
     }
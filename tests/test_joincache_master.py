@@ -209,7 +209,16 @@ def test_datasources_with_same_level(mocked_from_other, mocked_source):
             {"bottom": "6", "top": "16", "source": {"descriptors": ["path2"]}},
         ],
         "pyramid": {"name": "joincache.png", "root": "bucket", "mask": "true"},
-        "process": {"parallelization": 3},
+        "process": {
+            "parallelization": 3,
+            "balancing": "COUNT",
+            "direct": False,
+            "incremental": False,
+            "mask_links": False,
+            "index": {"mode": "MEMORY"},
+            "compression": "NONE",
+            "todo_format": 1,
+        },
     }
     with pytest.raises(Exception) as exc:
         resultat = work(config)
@@ -223,10 +232,7 @@ def test_datasources_with_same_level(mocked_from_other, mocked_source):
 
 @mock.patch("rok4_tools.joincache_utils.master.SourcePyramids")
 @mock.patch("rok4_tools.joincache_utils.master.Pyramid.from_other")
-def test_ok(mocked_from_other, mocked_source):
-    files = [f for f in os.listdir("tests/fixtures/list_master")]
-    for file in files:
-        os.remove(os.path.join("tests/fixtures/list_master", file))
+def test_ok(mocked_from_other, mocked_source, tmp_path):
     level6 = MagicMock()
     level6.id = "6"
     pyramid1 = MagicMock()
@@ -322,20 +328,532 @@ def test_ok(mocked_from_other, mocked_source):
             "parallelization": 3,
             "mask": True,
             "only_links": False,
-            "directory": "tests/fixtures/list_master",
+            "planners": 1,
+            "direct": False,
+            "incremental": False,
+            "mask_links": False,
+            "balancing": "COUNT",
+            "index": {"mode": "MEMORY"},
+            "directory": str(tmp_path),
+            "compression": "NONE",
+            "todo_format": 1,
         },
     }
 
     resultat = work(config)
-    with open("tests/fixtures/list_master/todo.1.list") as f:
+    with open(os.path.join(tmp_path, "todo.1.list")) as f:
         lignes = f.read()
 
     assert (
         lignes
-        == "c2w s3://path/DATA_6_1_1\nc2w s3://path/MASK_6_1_1\nc2w s3://path3/DATA_6_1_1\nc2w s3://path3/MASK_6_1_1\noNt\nw2c s3://path_final/DATA_6_1_1\nw2c s3://path_final/MASK_6_1_1\nlink s3://path_final/DATA_11_1_1 s3://path2/DATA_11_1_1 2\n"
+        == "c2w s3://path/DATA_6_1_1\nc2w s3://path/MASK_6_1_1\nc2w s3://path3/DATA_6_1_1\nc2w s3://path3/MASK_6_1_1\noNt\nw2c s3://path_final/DATA_6_1_1\nw2c s3://path_final/MASK_6_1_1\n"
+    )
+
+    # Liens de la dalle de données et de son masque dans la même liste
+    with open(os.path.join(tmp_path, "todo.3.list")) as f:
+        lignes = f.read()
+
+    assert (
+        lignes
+        == "link s3://path_final/DATA_11_1_1 s3://path2/DATA_11_1_1 2\nlink s3://path_final/MASK_11_1_1 s3://path2/MASK_11_1_1 2\n"
     )
 
     mocked_source.assert_has_calls([call("6", "10", ["path"]), call("11", "16", ["path2"])])
     mocked_from_other.assert_called_once_with(
         source1.pyramids[0], "joincache.png", storage_pyramid, mask=True
     )
+
+
+def get_pyramid(root, level, slabs):
+    pyramid = MagicMock()
+    pyramid.storage_type = StorageType.S3
+    pyramid.get_levels.return_value = [level]
+    pyramid.list_generator.return_value = [
+        ((slab_type, level.id, col, row), {"root": root, "slab": f"{slab_type.name}_{col}_{row}"})
+        for slab_type, col, row in slabs
+    ]
+    return pyramid
+
+
+@pytest.mark.parametrize("index", [{"mode": "MEMORY"}, {"mode": "SORT", "buffer": 2}])
+@mock.patch("rok4_tools.joincache_utils.master.SourcePyramids")
+@mock.patch("rok4_tools.joincache_utils.master.Pyramid.from_other")
+def test_stacks(mocked_from_other, mocked_source, index, tmp_path):
+    level6 = MagicMock()
+    level6.id = "6"
+    pyramid1 = get_pyramid("p1", level6, [(SlabType.DATA, 1, 1)])
+    pyramid2 = get_pyramid(
+        "p2", level6, [(SlabType.DATA, 2, 1), (SlabType.DATA, 1, 1), (SlabType.MASK, 1, 1)]
+    )
+    pyramid3 = get_pyramid("p3", level6, [(SlabType.DATA, 1, 1), (SlabType.DATA, 2, 1)])
+
+    source = MagicMock()
+    source.tms.name = "PM"
+    source.format = "TIFF_PNG_UINT8"
+    source.channels = 3
+    source.type = PyramidType.RASTER
+    source.pyramids = [pyramid1, pyramid2, pyramid3]
+    mocked_source.return_value = source
+
+    to_pyramid = MagicMock()
+    to_pyramid.storage_s3_cluster = None
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, col, row: f"s3://final/{slab_type.name}_{col}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "6", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache.png", "root": "bucket", "mask": False},
+        "process": {
+            "parallelization": 1,
+            "mask": True,
+            "only_links": False,
+            "planners": 1,
+            "direct": False,
+            "incremental": False,
+            "mask_links": False,
+            "balancing": "COUNT",
+            "index": index,
+            "directory": str(tmp_path),
+            "compression": "NONE",
+            "todo_format": 1,
+        },
+    }
+
+    work(config)
+    with open(os.path.join(tmp_path, "todo.1.list")) as f:
+        assert f.read() == (
+            "c2w s3://p1/DATA_1_1\nc2w s3://p2/DATA_1_1\nc2w s3://p2/MASK_1_1\nc2w s3://p3/DATA_1_1\n"
+            + "oNt\nw2c s3://final/DATA_1_1\n"
+            + "c2w s3://p2/DATA_2_1\nc2w s3://p3/DATA_2_1\noNt\nw2c s3://final/DATA_2_1\n"
+        )
+
+    # Une seule lecture de la liste de chaque pyramide
+    for pyramid in source.pyramids:
+        pyramid.list_generator.assert_called_once_with("6")
+
+
+def test_planners(tmp_path, file_pyramid):
+    # Vraies pyramides fichier : les processus de planification rechargent descripteurs et listes
+    def get_path(name, level_id, col):
+        return f"file://{tmp_path}/{name}/DATA/{level_id}/00/00/{col}1.tif"
+
+    descriptors = []
+    for name, cols in [("p1", [1, 2]), ("p2", [2, 3])]:
+        descriptors.append(file_pyramid(name))
+        with open(f"{tmp_path}/{name}.list", "w") as f:
+            f.write(f"0={tmp_path}/{name}\n#\n")
+            for level_id in ["6", "7", "8"]:
+                for col in cols:
+                    f.write(f"0/DATA/{level_id}/00/00/{col}1.tif\n")
+
+    def get_config(directory, planners):
+        os.makedirs(directory)
+        return {
+            "datasources": [{"bottom": "8", "top": "6", "source": {"descriptors": descriptors}}],
+            "pyramid": {"name": "joincache", "root": f"{tmp_path}/final", "mask": False},
+            "process": {
+                "parallelization": 2,
+                "mask": False,
+                "only_links": False,
+                "planners": planners,
+                "direct": False,
+                "incremental": False,
+                "mask_links": False,
+                "balancing": "COUNT",
+                "index": {"mode": "MEMORY"},
+                "directory": directory,
+                "compression": "NONE",
+                "todo_format": 1,
+            },
+        }
+
+    work(get_config(f"{tmp_path}/sequential", 1))
+    work(get_config(f"{tmp_path}/planners", 2))
+
+    # Même répartition qu'avec une planification séquentielle, dans l'ordre des niveaux
+    for todo in ["todo.1.list", "todo.2.list", "todo.finisher.list"]:
+        with open(f"{tmp_path}/sequential/{todo}") as f:
+            sequential = f.read()
+        with open(f"{tmp_path}/planners/{todo}") as f:
+            assert f.read() == sequential
+
+    with open(f"{tmp_path}/planners/todo.1.list") as f:
+        assert f.read() == (
+            f"link {get_path('final/joincache', '8', 1)} {get_path('p1', '8', 1)} 1\n"
+            + f"link {get_path('final/joincache', '8', 3)} {get_path('p2', '8', 3)} 2\n"
+            + f"c2w {get_path('p1', '7', 2)}\nc2w {get_path('p2', '7', 2)}\noNt\n"
+            + f"w2c {get_path('final/joincache', '7', 2)}\n"
+            + f"link {get_path('final/joincache', '6', 1)} {get_path('p1', '6', 1)} 1\n"
+            + f"link {get_path('final/joincache', '6', 3)} {get_path('p2', '6', 3)} 2\n"
+        )
+
+    with open(f"{tmp_path}/planners/todo.finisher.list") as f:
+        assert f.read() == f"1={tmp_path}/p1\n2={tmp_path}/p2\n"
+
+
+@mock.patch("rok4_tools.joincache_utils.master.SizesIndex.get_size")
+@mock.patch("rok4_tools.joincache_utils.master.SourcePyramids")
+@mock.patch("rok4_tools.joincache_utils.master.Pyramid.from_other")
+def test_balancing_cost(mocked_from_other, mocked_source, mocked_get_size, tmp_path):
+    level6 = MagicMock()
+    level6.id = "6"
+    pyramid1 = get_pyramid(
+        "p1", level6, [(SlabType.DATA, 1, 1), (SlabType.DATA, 2, 1), (SlabType.DATA, 3, 1)]
+    )
+    pyramid2 = get_pyramid("p2", level6, [(SlabType.DATA, 1, 1)])
+
+    source = MagicMock()
+    source.tms.name = "PM"
+    source.format = "TIFF_PNG_UINT8"
+    source.channels = 3
+    source.type = PyramidType.RASTER
+    source.pyramids = [pyramid1, pyramid2]
+    mocked_source.return_value = source
+
+    to_pyramid = MagicMock()
+    to_pyramid.storage_s3_cluster = None
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, col, row: f"s3://final/{slab_type.name}_{col}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+    mocked_get_size.return_value = 10000000
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "6", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache.png", "root": "bucket", "mask": False},
+        "process": {
+            "parallelization": 2,
+            "mask": False,
+            "only_links": False,
+            "planners": 1,
+            "direct": False,
+            "incremental": False,
+            "mask_links": False,
+            "balancing": "COST",
+            "index": {"mode": "MEMORY"},
+            "directory": str(tmp_path),
+            "compression": "NONE",
+            "todo_format": 1,
+        },
+    }
+
+    work(config)
+
+    # La superposition coûte plus que les deux liens réunis
+    with open(os.path.join(tmp_path, "todo.1.list")) as f:
+        assert (
+            f.read() == "c2w s3://p1/DATA_1_1\nc2w s3://p2/DATA_1_1\noNt\nw2c s3://final/DATA_1_1\n"
+        )
+    with open(os.path.join(tmp_path, "todo.2.list")) as f:
+        assert f.read() == (
+            "link s3://final/DATA_2_1 s3://p1/DATA_2_1 1\n"
+            + "link s3://final/DATA_3_1 s3://p1/DATA_3_1 1\n"
+        )
+
+
+@mock.patch("rok4_tools.joincache_utils.master.LINK_BATCH", 2)
+@mock.patch("rok4_tools.joincache_utils.master.storage.link")
+@mock.patch("rok4_tools.joincache_utils.master.SourcePyramids")
+@mock.patch("rok4_tools.joincache_utils.master.Pyramid.from_other")
+def test_direct(mocked_from_other, mocked_source, mocked_link, tmp_path):
+    level6 = MagicMock()
+    level6.id = "6"
+    pyramid1 = get_pyramid("p1", level6, [(SlabType.DATA, 1, 1), (SlabType.MASK, 1, 1)])
+    pyramid2 = get_pyramid("p2", level6, [(SlabType.DATA, 1, 1), (SlabType.DATA, 2, 1)])
+
+    source = MagicMock()
+    source.tms.name = "PM"
+    source.format = "TIFF_PNG_UINT8"
+    source.channels = 3
+    source.type = PyramidType.RASTER
+    source.pyramids = [pyramid1, pyramid2]
+    mocked_source.return_value = source
+
+    to_pyramid = MagicMock()
+    to_pyramid.storage_s3_cluster = None
+    to_pyramid.storage_root = "bucket"
+    to_pyramid.name = "joincache"
+    to_pyramid.list = f"file://{tmp_path}/joincache.list"
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, col, row: f"s3://final/{slab_type.name}_{col}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "6", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache", "root": "bucket", "mask": True},
+        "process": {
+            "parallelization": 2,
+            "mask": True,
+            "only_links": True,
+            "planners": 1,
+            "direct": True,
+            "incremental": False,
+            "mask_links": False,
+            "threads": 2,
+            "balancing": "COUNT",
+            "index": {"mode": "MEMORY"},
+            "directory": str(tmp_path / "todo"),
+            "compression": "NONE",
+            "todo_format": 1,
+        },
+    }
+
+    work(config)
+
+    # Liens faits par le master, sans todo lists
+    assert sorted(mocked_link.call_args_list) == sorted(
+        [
+            call("s3://p1/DATA_1_1", "s3://final/DATA_1_1"),
+            call("s3://p1/MASK_1_1", "s3://final/MASK_1_1"),
+            call("s3://p2/DATA_2_1", "s3://final/DATA_2_1"),
+        ]
+    )
+    assert not os.path.exists(tmp_path / "todo")
+
+    to_pyramid.write_descriptor.assert_called_once_with()
+    with open(tmp_path / "joincache.list") as f:
+        assert f.read() == "0=bucket/joincache\n1=p1\n2=p2\n#\n1/DATA_1_1\n1/MASK_1_1\n2/DATA_2_1\n"
+
+
+@mock.patch("rok4_tools.joincache_utils.master.storage.remove")
+@mock.patch("rok4_tools.joincache_utils.master.SourcePyramids")
+@mock.patch("rok4_tools.joincache_utils.master.Pyramid.from_other")
+def test_incremental(mocked_from_other, mocked_source, mocked_remove, tmp_path):
+    level6 = MagicMock()
+    level6.id = "6"
+
+    def get_slabs(root, slabs):
+        return [
+            ((SlabType.DATA, "6", col, 1), {"root": root, "slab": f"DATA_{col}_1", "md5": md5})
+            for col, md5 in slabs
+        ]
+
+    pyramid1 = get_pyramid("p1", level6, [])
+    pyramid1.list_generator.return_value = get_slabs("p1", [(1, "a"), (2, "b")])
+    pyramid2 = get_pyramid("p2", level6, [])
+    pyramid2.list_generator.return_value = get_slabs("p2", [(1, "c"), (3, "d")])
+
+    source = MagicMock()
+    source.tms.name = "PM"
+    source.format = "TIFF_PNG_UINT8"
+    source.channels = 3
+    source.type = PyramidType.RASTER
+    source.pyramids = [pyramid1, pyramid2]
+    mocked_source.return_value = source
+
+    to_pyramid = MagicMock()
+    to_pyramid.storage_s3_cluster = None
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, col, row: f"s3://final/{slab_type.name}_{col}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "6", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache", "root": "bucket", "mask": False},
+        "process": {
+            "parallelization": 1,
+            "mask": False,
+            "only_links": False,
+            "planners": 1,
+            "direct": False,
+            "incremental": False,
+            "mask_links": False,
+            "manifest": str(tmp_path / "manifest"),
+            "balancing": "COUNT",
+            "index": {"mode": "MEMORY"},
+            "directory": str(tmp_path),
+            "compression": "NONE",
+            "todo_format": 1,
+        },
+    }
+
+    # Génération complète, le manifeste est déposé par le finisher
+    work(config)
+    os.rename(tmp_path / "todo.manifest", tmp_path / "manifest")
+
+    # Mise à jour de la deuxième pyramide : la dalle 3_1 change, une dalle 2_1 est ajoutée
+    pyramid2.list_generator.return_value = get_slabs("p2", [(1, "c"), (2, "e"), (3, "f")])
+    to_pyramid.list_generator.return_value = [
+        (
+            (SlabType.DATA, "6", 1, 1),
+            {"root": "bucket/joincache", "link": False, "slab": "DATA_1_1", "md5": None},
+        ),
+        ((SlabType.DATA, "6", 2, 1), {"root": "p1", "link": True, "slab": "DATA_2_1", "md5": "b"}),
+        ((SlabType.DATA, "6", 3, 1), {"root": "p2", "link": True, "slab": "DATA_3_1", "md5": "d"}),
+    ]
+    config["process"]["incremental"] = True
+
+    work(config)
+
+    with open(tmp_path / "todo.1.list") as f:
+        assert f.read() == (
+            "c2w s3://p1/DATA_2_1\nc2w s3://p2/DATA_2_1\noNt\nw2c s3://final/DATA_2_1\n"
+            + "link s3://final/DATA_3_1 s3://p2/DATA_3_1 1\n"
+        )
+    with open(tmp_path / "todo.kept.list") as f:
+        assert f.read() == "0/DATA_1_1\n"
+    with open(tmp_path / "todo.finisher.list") as f:
+        assert f.read() == "1=p2\n"
+
+    # Le lien précédent n'est supprimé que par l'agent, au moment d'écrire la superposition
+    assert mock.call("s3://final/DATA_2_1") not in mocked_remove.call_args_list
+
+
+@mock.patch("rok4_tools.joincache_utils.master.SourcePyramids")
+@mock.patch("rok4_tools.joincache_utils.master.Pyramid.from_other")
+def test_incremental_masks(mocked_from_other, mocked_source, tmp_path):
+    level6 = MagicMock()
+    level6.id = "6"
+
+    def get_slabs(root, slabs):
+        return [
+            (
+                (slab_type, "6", col, 1),
+                {"root": root, "slab": f"{slab_type.name}_{col}_1", "md5": md5},
+            )
+            for slab_type, col, md5 in slabs
+        ]
+
+    # Dalles 2_1 et 3_1 sans masque dans leur unique source
+    pyramid1 = get_pyramid("p1", level6, [])
+    pyramid1.list_generator.return_value = get_slabs(
+        "p1", [(SlabType.DATA, 1, "a"), (SlabType.MASK, 1, "m"), (SlabType.DATA, 2, "b")]
+    )
+    pyramid2 = get_pyramid("p2", level6, [])
+    pyramid2.list_generator.return_value = get_slabs(
+        "p2", [(SlabType.DATA, 1, "c"), (SlabType.DATA, 3, "d")]
+    )
+
+    source = MagicMock()
+    source.tms.name = "PM"
+    source.format = "TIFF_PNG_UINT8"
+    source.channels = 3
+    source.type = PyramidType.RASTER
+    source.pyramids = [pyramid1, pyramid2]
+    mocked_source.return_value = source
+
+    to_pyramid = MagicMock()
+    to_pyramid.storage_s3_cluster = None
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, col, row: f"s3://final/{slab_type.name}_{col}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "6", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache", "root": "bucket", "mask": True},
+        "process": {
+            "parallelization": 1,
+            "mask": True,
+            "only_links": False,
+            "planners": 1,
+            "direct": False,
+            "incremental": False,
+            "mask_links": False,
+            "manifest": str(tmp_path / "manifest"),
+            "balancing": "COUNT",
+            "index": {"mode": "MEMORY"},
+            "directory": str(tmp_path),
+            "compression": "NONE",
+            "todo_format": 1,
+        },
+    }
+
+    work(config)
+    os.rename(tmp_path / "todo.manifest", tmp_path / "manifest")
+
+    # Sortie précédente : superposition 1_1 avec son masque, liens vers les données seules sinon
+    to_pyramid.list_generator.return_value = [
+        (
+            (slab_type, "6", 1, 1),
+            {
+                "root": "bucket/joincache",
+                "link": False,
+                "slab": f"{slab_type.name}_1_1",
+                "md5": None,
+            },
+        )
+        for slab_type in [SlabType.DATA, SlabType.MASK]
+    ] + [
+        ((SlabType.DATA, "6", 2, 1), {"root": "p1", "link": True, "slab": "DATA_2_1", "md5": "b"}),
+        ((SlabType.DATA, "6", 3, 1), {"root": "p2", "link": True, "slab": "DATA_3_1", "md5": "d"}),
+    ]
+    config["process"]["incremental"] = True
+
+    work(config)
+
+    # Rien n'a changé : aucune dalle recalculée, même sans masque précédent pour 2_1 et 3_1
+    with open(tmp_path / "todo.1.list") as f:
+        assert f.read() == ""
+    with open(tmp_path / "todo.kept.list") as f:
+        assert f.read() == "0/DATA_1_1\n0/MASK_1_1\n1/DATA_2_1 b\n2/DATA_3_1 d\n"
+
+
+@mock.patch("rok4_tools.joincache_utils.master.slab.is_full_mask")
+@mock.patch("rok4_tools.joincache_utils.master.SourcePyramids")
+@mock.patch("rok4_tools.joincache_utils.master.Pyramid.from_other")
+def test_mask_links(mocked_from_other, mocked_source, mocked_is_full_mask, tmp_path):
+    level6 = MagicMock()
+    level6.id = "6"
+    pyramid1 = get_pyramid(
+        "p1",
+        level6,
+        [
+            (SlabType.DATA, 1, 1),
+            (SlabType.MASK, 1, 1),
+            (SlabType.DATA, 2, 1),
+            (SlabType.MASK, 2, 1),
+        ],
+    )
+    pyramid2 = get_pyramid("p2", level6, [(SlabType.DATA, 1, 1), (SlabType.DATA, 2, 1)])
+
+    source = MagicMock()
+    source.tms.name = "PM"
+    source.format = "TIFF_PNG_UINT8"
+    source.channels = 3
+    source.type = PyramidType.RASTER
+    source.pyramids = [pyramid1, pyramid2]
+    mocked_source.return_value = source
+
+    to_pyramid = MagicMock()
+    to_pyramid.storage_s3_cluster = None
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, col, row: f"s3://final/{slab_type.name}_{col}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+
+    # Seul le masque de la dalle 1_1 est plein
+    mocked_is_full_mask.side_effect = lambda path, full_tiles: path == "s3://p1/MASK_1_1"
+
+    config = {
+        "datasources": [{"bottom": "6", "top": "6", "source": {"descriptors": ["path"]}}],
+        "pyramid": {"name": "joincache", "root": "bucket", "mask": True},
+        "process": {
+            "parallelization": 1,
+            "mask": True,
+            "only_links": False,
+            "planners": 1,
+            "direct": False,
+            "incremental": False,
+            "mask_links": True,
+            "balancing": "COUNT",
+            "index": {"mode": "MEMORY"},
+            "directory": str(tmp_path),
+            "compression": "NONE",
+            "todo_format": 1,
+        },
+    }
+
+    work(config)
+
+    with open(os.path.join(tmp_path, "todo.1.list")) as f:
+        assert f.read() == (
+            "link s3://final/DATA_1_1 s3://p1/DATA_1_1 1\n"
+            + "link s3://final/MASK_1_1 s3://p1/MASK_1_1 1\n"
+            + "c2w s3://p1/DATA_2_1\nc2w s3://p1/MASK_2_1\nc2w s3://p2/DATA_2_1\n"
+            + "oNt\nw2c s3://final/DATA_2_1\nw2c s3://final/MASK_2_1\n"
+        )
@@ -0,0 +1,189 @@
+import hashlib
+import os
+from unittest import mock
+from unittest.mock import *
+
+import pytest
+from rok4.enums import SlabType
+from rok4.pyramid import Pyramid
+
+from rok4_tools.global_utils.local_cache import *
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def get_cached(cache, path):
+    return os.path.join(cache, hashlib.sha256(path.encode()).hexdigest() + ".data")
+
+
+def test_get_local_disabled(tmp_path, monkeypatch):
+    monkeypatch.delenv("ROK4_TOOLS_CACHE_DIRECTORY", raising=False)
+    source = os.path.join(tmp_path, "source.list")
+    write(source, "content")
+
+    local = get_local(f"file://{source}")
+    with open(local) as f:
+        assert f.read() == "content"
+    os.remove(local)
+
+
+def test_get_local_cached(tmp_path, monkeypatch):
+    cache = os.path.join(tmp_path, "cache")
+    monkeypatch.setenv("ROK4_TOOLS_CACHE_DIRECTORY", cache)
+    source = os.path.join(tmp_path, "source.list")
+    write(source, "content")
+
+    def read_local():
+        local = get_local(f"file://{source}")
+        assert os.path.dirname(local) == cache
+        with open(local) as f:
+            content = f.read()
+        os.remove(local)
+        return content
+
+    with mock.patch(
+        "rok4_tools.global_utils.local_cache.storage.copy", wraps=storage.copy
+    ) as mocked_copy:
+        assert read_local() == "content"
+
+        # Copie locale réutilisée
+        assert read_local() == "content"
+        assert mocked_copy.call_count == 1
+
+        # Source modifiée : copie refaite
+        write(source, "new content")
+        assert read_local() == "new content"
+        assert mocked_copy.call_count == 2
+
+    cached = get_cached(cache, f"file://{source}")
+    assert sorted(os.listdir(cache)) == sorted(
+        [os.path.basename(cached), os.path.basename(cached)[:-5] + ".version"]
+    )
+
+
+def test_get_local_evicted(tmp_path, monkeypatch):
+    cache = os.path.join(tmp_path, "cache")
+    monkeypatch.setenv("ROK4_TOOLS_CACHE_DIRECTORY", cache)
+    source = os.path.join(tmp_path, "source.list")
+    write(source, "content")
+
+    # Copie évincée par un autre processus pendant la lecture : le lecteur la lit toujours
+    local = get_local(f"file://{source}")
+    os.remove(get_cached(cache, f"file://{source}"))
+    with open(local) as f:
+        assert f.read() == "content"
+    os.remove(local)
+
+    # Copie évincée entre la lecture de sa version et son utilisation : elle est refaite
+    local = get_local(f"file://{source}")
+    with open(local) as f:
+        assert f.read() == "content"
+    os.remove(local)
+    assert os.path.exists(get_cached(cache, f"file://{source}"))
+
+
+def test_get_local_eviction(tmp_path, monkeypatch):
+    cache = os.path.join(tmp_path, "cache")
+    monkeypatch.setenv("ROK4_TOOLS_CACHE_DIRECTORY", cache)
+    monkeypatch.setenv("ROK4_TOOLS_CACHE_SIZE", "1")
+
+    cached = []
+    for i in range(3):
+        source = os.path.join(tmp_path, f"source{i}.list")
+        write(source, "0" * 400000)
+        cached.append(get_cached(cache, f"file://{source}"))
+
+    for i in range(2):
+        os.remove(get_local(f"file://{tmp_path}/source{i}.list"))
+        os.utime(cached[i], (i, i))
+
+    # Source 0 utilisée à nouveau : la moins récemment utilisée est la 1
+    os.remove(get_local(f"file://{tmp_path}/source0.list"))
+    os.remove(get_local(f"file://{tmp_path}/source2.list"))
+
+    assert os.path.exists(cached[0])
+    assert not os.path.exists(cached[1])
+    assert not os.path.exists(cached[1][:-5] + ".version")
+    assert os.path.exists(cached[2])
+
+
+def test_list_generator_disabled(monkeypatch):
+    monkeypatch.delenv("ROK4_TOOLS_CACHE_DIRECTORY", raising=False)
+    pyramid = MagicMock()
+    pyramid.list_generator.return_value = iter([("slab", "infos")])
+    pyramid.load_list.return_value = 1
+
+    assert list(list_generator(pyramid, "6")) == [("slab", "infos")]
+    pyramid.list_generator.assert_called_once_with("6")
+    assert load_list(pyramid) == 1
+
+
+def test_list_generator_cached(tmp_path, monkeypatch, file_pyramid):
+    cache = os.path.join(tmp_path, "cache")
+    monkeypatch.setenv("ROK4_TOOLS_CACHE_DIRECTORY", cache)
+    pyramid = Pyramid.from_descriptor(file_pyramid("pyramid"))
+    write(
+        f"{tmp_path}/pyramid.list",
+        "0=/data/pyramid\n1=/data/source\n#\n0/DATA/6/00/00/11.tif md5\n1/DATA/6/00/00/21.tif\n"
+        + "0/DATA/7/00/00/11.tif\n",
+    )
+
+    with mock.patch(
+        "rok4_tools.global_utils.local_cache.storage.copy", wraps=storage.copy
+    ) as mocked_copy:
+        assert list(list_generator(pyramid, "6")) == [
+            (
+                (SlabType.DATA, "6", 1, 1),
+                {
+                    "root": "/data/pyramid",
+                    "link": False,
+                    "slab": "DATA/6/00/00/11.tif",
+                    "md5": "md5",
+                },
+            ),
+            (
+                (SlabType.DATA, "6", 2, 1),
+                {"root": "/data/source", "link": True, "slab": "DATA/6/00/00/21.tif", "md5": None},
+            ),
+        ]
+        assert mocked_copy.call_count == 1
+
+        # Copie locale lue directement : ni nouvelle lecture du stockage, ni copie temporaire
+        with mock.patch(
+            "rok4_tools.global_utils.local_cache.tempfile.NamedTemporaryFile"
+        ) as mocked_tmp, mock.patch("rok4.pyramid.copy") as mocked_pyramid_copy:
+            assert len(list(list_generator(pyramid))) == 3
+            assert load_list(pyramid) == 3
+        assert mocked_copy.call_count == 1
+        mocked_tmp.assert_not_called()
+        mocked_pyramid_copy.assert_not_called()
+
+    assert len(os.listdir(cache)) == 2
+
+
+def test_list_generator_s3_cluster(tmp_path, monkeypatch):
+    monkeypatch.setenv("ROK4_TOOLS_CACHE_DIRECTORY", os.path.join(tmp_path, "cache"))
+    write(f"{tmp_path}/pyramid.list", "0=bucket/pyramid\n#\n0/DATA_6_1_1\n")
+
+    pyramid = MagicMock()
+    pyramid.list = f"file://{tmp_path}/pyramid.list"
+    pyramid.storage_s3_cluster = "cluster"
+    pyramid.get_infos_from_slab_path.return_value = (SlabType.DATA, "6", 1, 1)
+
+    # Nom du cluster ajouté au bucket des racines, comme le fait Pyramid.list_generator
+    assert list(list_generator(pyramid))[0][1]["root"] == "bucket@cluster/pyramid"
+
+
+def test_list_generator_invalid(tmp_path, monkeypatch):
+    monkeypatch.setenv("ROK4_TOOLS_CACHE_DIRECTORY", os.path.join(tmp_path, "cache"))
+    write(f"{tmp_path}/pyramid.list", "0=bucket/pyramid\n")
+
+    pyramid = MagicMock()
+    pyramid.list = f"file://{tmp_path}/pyramid.list"
+
+    with pytest.raises(Exception) as exc:
+        list(list_generator(pyramid))
+    assert "no end of root table" in str(exc.value)
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from rok4_tools.global_utils.pipeline import *
+
+
+def test_run():
+    stages_threads = [set(), set()]
+
+    def double(item):
+        stages_threads[0].add(threading.current_thread().name)
+        return item * 2
+
+    def increment(item):
+        stages_threads[1].add(threading.current_thread().name)
+        time.sleep(0.001)
+        return item + 1
+
+    assert list(run(range(20), [double, increment], 2)) == [i * 2 + 1 for i in range(20)]
+
+    # Chaque étape dans son propre thread
+    assert len(stages_threads[0]) == 1 and len(stages_threads[1]) == 1
+    assert stages_threads[0] != stages_threads[1]
+
+
+def test_bounded():
+    read = []
+
+    def items():
+        for i in range(100):
+            read.append(i)
+            yield i
+
+    results = run(items(), [lambda item: item, lambda item: item], 2)
+    assert next(results) == 0
+    time.sleep(0.1)
+
+    # Au plus 2 éléments en attente entre deux étapes, un en cours dans chaque étape
+    assert len(read) <= 8
+    results.close()
+
+
+def test_error():
+    def failing(item):
+        if item == 3:
+            raise ValueError("Stage failure")
+        return item
+
+    results = []
+    with pytest.raises(ValueError) as exc:
+        for item in run(range(10), [lambda item: item, failing], 1):
+            results.append(item)
+
+    assert "Stage failure" in str(exc.value)
+    assert results == [0, 1, 2]
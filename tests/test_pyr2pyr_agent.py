@@ -0,0 +1,186 @@
+import gzip
+import json
+import os
+from unittest import mock
+from unittest.mock import *
+
+import pytest
+
+from rok4_tools.pyr2pyr_utils.agent import *
+
+
+def fake_copy(failing=None):
+    """Only record slabs' copies"""
+
+    copied = []
+
+    def copy(from_path, to_path, from_md5=None):
+        if from_path == failing:
+            raise Exception(f"Cannot copy {from_path}")
+
+        copied.append((from_path, to_path, from_md5))
+
+    return copy, copied
+
+
+def write_todo(directory, lines):
+    with open(os.path.join(directory, "todo.1.list"), "w") as f:
+        for line in lines:
+            f.write(f"{line}\n")
+
+
+def get_config(directory, threads):
+    return {
+        "process": {
+            "directory": str(directory),
+            "threads": threads,
+            "mode": "SPLIT",
+            "checkpoint": {"lines": 10000, "seconds": 60},
+        }
+    }
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.agent.storage_tools.copy")
+def test_ok(mocked_copy, tmp_path):
+    write_todo(
+        tmp_path,
+        [f"cp s3://from/DATA_{i} s3://to/DATA_{i}" for i in range(20)]
+        + ["cp s3://from/DATA_20 s3://to/DATA_20 md5sum"],
+    )
+    mocked_copy.side_effect, copied = fake_copy()
+
+    work(get_config(tmp_path, 4), 1)
+
+    assert sorted(copied) == sorted(
+        [(f"s3://from/DATA_{i}", f"s3://to/DATA_{i}", None) for i in range(20)]
+        + [("s3://from/DATA_20", "s3://to/DATA_20", "md5sum")]
+    )
+    assert not os.path.exists(os.path.join(tmp_path, "todo.1.checkpoint"))
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.agent.storage_tools.copy")
+def test_invalid_line(mocked_copy, tmp_path):
+    write_todo(tmp_path, ["cp s3://from/DATA_0 s3://to/DATA_0", "link s3://to/DATA_1"])
+    mocked_copy.side_effect, copied = fake_copy()
+
+    with pytest.raises(Exception) as exc:
+        work(get_config(tmp_path, 1), 1)
+    assert "Invalid todo list line" in str(exc.value)
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.agent.storage_tools.copy")
+def test_resume(mocked_copy, tmp_path):
+    write_todo(tmp_path, [f"cp s3://from/DATA_{i} s3://to/DATA_{i}" for i in range(10)])
+
+    # Première exécution : la copie de la ligne 5 échoue
+    mocked_copy.side_effect, copied = fake_copy(failing="s3://from/DATA_5")
+    with pytest.raises(Exception) as exc:
+        work(get_config(tmp_path, 1), 1)
+    assert "Cannot copy s3://from/DATA_5" in str(exc.value)
+
+    with open(os.path.join(tmp_path, "todo.1.checkpoint")) as f:
+        assert json.load(f) == {"offset": 175, "lines": 5}
+
+    # Reprise : seules les lignes à partir de la 5 sont traitées
+    mocked_copy.side_effect, copied = fake_copy()
+    work(get_config(tmp_path, 3), 1)
+
+    assert sorted(copied) == sorted(
+        [(f"s3://from/DATA_{i}", f"s3://to/DATA_{i}", None) for i in range(5, 10)]
+    )
+    assert not os.path.exists(os.path.join(tmp_path, "todo.1.checkpoint"))
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.agent.storage_tools.copy")
+def test_queue(mocked_copy, tmp_path):
+    for chunk in range(1, 4):
+        with open(os.path.join(tmp_path, f"chunk.{chunk}.list"), "w") as f:
+            for i in range(chunk * 10, chunk * 10 + 3):
+                f.write(f"cp s3://from/DATA_{i} s3://to/DATA_{i}\n")
+    with open(os.path.join(tmp_path, "queue.json"), "w") as f:
+        f.write('{"chunks": 3}')
+
+    # Morceau 2 réservé par un agent qui ne donne plus de nouvelles
+    with open(os.path.join(tmp_path, "chunk.2.lease.0"), "w") as f:
+        f.write('{"owner": "lost", "expires": 0}')
+
+    mocked_copy.side_effect, copied = fake_copy()
+
+    config = get_config(f"file://{tmp_path}", 2)
+    config["process"]["mode"] = "QUEUE"
+    config["process"]["queue"] = {"chunk_size": 3, "lease": 600}
+    work(config, 1)
+
+    assert sorted(copied) == sorted(
+        [
+            (f"s3://from/DATA_{i}", f"s3://to/DATA_{i}", None)
+            for chunk in range(1, 4)
+            for i in range(chunk * 10, chunk * 10 + 3)
+        ]
+    )
+    for chunk in range(1, 4):
+        assert os.path.exists(os.path.join(tmp_path, f"chunk.{chunk}.done"))
+        assert not os.path.exists(os.path.join(tmp_path, f"chunk.{chunk}.checkpoint"))
+    assert os.path.exists(os.path.join(tmp_path, "chunk.2.lease.1"))
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.agent.storage_tools.copy")
+def test_resume_gzip(mocked_copy, tmp_path):
+    with gzip.open(os.path.join(tmp_path, "todo.1.list"), "wt") as f:
+        for i in range(10):
+            f.write(f"cp s3://from/DATA_{i} s3://to/DATA_{i}\n")
+    # Progression exprimée dans le contenu décompressé
+    with open(os.path.join(tmp_path, "todo.1.checkpoint"), "w") as f:
+        f.write('{"offset": 175, "lines": 5}')
+
+    mocked_copy.side_effect, copied = fake_copy()
+    work(get_config(tmp_path, 2), 1)
+
+    assert sorted(copied) == sorted(
+        [(f"s3://from/DATA_{i}", f"s3://to/DATA_{i}", None) for i in range(5, 10)]
+    )
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.agent.storage_tools.copy")
+def test_resume_zstd(mocked_copy, tmp_path):
+    pytest.importorskip("zstandard")
+
+    writer = todo_list.TodoListWriter("ZSTD", indexed=True)
+    for i in range(10):
+        writer.write(f"cp {writer.get_path('s3://from', f's3://from/DATA_{i}')} s3://to/DATA_{i}\n")
+    writer.upload(f"file://{tmp_path}/todo.1.list")
+    # Progression exprimée dans le contenu décompressé, en-tête compris
+    with open(os.path.join(tmp_path, "todo.1.checkpoint"), "w") as f:
+        offset = len("#ROK4TODO 2\n0=s3://from\n#\n") + 5 * len("cp 0/DATA_0 s3://to/DATA_0\n")
+        f.write(f'{{"offset": {offset}, "lines": 5}}')
+
+    mocked_copy.side_effect, copied = fake_copy()
+    work(get_config(tmp_path, 2), 1)
+
+    assert sorted(copied) == sorted(
+        [(f"s3://from/DATA_{i}", f"s3://to/DATA_{i}", None) for i in range(5, 10)]
+    )
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.agent.storage_tools.copy")
+def test_resume_indexed(mocked_copy, tmp_path):
+    write_todo(
+        tmp_path,
+        ["#ROK4TODO 2", "0=s3://from", "1=s3://to", "#"]
+        + [f"cp 0/DATA_{i} 1/DATA_{i}" for i in range(10)],
+    )
+
+    # Première exécution : la copie de la ligne 5 échoue, la progression inclut l'en-tête
+    mocked_copy.side_effect, copied = fake_copy(failing="s3://from/DATA_5")
+    with pytest.raises(Exception):
+        work(get_config(tmp_path, 1), 1)
+
+    with open(os.path.join(tmp_path, "todo.1.checkpoint")) as f:
+        assert json.load(f) == {"offset": 36 + 5 * 21, "lines": 5}
+
+    mocked_copy.side_effect, copied = fake_copy()
+    work(get_config(tmp_path, 2), 1)
+
+    assert sorted(copied) == sorted(
+        [(f"s3://from/DATA_{i}", f"s3://to/DATA_{i}", None) for i in range(5, 10)]
+    )
@@ -0,0 +1,103 @@
+import os
+from unittest import mock
+from unittest.mock import *
+
+import pytest
+from rok4.enums import StorageType
+
+from rok4_tools.pyr2pyr_utils.finisher import *
+
+
+def get_config(directory, parallelization):
+    return {
+        "from": {"descriptor": "s3://bucket/from.json"},
+        "to": {"name": "to", "storage": {"type": "S3", "root": "bucket"}},
+        "process": {
+            "directory": str(directory),
+            "parallelization": parallelization,
+            "mode": "SPLIT",
+            "threads": 2,
+            "incremental": True,
+        },
+    }
+
+
+def mock_pyramids(mocked_from_other, directory):
+    to_pyramid = MagicMock()
+    to_pyramid.name = "to"
+    to_pyramid.storage_type = StorageType.S3
+    to_pyramid.storage_root = "bucket"
+    to_pyramid.storage_s3_cluster = "cluster"
+    to_pyramid.list = os.path.join(directory, "to.list")
+    mocked_from_other.return_value = to_pyramid
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.finisher.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.finisher.Pyramid.from_other")
+def test_ok(mocked_from_other, mocked_from_descriptor, tmp_path):
+    mock_pyramids(mocked_from_other, tmp_path)
+
+    todo_lists = {
+        "todo.1.list": "cp s3://bucket/from/DATA_6_0_1 s3://bucket@cluster/to/DATA_6_0_1 aaa\n"
+        "cp s3://bucket/from/DATA_6_1_1 s3://bucket@cluster/to/DATA_6_1_1\n",
+        "todo.2.list": "",
+        "todo.3.list": "cp s3://bucket/from/DATA_6_2_1 s3://bucket@cluster/to/DATA_6_2_1",
+        "todo.finisher.list": "keep s3://bucket@cluster/to/DATA_6_3_1 ddd\n",
+    }
+    for name, content in todo_lists.items():
+        with open(os.path.join(tmp_path, name), "w") as f:
+            f.write(content)
+
+    work(get_config(tmp_path, 3))
+
+    with open(os.path.join(tmp_path, "to.list")) as f:
+        assert f.read() == (
+            "0=bucket/to\n#\n0/DATA_6_0_1 aaa\n0/DATA_6_1_1\n0/DATA_6_2_1\n0/DATA_6_3_1 ddd\n"
+        )
+
+    assert os.listdir(tmp_path) == ["to.list"]
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.finisher.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.finisher.Pyramid.from_other")
+def test_zstd(mocked_from_other, mocked_from_descriptor, tmp_path):
+    pytest.importorskip("zstandard")
+    mock_pyramids(mocked_from_other, tmp_path)
+
+    # Todo lists sans table des racines, compressées en zstd
+    todo_lists = {
+        "todo.1.list": "cp s3://bucket/from/DATA_6_0_1 s3://bucket@cluster/to/DATA_6_0_1 aaa\n",
+        "todo.finisher.list": "keep s3://bucket@cluster/to/DATA_6_3_1 ddd\n",
+    }
+    for name, content in todo_lists.items():
+        todo_list_obj, todo_list_tmp = todo_list.create("ZSTD")
+        todo_list_obj.write(content)
+        todo_list.upload(todo_list_obj, todo_list_tmp, f"file://{tmp_path}/{name}")
+
+    work(get_config(tmp_path, 1))
+
+    with open(os.path.join(tmp_path, "to.list")) as f:
+        assert f.read() == "0=bucket/to\n#\n0/DATA_6_0_1 aaa\n0/DATA_6_3_1 ddd\n"
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.finisher.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.finisher.Pyramid.from_other")
+def test_invalid_line(mocked_from_other, mocked_from_descriptor, tmp_path):
+    mock_pyramids(mocked_from_other, tmp_path)
+
+    with open(os.path.join(tmp_path, "todo.1.list"), "w") as f:
+        f.write(
+            "cp s3://bucket/from/DATA_6_0_1 s3://bucket@cluster/to/DATA_6_0_1\n"
+            "link s3://bucket@cluster/to/DATA_6_1_1\n"
+        )
+    with open(os.path.join(tmp_path, "todo.finisher.list"), "w") as f:
+        f.write("")
+
+    with pytest.raises(Exception) as exc:
+        work(get_config(tmp_path, 1))
+    assert "Invalid todo list line" in str(exc.value)
+    assert "link s3://bucket@cluster/to/DATA_6_1_1" in str(exc.value)
+
+    # Rien n'est écrit et les TODO lists sont conservées
+    assert not os.path.exists(os.path.join(tmp_path, "to.list"))
+    assert os.path.exists(os.path.join(tmp_path, "todo.1.list"))
@@ -0,0 +1,285 @@
+import os
+from unittest import mock
+from unittest.mock import *
+
+from rok4.enums import SlabType, StorageType
+
+from rok4_tools.pyr2pyr_utils.master import *
+
+
+def get_pyramids(mocked_from_descriptor, mocked_from_other, slabs):
+    from_pyramid = MagicMock()
+    from_pyramid.storage_type = StorageType.S3
+    from_pyramid.list_generator.return_value = [
+        (
+            (SlabType.DATA, "6", i, 1),
+            {"link": False, "md5": None, "root": "bucket/from", "slab": f"DATA_6_{i}_1"},
+        )
+        for i in range(slabs)
+    ]
+    mocked_from_descriptor.return_value = from_pyramid
+
+    to_pyramid = MagicMock()
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, column, row: f"s3://bucket/to/{slab_type.name}_{level}_{column}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+
+
+def read_todo_lists(directory, parallelization):
+    todo_lists = []
+    for i in range(parallelization):
+        with open(os.path.join(directory, f"todo.{i+1}.list")) as f:
+            todo_lists.append([line.split(" ")[1] for line in f.read().splitlines()])
+
+    return todo_lists
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_other")
+def test_count_balancing(mocked_from_other, mocked_from_descriptor, tmp_path):
+    get_pyramids(mocked_from_descriptor, mocked_from_other, 5)
+
+    config = {
+        "from": {"descriptor": "s3://bucket/from.json"},
+        "to": {"name": "to", "storage": {"type": "S3", "root": "bucket"}},
+        "process": {
+            "directory": str(tmp_path),
+            "parallelization": 2,
+            "mode": "SPLIT",
+            "balancing": "COUNT",
+            "follow_links": False,
+            "slab_limit": 0,
+            "compression": "NONE",
+            "todo_format": 1,
+            "incremental": False,
+        },
+    }
+    work(config)
+
+    assert read_todo_lists(tmp_path, 2) == [
+        [
+            "s3://bucket/from/DATA_6_0_1",
+            "s3://bucket/from/DATA_6_2_1",
+            "s3://bucket/from/DATA_6_4_1",
+        ],
+        ["s3://bucket/from/DATA_6_1_1", "s3://bucket/from/DATA_6_3_1"],
+    ]
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools.storage.get_size")
+@mock.patch("rok4_tools.global_utils.storage_tools.get_sizes")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_other")
+def test_size_balancing(
+    mocked_from_other, mocked_from_descriptor, mocked_get_sizes, mocked_get_size, tmp_path
+):
+    get_pyramids(mocked_from_descriptor, mocked_from_other, 5)
+    sizes = {
+        "s3://bucket/from/DATA_6_0_1": 1000,
+        "s3://bucket/from/DATA_6_1_1": 10,
+        "s3://bucket/from/DATA_6_2_1": 10,
+        "s3://bucket/from/DATA_6_3_1": 10,
+        "s3://bucket/from/DATA_6_4_1": 900,
+    }
+    mocked_get_sizes.return_value = sizes
+
+    config = {
+        "from": {"descriptor": "s3://bucket/from.json"},
+        "to": {"name": "to", "storage": {"type": "S3", "root": "bucket"}},
+        "process": {
+            "directory": str(tmp_path),
+            "parallelization": 2,
+            "mode": "SPLIT",
+            "balancing": "SIZE",
+            "follow_links": False,
+            "slab_limit": 0,
+            "compression": "NONE",
+            "todo_format": 1,
+            "incremental": False,
+        },
+    }
+    work(config)
+
+    mocked_get_sizes.assert_called_once_with("s3://bucket/from")
+    mocked_get_size.assert_not_called()
+
+    assert read_todo_lists(tmp_path, 2) == [
+        ["s3://bucket/from/DATA_6_0_1"],
+        [
+            "s3://bucket/from/DATA_6_1_1",
+            "s3://bucket/from/DATA_6_2_1",
+            "s3://bucket/from/DATA_6_3_1",
+            "s3://bucket/from/DATA_6_4_1",
+        ],
+    ]
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools.storage.get_size")
+@mock.patch("rok4_tools.global_utils.storage_tools.get_sizes")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_other")
+def test_slab_limit(
+    mocked_from_other, mocked_from_descriptor, mocked_get_sizes, mocked_get_size, tmp_path
+):
+    get_pyramids(mocked_from_descriptor, mocked_from_other, 3)
+    mocked_get_sizes.return_value = {
+        "s3://bucket/from/DATA_6_0_1": 1000,
+        "s3://bucket/from/DATA_6_1_1": 10,
+    }
+    # Dalle absente du listage
+    mocked_get_size.return_value = 500
+
+    config = {
+        "from": {"descriptor": "s3://bucket/from.json"},
+        "to": {"name": "to", "storage": {"type": "S3", "root": "bucket"}},
+        "process": {
+            "directory": str(tmp_path),
+            "parallelization": 1,
+            "mode": "SPLIT",
+            "balancing": "COUNT",
+            "follow_links": False,
+            "slab_limit": 100,
+            "compression": "NONE",
+            "todo_format": 1,
+            "incremental": False,
+        },
+    }
+    work(config)
+
+    mocked_get_sizes.assert_called_once_with("s3://bucket/from")
+    mocked_get_size.assert_called_once_with("s3://bucket/from/DATA_6_2_1")
+
+    assert read_todo_lists(tmp_path, 1) == [
+        ["s3://bucket/from/DATA_6_0_1", "s3://bucket/from/DATA_6_2_1"]
+    ]
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.master.storage.exists", return_value=True)
+@mock.patch("rok4_tools.global_utils.storage_tools.storage.get_size")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.SizesIndex")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_other")
+def test_incremental(
+    mocked_from_other,
+    mocked_from_descriptor,
+    mocked_sizes_index,
+    mocked_get_size,
+    mocked_exists,
+    tmp_path,
+):
+    from_pyramid = MagicMock()
+    from_pyramid.storage_type = StorageType.S3
+    from_pyramid.list_generator.return_value = [
+        (
+            (SlabType.DATA, "6", i, 1),
+            {"link": False, "md5": md5, "root": "bucket/from", "slab": f"DATA_6_{i}_1"},
+        )
+        for i, md5 in enumerate(["aaa", "bbb", None, None, "eee"])
+    ]
+
+    existing_pyramid = MagicMock()
+    existing_pyramid.list_generator.return_value = [
+        ((SlabType.DATA, "6", 0, 1), {"link": False, "md5": "aaa"}),
+        ((SlabType.DATA, "6", 1, 1), {"link": False, "md5": "old"}),
+        ((SlabType.DATA, "6", 2, 1), {"link": False, "md5": None}),
+        ((SlabType.DATA, "6", 3, 1), {"link": False, "md5": None}),
+    ]
+    mocked_from_descriptor.side_effect = [from_pyramid, existing_pyramid]
+
+    to_pyramid = MagicMock()
+    to_pyramid.name = "to"
+    to_pyramid.storage_type = StorageType.S3
+    to_pyramid.descriptor = "s3://bucket/to.json"
+    to_pyramid.get_slab_path_from_infos.side_effect = (
+        lambda slab_type, level, column, row: f"s3://bucket/to/{slab_type.name}_{level}_{column}_{row}"
+    )
+    mocked_from_other.return_value = to_pyramid
+
+    sizes = {
+        "s3://bucket/from/DATA_6_2_1": 10,
+        "s3://bucket/from/DATA_6_3_1": 10,
+        "s3://bucket/to/DATA_6_2_1": 10,
+        "s3://bucket/to/DATA_6_3_1": 20,
+    }
+    mocked_sizes_index.return_value.get_size.side_effect = lambda root, path, fallback=True: sizes[
+        path
+    ]
+
+    config = {
+        "from": {"descriptor": "s3://bucket/from.json"},
+        "to": {"name": "to", "storage": {"type": "S3", "root": "bucket"}},
+        "process": {
+            "directory": str(tmp_path),
+            "parallelization": 1,
+            "mode": "SPLIT",
+            "balancing": "COUNT",
+            "follow_links": False,
+            "slab_limit": 0,
+            "compression": "NONE",
+            "todo_format": 1,
+            "incremental": True,
+        },
+    }
+    work(config)
+
+    mocked_from_descriptor.assert_has_calls(
+        [call("s3://bucket/from.json"), call("s3://bucket/to.json")]
+    )
+
+    with open(os.path.join(tmp_path, "todo.1.list")) as f:
+        assert f.read() == (
+            "cp s3://bucket/from/DATA_6_1_1 s3://bucket/to/DATA_6_1_1 bbb\n"
+            "cp s3://bucket/from/DATA_6_3_1 s3://bucket/to/DATA_6_3_1\n"
+            "cp s3://bucket/from/DATA_6_4_1 s3://bucket/to/DATA_6_4_1 eee\n"
+        )
+
+    with open(os.path.join(tmp_path, "todo.finisher.list")) as f:
+        assert f.read() == ("keep s3://bucket/to/DATA_6_0_1 aaa\nkeep s3://bucket/to/DATA_6_2_1\n")
+
+
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_descriptor")
+@mock.patch("rok4_tools.pyr2pyr_utils.master.Pyramid.from_other")
+def test_queue(mocked_from_other, mocked_from_descriptor, tmp_path):
+    get_pyramids(mocked_from_descriptor, mocked_from_other, 5)
+    # Fichiers d'un traitement précédent
+    with open(os.path.join(tmp_path, "chunk.4.done"), "w") as f:
+        f.write("")
+
+    config = {
+        "from": {"descriptor": "s3://bucket/from.json"},
+        "to": {"name": "to", "storage": {"type": "S3", "root": "bucket"}},
+        "process": {
+            "directory": f"file://{tmp_path}",
+            "parallelization": 1,
+            "mode": "QUEUE",
+            "queue": {"chunk_size": 2, "lease": 600},
+            "balancing": "COUNT",
+            "follow_links": False,
+            "slab_limit": 0,
+            "compression": "NONE",
+            "todo_format": 1,
+            "incremental": False,
+        },
+    }
+    work(config)
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "chunk.1.list",
+        "chunk.2.list",
+        "chunk.3.list",
+        "queue.json",
+    ]
+    with open(os.path.join(tmp_path, "queue.json")) as f:
+        assert f.read() == '{"chunks": 3}'
+
+    chunks = []
+    for i in range(3):
+        with open(os.path.join(tmp_path, f"chunk.{i+1}.list")) as f:
+            chunks.append([line.split(" ")[1] for line in f.read().splitlines()])
+
+    assert chunks == [
+        ["s3://bucket/from/DATA_6_0_1", "s3://bucket/from/DATA_6_1_1"],
+        ["s3://bucket/from/DATA_6_2_1", "s3://bucket/from/DATA_6_3_1"],
+        ["s3://bucket/from/DATA_6_4_1"],
+    ]
@@ -0,0 +1,52 @@
+import os
+from unittest import mock
+from unittest.mock import *
+
+from rok4_tools.global_utils.scratch import *
+
+
+def test_create_remove(tmp_path):
+    scratch = Scratch(str(tmp_path))
+    assert scratch.directory == str(tmp_path)
+
+    first = scratch.create(".tif")
+    second = scratch.create(".txt")
+    assert os.path.dirname(first) == str(tmp_path)
+    assert first.endswith(".tif")
+    assert scratch.files == {first, second}
+
+    scratch.remove(first)
+    assert not os.path.exists(first)
+    assert scratch.files == {second}
+
+    # Fichier déjà supprimé
+    scratch.remove(first)
+
+    # Fichiers restants, après une erreur par exemple
+    scratch.clean()
+    assert os.listdir(tmp_path) == []
+    assert scratch.files == set()
+
+
+@mock.patch("rok4_tools.global_utils.scratch.time.sleep")
+@mock.patch("rok4_tools.global_utils.scratch.shutil.disk_usage")
+def test_wait_space(mocked_disk_usage, mocked_sleep, tmp_path):
+    usage = MagicMock()
+    usage.free = 50
+    enough = MagicMock()
+    enough.free = 200
+    mocked_disk_usage.side_effect = [usage, usage, enough]
+
+    scratch = Scratch(str(tmp_path), 100)
+    path = scratch.create()
+
+    # L'agent attend que de la place se libère avant de créer le fichier
+    assert mocked_sleep.call_count == 2
+    assert os.path.exists(path)
+
+
+@mock.patch("rok4_tools.global_utils.scratch.shutil.disk_usage")
+def test_no_guard(mocked_disk_usage, tmp_path):
+    scratch = Scratch(str(tmp_path))
+    scratch.create()
+    mocked_disk_usage.assert_not_called()
@@ -0,0 +1,89 @@
+import os
+from unittest import mock
+
+import numpy
+import pytest
+from rok4.exceptions import FormatError
+
+from rok4_tools.global_utils.slab import *
+
+
+def test_write_read(tmp_path, slab_header):
+    header = slab_header(4, 2, 2, 2)
+    tiles = [b"tile0", b"", b"t2"]
+
+    with pytest.raises(Exception) as exc:
+        Slab(header, tiles).write(f"file://{tmp_path}/DATA.tif")
+    assert "3 tiles, 2 are expected" in str(exc.value)
+
+    Slab(header, tiles[0:2]).write(f"file://{tmp_path}/dir/DATA.tif")
+
+    slab = Slab.from_path(f"file://{tmp_path}/dir/DATA.tif")
+    assert slab.header == header
+    assert (slab.tile_width, slab.tile_height, slab.tiles_count) == (2, 2, 2)
+    assert slab.tiles == [b"tile0", b""]
+    assert os.path.getsize(f"{tmp_path}/dir/DATA.tif") == 2048 + 16 + 5
+
+
+@pytest.mark.parametrize("head_size", [2060, 2077])
+def test_index_only(head_size, tmp_path, slab_header):
+    Slab(slab_header(6, 2, 2, 2), [b"tile0", b"", b"t2"]).write(f"file://{tmp_path}/DATA.tif")
+
+    # Première lecture : en-tête, index complété si besoin, et tuiles comprises dans la lecture
+    with mock.patch("rok4_tools.global_utils.slab.HEAD_SIZE", head_size):
+        slab = Slab.from_path(f"file://{tmp_path}/DATA.tif", index_only=True)
+    assert slab.sizes == [5, 0, 2]
+    assert slab.tiles == ([b"tile0", b"", None] if head_size == 2077 else [None, b"", None])
+
+    slab.load_tiles([0, 1, 2])
+    assert slab.tiles == [b"tile0", b"", b"t2"]
+
+
+def test_not_rok4_slab():
+    with pytest.raises(FormatError):
+        Slab(b"GIF89a" + bytes(2042))
+
+
+@pytest.mark.parametrize(
+    "format,dtype",
+    [
+        ("TIFF_RAW_UINT8", "uint8"),
+        ("TIFF_ZIP_UINT8", "uint8"),
+        ("TIFF_PNG_UINT8", "uint8"),
+        ("TIFF_RAW_FLOAT32", "float32"),
+        ("TIFF_ZIP_FLOAT32", "float32"),
+    ],
+)
+@pytest.mark.parametrize("channels", [1, 3])
+def test_encode_decode(format, dtype, channels):
+    array = numpy.arange(4 * 2 * channels, dtype=dtype).reshape((2, 4, channels))
+
+    data = encode_tile(array, format)
+    assert numpy.array_equal(decode_tile(data, format, 4, 2, channels), array)
+    assert decode_tile(b"", format, 4, 2, channels) is None
+
+
+def test_format_not_handled():
+    assert not is_handled("TIFF_JPG_UINT8")
+    with pytest.raises(NotImplementedError):
+        decode_tile(b"data", "TIFF_JPG_UINT8", 2, 2, 3)
+
+
+def test_is_full_mask(tmp_path, slab_header):
+    full = encode_tile(numpy.full((2, 2, 1), 255, dtype="uint8"), MASK_FORMAT)
+    partial = encode_tile(numpy.array([[[255], [0]], [[255], [255]]], dtype="uint8"), MASK_FORMAT)
+
+    Slab(slab_header(4, 2, 2, 2), [full, full]).write(f"file://{tmp_path}/FULL.tif")
+    Slab(slab_header(4, 2, 2, 2), [full, partial]).write(f"file://{tmp_path}/PARTIAL.tif")
+    Slab(slab_header(4, 2, 2, 2), [full, b""]).write(f"file://{tmp_path}/EMPTY.tif")
+
+    full_tiles = set()
+    assert is_full_mask(f"file://{tmp_path}/FULL.tif", full_tiles)
+    assert full_tiles == {full}
+    assert not is_full_mask(f"file://{tmp_path}/PARTIAL.tif", full_tiles)
+    assert not is_full_mask(f"file://{tmp_path}/EMPTY.tif")
+
+    # Tuile pleine déjà connue, pas décodée à nouveau
+    with mock.patch("rok4_tools.global_utils.slab.decode_tile") as mocked_decode:
+        assert is_full_mask(f"file://{tmp_path}/FULL.tif", full_tiles)
+        mocked_decode.assert_not_called()
@@ -87,3 +87,57 @@ def test_init_sourcepyramids(mocked_pyramid_class):
         )
     except Exception as exc:
         assert False, f"Source pyramids creation raises an exception: {exc}"
+
+
+def get_pyramid(name, tms_name="TMS"):
+    level = MagicMock()
+    level.id = "10"
+    level.slab_width = 16
+    level.slab_height = 16
+
+    pyramid = MagicMock()
+    pyramid.name = name
+    pyramid.format = "TIFF_JPG_UINT8"
+    pyramid.tms.name = tms_name
+    pyramid.storage_s3_cluster = None
+    pyramid.type = PyramidType.RASTER
+    pyramid.channels = 3
+    pyramid.get_levels.return_value = [level]
+    return pyramid
+
+
+@mock.patch("rok4_tools.global_utils.source.Pyramid.from_descriptor")
+def test_parallel_loading(mocked_from_descriptor):
+    descriptors = [f"s3://pyramids/P{i}.json" for i in range(40)]
+    pyramids = {d: get_pyramid(d) for d in descriptors}
+    mocked_from_descriptor.side_effect = lambda descriptor: pyramids[descriptor]
+
+    datasources = SourcePyramids("10", "10", descriptors)
+
+    # Pyramides dans l'ordre des descripteurs, la première chargée seule avant les autres
+    assert datasources.pyramids == [pyramids[d] for d in descriptors]
+    assert mocked_from_descriptor.call_args_list[0] == call(descriptors[0])
+    assert mocked_from_descriptor.call_count == 40
+
+
+@mock.patch("rok4_tools.global_utils.source.Pyramid.from_descriptor")
+def test_loading_errors(mocked_from_descriptor):
+    descriptors = [f"s3://pyramids/P{i}.json" for i in range(5)]
+    pyramids = {d: get_pyramid(d) for d in descriptors}
+    pyramids[descriptors[1]] = get_pyramid(descriptors[1], "OTHER")
+
+    def from_descriptor(descriptor):
+        if descriptor == descriptors[3]:
+            raise Exception("not found")
+        return pyramids[descriptor]
+
+    # Les erreurs de chargement passent avant les vérifications de cohérence
+    mocked_from_descriptor.side_effect = from_descriptor
+    with pytest.raises(Exception) as exc:
+        SourcePyramids("10", "10", descriptors)
+    assert str(exc.value) == f"Cannot load source pyramid descriptor : {descriptors[3]} : not found"
+
+    mocked_from_descriptor.side_effect = lambda descriptor: pyramids[descriptor]
+    with pytest.raises(Exception) as exc:
+        SourcePyramids("10", "10", descriptors)
+    assert str(exc.value) == "Sources pyramids cannot have two different TMS : TMS and OTHER"
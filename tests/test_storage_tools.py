@@ -0,0 +1,264 @@
+import os
+from unittest import mock
+from unittest.mock import *
+
+import botocore.exceptions
+import pytest
+from rok4.exceptions import MissingEnvironmentError, StorageError
+
+from rok4_tools.global_utils.storage_tools import *
+from rok4_tools.global_utils.storage_tools import _get_s3_client
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools.boto3.client")
+def test_get_s3_client(mocked_client, monkeypatch):
+    monkeypatch.setattr("rok4_tools.global_utils.storage_tools._S3_CLIENTS", {})
+    monkeypatch.setenv("ROK4_S3_KEY", "key1,key2")
+    monkeypatch.setenv("ROK4_S3_SECRETKEY", "secret1,secret2")
+    monkeypatch.setenv("ROK4_S3_URL", "https://s3.storage.fr,http://s4.storage.fr")
+
+    s3_client, bucket_name = _get_s3_client("bucket")
+    assert bucket_name == "bucket"
+    assert s3_client["host"] == "s3.storage.fr"
+    assert s3_client["secure"]
+
+    s3_client, bucket_name = _get_s3_client("bucket@s4.storage.fr")
+    assert bucket_name == "bucket"
+    assert s3_client["key"] == "key2"
+    assert not s3_client["secure"]
+
+    # Clients créés une seule fois
+    assert mocked_client.call_count == 2
+    assert mocked_client.call_args.kwargs["config"].max_pool_connections == S3_MAX_POOL_CONNECTIONS
+
+    with pytest.raises(StorageError):
+        _get_s3_client("bucket@unknown.fr")
+
+
+def test_get_s3_client_error(monkeypatch):
+    monkeypatch.setattr("rok4_tools.global_utils.storage_tools._S3_CLIENTS", {})
+    monkeypatch.setenv("ROK4_S3_KEY", "key1,key2")
+    monkeypatch.setenv("ROK4_S3_SECRETKEY", "secret1")
+    monkeypatch.setenv("ROK4_S3_URL", "https://s3.storage.fr")
+    with pytest.raises(StorageError):
+        _get_s3_client("bucket")
+
+    monkeypatch.delenv("ROK4_S3_URL")
+    with pytest.raises(MissingEnvironmentError):
+        _get_s3_client("bucket")
+
+
+def test_get_sizes_file(tmp_path):
+    os.makedirs(os.path.join(tmp_path, "DATA", "6", "00"))
+    with open(os.path.join(tmp_path, "DATA", "6", "00", "01.tif"), "wb") as f:
+        f.write(b"0" * 10)
+    with open(os.path.join(tmp_path, "DATA", "6", "00", "02.tif"), "wb") as f:
+        f.write(b"0" * 20)
+    os.symlink("/not/existing", os.path.join(tmp_path, "DATA", "6", "00", "03.tif"))
+
+    assert get_sizes(f"file://{tmp_path}") == {
+        f"file://{tmp_path}/DATA/6/00/01.tif": 10,
+        f"file://{tmp_path}/DATA/6/00/02.tif": 20,
+    }
+
+
+def test_get_sizes_file_error():
+    with pytest.raises(StorageError):
+        get_sizes("file:///not/existing")
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_get_sizes_s3(mocked_s3_client):
+    s3_client = MagicMock()
+    s3_client.get_paginator.return_value.paginate.return_value = [
+        {
+            "Contents": [
+                {"Key": "pyramid/DATA_6_1_1", "Size": 10},
+                {"Key": "pyramid/DATA_6_1_2", "Size": 20},
+            ]
+        },
+        {"Contents": [{"Key": "pyramid/MASK_6_1_1", "Size": 5}]},
+    ]
+    mocked_s3_client.return_value = ({"client": s3_client}, "bucket")
+
+    assert get_sizes("s3://bucket@cluster/pyramid") == {
+        "s3://bucket@cluster/pyramid/DATA_6_1_1": 10,
+        "s3://bucket@cluster/pyramid/DATA_6_1_2": 20,
+        "s3://bucket@cluster/pyramid/MASK_6_1_1": 5,
+    }
+    mocked_s3_client.assert_called_once_with("bucket@cluster")
+    s3_client.get_paginator.return_value.paginate.assert_called_once_with(
+        Bucket="bucket", Prefix="pyramid/", PaginationConfig={"PageSize": 1000}
+    )
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools.storage.copy")
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_copy_s3_same_cluster(mocked_s3_client, mocked_copy):
+    s3_client = MagicMock()
+    s3_client.copy_object.return_value = {"CopyObjectResult": {"ETag": '"md5sum"'}}
+    mocked_s3_client.side_effect = [
+        ({"client": s3_client, "host": "cluster"}, "from_bucket"),
+        ({"client": s3_client, "host": "cluster"}, "to_bucket"),
+    ]
+
+    copy("s3://from_bucket/pyramid/DATA_6_1_1", "s3://to_bucket/pyramid/DATA_6_1_1", "md5sum")
+
+    s3_client.copy_object.assert_called_once_with(
+        Bucket="to_bucket",
+        Key="pyramid/DATA_6_1_1",
+        CopySource={"Bucket": "from_bucket", "Key": "pyramid/DATA_6_1_1"},
+    )
+    s3_client.head_object.assert_not_called()
+    mocked_copy.assert_not_called()
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_copy_s3_same_cluster_bad_md5(mocked_s3_client):
+    s3_client = MagicMock()
+    s3_client.copy_object.return_value = {"CopyObjectResult": {"ETag": '"other"'}}
+    mocked_s3_client.return_value = ({"client": s3_client, "host": "cluster"}, "bucket")
+
+    with pytest.raises(StorageError) as exc:
+        copy("s3://bucket/pyramid/DATA_6_1_1", "s3://bucket/copy/DATA_6_1_1", "md5sum")
+    assert "Invalid MD5 sum control" in str(exc.value)
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools.storage.copy")
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_copy_s3_other_cluster(mocked_s3_client, mocked_copy):
+    s3_client = MagicMock()
+    mocked_s3_client.side_effect = [
+        ({"client": s3_client, "host": "cluster1"}, "from_bucket"),
+        ({"client": s3_client, "host": "cluster2"}, "to_bucket"),
+    ]
+
+    copy("s3://from_bucket/DATA_6_1_1", "s3://to_bucket@cluster2/DATA_6_1_1", "md5sum")
+
+    s3_client.copy_object.assert_not_called()
+    mocked_copy.assert_called_once_with(
+        "s3://from_bucket/DATA_6_1_1", "s3://to_bucket@cluster2/DATA_6_1_1", "md5sum"
+    )
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools.storage.copy")
+def test_copy_file(mocked_copy):
+    copy("file:///from/DATA_6_1_1", "s3://to_bucket/DATA_6_1_1")
+    mocked_copy.assert_called_once_with(
+        "file:///from/DATA_6_1_1", "s3://to_bucket/DATA_6_1_1", None
+    )
+
+
+def test_create_exclusive_file(tmp_path):
+    path = f"file://{tmp_path}/chunk.1.lease.0"
+
+    assert create_exclusive(path, "first")
+    assert not create_exclusive(path, "second")
+
+    with open(os.path.join(tmp_path, "chunk.1.lease.0")) as f:
+        assert f.read() == "first"
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_create_exclusive_s3(mocked_s3_client):
+    s3_client = MagicMock()
+    s3_client.put_object.side_effect = [
+        None,
+        botocore.exceptions.ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject"),
+    ]
+    mocked_s3_client.return_value = ({"client": s3_client}, "bucket")
+
+    assert create_exclusive("s3://bucket/queue/chunk.1.lease.0", "first")
+    assert not create_exclusive("s3://bucket/queue/chunk.1.lease.0", "second")
+
+    s3_client.put_object.assert_called_with(
+        Bucket="bucket", Key="queue/chunk.1.lease.0", Body=b"second", IfNoneMatch="*"
+    )
+
+
+def test_stream_writer_file(tmp_path):
+    writer = StreamWriter(f"file://{tmp_path}/sub/list", part_size=4)
+    writer.write("0=root\n")
+    writer.write(b"0/DATA\n")
+    writer.close()
+
+    with open(os.path.join(tmp_path, "sub", "list")) as f:
+        assert f.read() == "0=root\n0/DATA\n"
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_stream_writer_s3(mocked_s3_client):
+    s3_client = MagicMock()
+    s3_client.create_multipart_upload.return_value = {"UploadId": "id"}
+    s3_client.upload_part.side_effect = [{"ETag": "etag1"}, {"ETag": "etag2"}]
+    mocked_s3_client.return_value = ({"client": s3_client}, "bucket")
+
+    writer = StreamWriter("s3://bucket/pyramid.list", part_size=10)
+    writer.write("0123456789")
+    writer.write("abc")
+    writer.close()
+
+    s3_client.upload_part.assert_has_calls(
+        [
+            call(
+                Bucket="bucket", Key="pyramid.list", UploadId="id", PartNumber=1, Body=b"0123456789"
+            ),
+            call(Bucket="bucket", Key="pyramid.list", UploadId="id", PartNumber=2, Body=b"abc"),
+        ]
+    )
+    s3_client.complete_multipart_upload.assert_called_once_with(
+        Bucket="bucket",
+        Key="pyramid.list",
+        UploadId="id",
+        MultipartUpload={
+            "Parts": [{"ETag": "etag1", "PartNumber": 1}, {"ETag": "etag2", "PartNumber": 2}]
+        },
+    )
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_stream_writer_s3_abort(mocked_s3_client):
+    s3_client = MagicMock()
+    s3_client.create_multipart_upload.return_value = {"UploadId": "id"}
+    mocked_s3_client.return_value = ({"client": s3_client}, "bucket")
+
+    writer = StreamWriter("s3://bucket/pyramid.list")
+    writer.write("data")
+    writer.abort()
+
+    s3_client.upload_part.assert_not_called()
+    s3_client.abort_multipart_upload.assert_called_once_with(
+        Bucket="bucket", Key="pyramid.list", UploadId="id"
+    )
+
+
+def test_get_version_file(tmp_path):
+    path = os.path.join(tmp_path, "file.list")
+    with open(path, "w") as f:
+        f.write("content")
+
+    version = get_version(f"file://{path}")
+    assert get_version(f"file://{path}") == version
+
+    with open(path, "w") as f:
+        f.write("new content")
+    assert get_version(f"file://{path}") != version
+
+    with pytest.raises(FileNotFoundError):
+        get_version(f"file://{tmp_path}/not_existing.list")
+
+
+@mock.patch("rok4_tools.global_utils.storage_tools._get_s3_client")
+def test_get_version_s3(mocked_s3_client):
+    s3_client = MagicMock()
+    s3_client.head_object.return_value = {"ETag": '"md5sum"', "ContentLength": 10}
+    mocked_s3_client.return_value = ({"client": s3_client}, "bucket")
+
+    assert get_version("s3://bucket/pyramid.list") == '"md5sum" 10'
+    s3_client.head_object.assert_called_once_with(Bucket="bucket", Key="pyramid.list")
+
+    s3_client.head_object.side_effect = botocore.exceptions.ClientError(
+        {"Error": {"Code": "404"}}, "HeadObject"
+    )
+    with pytest.raises(FileNotFoundError):
+        get_version("s3://bucket/pyramid.list")
@@ -0,0 +1,143 @@
+import gzip
+import os
+from unittest import mock
+
+import pytest
+
+from rok4_tools.global_utils.todo_list import *
+
+
+@pytest.mark.parametrize("compression", ["NONE", "GZIP"])
+def test_write_read(compression, tmp_path):
+    todo_list_obj, todo_list_tmp = create(compression)
+    todo_list_obj.write("cp s3://from/DATA_0 s3://to/DATA_0\n")
+    todo_list_obj.write("cp s3://from/DATA_1 s3://to/DATA_1 md5\n")
+    upload(todo_list_obj, todo_list_tmp, f"file://{tmp_path}/todo.1.list")
+
+    assert not os.path.exists(todo_list_tmp)
+    with open(os.path.join(tmp_path, "todo.1.list"), "rb") as f:
+        assert f.read(2) == b"\x1f\x8b" if compression == "GZIP" else b"cp"
+
+    todo_list_tmp = download(f"file://{tmp_path}/todo.1.list")
+    with open_local(todo_list_tmp) as f:
+        assert f.read() == (
+            "cp s3://from/DATA_0 s3://to/DATA_0\ncp s3://from/DATA_1 s3://to/DATA_1 md5\n"
+        )
+
+    # Les positions sont celles du contenu décompressé
+    with open_local(todo_list_tmp, binary=True) as f:
+        seek_forward(f, 35)
+        assert f.readline() == b"cp s3://from/DATA_1 s3://to/DATA_1 md5\n"
+
+    os.remove(todo_list_tmp)
+
+
+def test_read_gzip(tmp_path):
+    # Liste compressée hors de l'outil, reconnue par son nombre magique
+    path = os.path.join(tmp_path, "todo.1.list.gz")
+    with gzip.open(path, "wt") as f:
+        f.write("cp s3://from/DATA_0 s3://to/DATA_0\n")
+
+    with open_local(path) as f:
+        assert read_header(f) == ({}, 0)
+        assert f.read() == "cp s3://from/DATA_0 s3://to/DATA_0\n"
+
+
+def test_zstd(tmp_path):
+    pytest.importorskip("zstandard")
+
+    writer = TodoListWriter("ZSTD", indexed=True)
+    for i in range(3):
+        writer.write(
+            f"cp {writer.get_path('s3://from/pyr', f's3://from/pyr/DATA_{i}')} s3://to/DATA_{i}\n"
+        )
+    writer.upload(f"file://{tmp_path}/todo.1.list")
+
+    with open(os.path.join(tmp_path, "todo.1.list"), "rb") as f:
+        assert f.read(4) == b"\x28\xb5\x2f\xfd"
+
+    todo_list_tmp = download(f"file://{tmp_path}/todo.1.list")
+    with open_local(todo_list_tmp) as f:
+        assert read_header(f) == ({"0": "s3://from/pyr"}, len(f"{HEADER}\n0=s3://from/pyr\n#\n"))
+        assert f.readline() == "cp 0/DATA_0 s3://to/DATA_0\n"
+
+    # Flux non positionnable : on avance en lisant, jamais en arrière
+    with open_local(todo_list_tmp, binary=True) as f:
+        roots, offset = read_header(f)
+        seek_forward(f, offset + 2 * 27)
+        assert f.readline() == b"cp 0/DATA_2 s3://to/DATA_2\n"
+
+        with pytest.raises(Exception) as exc:
+            seek_forward(f, offset)
+        assert "Cannot move back" in str(exc.value)
+
+    os.remove(todo_list_tmp)
+
+
+@mock.patch("rok4_tools.global_utils.todo_list.ZSTD_AVAILABLE", False)
+def test_zstd_not_available(tmp_path):
+    with pytest.raises(NotImplementedError):
+        create("ZSTD")
+
+    path = os.path.join(tmp_path, "todo.1.list")
+    with open(path, "wb") as f:
+        f.write(b"\x28\xb5\x2f\xfd")
+
+    with pytest.raises(NotImplementedError) as exc:
+        open_local(path)
+    assert "zstandard package is not installed" in str(exc.value)
+
+
+@pytest.mark.parametrize("compression", ["NONE", "GZIP"])
+def test_writer_indexed(compression, tmp_path):
+    writer = TodoListWriter(compression, indexed=True)
+    writer.write(
+        f"cp {writer.get_path('s3://from/pyr', 's3://from/pyr/DATA_0')} {writer.get_path('s3://to/pyr', 's3://to/pyr/DATA_0')}\n"
+    )
+    # Chemin hors de la racine, laissé absolu
+    writer.write(f"cp {writer.get_path('s3://from/pyr', 's3://other/DATA_1')} s3://to/pyr/DATA_1\n")
+    writer.upload(f"file://{tmp_path}/todo.1.list")
+
+    todo_list_tmp = download(f"file://{tmp_path}/todo.1.list")
+    with open_local(todo_list_tmp, binary=True) as f:
+        roots, offset = read_header(f)
+        assert roots == {"0": "s3://from/pyr", "1": "s3://to/pyr"}
+        assert offset == len(f"{HEADER}\n0=s3://from/pyr\n1=s3://to/pyr\n#\n")
+
+        lines = f.read().decode().splitlines()
+        assert lines == ["cp 0/DATA_0 1/DATA_0", "cp s3://other/DATA_1 s3://to/pyr/DATA_1"]
+        assert [resolve(p, roots) for p in lines[0].split(" ")[1:]] == [
+            "s3://from/pyr/DATA_0",
+            "s3://to/pyr/DATA_0",
+        ]
+        assert resolve("s3://other/DATA_1", roots) == "s3://other/DATA_1"
+
+    os.remove(todo_list_tmp)
+
+
+@pytest.mark.parametrize("compression", ["NONE", "GZIP", "ZSTD"])
+@pytest.mark.parametrize("binary", [False, True])
+def test_read_header_without_header(compression, binary, tmp_path):
+    if compression == "ZSTD":
+        pytest.importorskip("zstandard")
+
+    todo_list_obj, todo_list_tmp = create(compression)
+    todo_list_obj.write("cp s3://from/DATA_0 s3://to/DATA_0\n")
+    upload(todo_list_obj, todo_list_tmp, f"file://{tmp_path}/todo.1.list")
+
+    # Première ligne lue après la détection de l'absence d'en-tête, sans revenir en arrière
+    with open_local(os.path.join(tmp_path, "todo.1.list"), binary=binary) as f:
+        assert read_header(f) == ({}, 0)
+        line = f.readline()
+    assert (line.decode() if binary else line) == "cp s3://from/DATA_0 s3://to/DATA_0\n"
+
+
+def test_read_header_invalid(tmp_path):
+    path = os.path.join(tmp_path, "todo.1.list")
+    with open(path, "w") as f:
+        f.write(f"{HEADER}\n0=s3://from/pyr\n")
+
+    with open_local(path) as f:
+        with pytest.raises(Exception) as exc:
+            read_header(f)
+    assert "no end of root table" in str(exc.value)
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from rok4_tools.global_utils.work_queue import *
+
+
+def write_lease(directory, chunk, generation, expires):
+    with open(os.path.join(directory, f"chunk.{chunk}.lease.{generation}"), "w") as f:
+        f.write(json.dumps({"owner": "other", "expires": expires}))
+
+
+def test_claim(tmp_path):
+    directory = f"file://{tmp_path}"
+    # Morceau 1 terminé, morceau 2 réservé par un autre agent
+    with open(os.path.join(tmp_path, "chunk.1.done"), "w") as f:
+        f.write("other")
+    write_lease(tmp_path, 2, 0, time.time() + 600)
+
+    lease, remaining = claim(directory, 3, "agent", 600)
+    assert lease.chunk == 3
+    assert lease.generation == 0
+    assert remaining == 2
+    assert os.path.exists(os.path.join(tmp_path, "chunk.3.lease.0"))
+
+    # Plus rien de libre
+    lease, remaining = claim(directory, 3, "agent2", 600)
+    assert lease is None
+    assert remaining == 2
+
+    assert get_state(directory) == ({1}, {2: 0, 3: 0})
+
+
+def test_take_over(tmp_path):
+    directory = f"file://{tmp_path}"
+    write_lease(tmp_path, 1, 0, time.time() - 1)
+
+    lease, remaining = claim(directory, 1, "agent", 600)
+    assert lease.chunk == 1
+    assert lease.generation == 1
+
+    # Le premier agent perd son bail au renouvellement
+    lost = Lease(directory, 1, "other", 600)
+    with mock.patch("rok4_tools.global_utils.work_queue.storage_tools.create_exclusive"):
+        assert lost.acquire()
+    with pytest.raises(LeaseLostError):
+        lost.renew(force=True)
+
+    # Le nouveau propriétaire le prolonge
+    lease.renew(force=True)
+    with open(os.path.join(tmp_path, "chunk.1.lease.1")) as f:
+        assert json.load(f)["owner"] == "agent"
+
+
+@mock.patch("rok4_tools.global_utils.work_queue.time.time")
+def test_renewed(mocked_time, tmp_path):
+    # Bail d'une minute, lectures dans une même fenêtre de 5 minutes du cache de lecture de rok4
+    directory = f"file://{tmp_path}"
+    lease = Lease(directory, 1, "agent", 60)
+    other = Lease(directory, 1, "other", 60)
+
+    mocked_time.return_value = 160
+    assert lease.acquire()
+
+    mocked_time.return_value = 170
+    assert not other.acquire(0)
+
+    # Bail renouvelé : la nouvelle expiration est relue, pas celle de la lecture précédente
+    mocked_time.return_value = 200
+    lease.renew(force=True)
+    mocked_time.return_value = 230
+    assert not other.acquire(0)
+    assert not os.path.exists(os.path.join(tmp_path, "chunk.1.lease.1"))
+
+
+def test_clean(tmp_path):
+    for name in [
+        "queue.json",
+        "chunk.1.list",
+        "chunk.1.lease.0",
+        "chunk.1.done",
+        "todo.finisher.list",
+    ]:
+        with open(os.path.join(tmp_path, name), "w") as f:
+            f.write("")
+
+    clean(f"file://{tmp_path}")
+    assert os.listdir(tmp_path) == ["todo.finisher.list"]
+
+    # Dossier absent : rien à nettoyer
+    clean(f"file://{tmp_path}/not_existing")